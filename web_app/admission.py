@@ -0,0 +1,182 @@
+"""Admission control that keeps bulk uploads from starving single predictions
+
+Each request is admitted through one of a few named pools with its own
+concurrency limit and wait queue. A request that finds the queue full, or
+waits longer than the pool's queue timeout, is answered straight away with
+503 and a Retry-After header instead of tying up a server thread.
+"""
+import json
+import os
+import stat
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+
+def init_bulk_worker(niceness):
+    """Process pool initializer for bulk work forked from a server process
+
+    Lowers the worker's CPU priority and closes the client connections it
+    inherited, which would otherwise stay open after the server closed its
+    side and leave clients waiting.
+    """
+    if niceness:
+        os.nice(niceness)
+
+    fd_dir = '/proc/self/fd'
+    if not os.path.isdir(fd_dir):
+        return
+    for name in os.listdir(fd_dir):
+        try:
+            fd = int(name)
+            if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                os.close(fd)
+        except (OSError, ValueError):
+            pass
+
+
+class AdmissionPool:
+    """Concurrency limit with a bounded, timed wait queue"""
+
+    def __init__(self, name, max_concurrent, max_queued=0, queue_timeout=0.0, retry_after=1):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0, 'draining': 0}
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Take a slot, waiting up to queue_timeout
+
+        Returns None once admitted, otherwise the rejection reason.
+        """
+        with self._condition:
+            # Waiting requests go first so a steady stream cannot overtake them
+            if self.active < self.max_concurrent and self.queued == 0:
+                self.active += 1
+                self.admitted += 1
+                return None
+
+            if self.queued >= self.max_queued:
+                self.rejected['queue_full'] += 1
+                return 'queue_full'
+
+            self.queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected['timeout'] += 1
+                        return 'timeout'
+                    self._condition.wait(remaining)
+            finally:
+                self.queued -= 1
+
+            self.active += 1
+            self.admitted += 1
+            return None
+
+    def reject(self, reason):
+        """Count a request turned away without trying the pool"""
+        with self._condition:
+            self.rejected[reason] += 1
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def idle(self):
+        with self._condition:
+            return self.active == 0 and self.queued == 0
+
+    def stats(self):
+        with self._condition:
+            return {
+                'active': self.active,
+                'queued': self.queued,
+                'max_concurrent': self.max_concurrent,
+                'max_queued': self.max_queued,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected)
+            }
+
+
+class AdmissionController:
+    """WSGI middleware that runs every request through an admission pool
+
+    classify(environ) returns the name of the pool for a request, or None
+    for requests that are never queued, such as health checks. A pool slot
+    is held until the response has been sent, so streamed responses count
+    for their whole duration.
+    """
+
+    def __init__(self, wsgi_app, pools, classify):
+        self.wsgi_app = wsgi_app
+        self.pools = {pool.name: pool for pool in pools}
+        self.classify = classify
+        self.draining = False
+
+    def __call__(self, environ, start_response):
+        pool_name = self.classify(environ)
+        if pool_name is None:
+            return self.wsgi_app(environ, start_response)
+
+        pool = self.pools[pool_name]
+        if self.draining:
+            pool.reject('draining')
+            return self._reject(start_response, pool, 'Server is shutting down')
+
+        reason = pool.acquire()
+        if reason is not None:
+            message = 'queue is full' if reason == 'queue_full' else 'timed out waiting in the queue'
+            return self._reject(start_response, pool, f"Server busy: {pool.name} request {message}")
+
+        try:
+            response = self.wsgi_app(environ, start_response)
+        except BaseException:
+            pool.release()
+            raise
+        return ClosingIterator(response, pool.release)
+
+    def _reject(self, start_response, pool, message):
+        body = json.dumps({'error': message, 'retry_after': pool.retry_after}).encode('utf-8')
+        headers = [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Retry-After', str(pool.retry_after))
+        ]
+        if self.draining:
+            headers.append(('Connection', 'close'))
+        start_response('503 Service Unavailable', headers)
+        return [body]
+
+    def start_draining(self):
+        """Answer new requests with 503 while admitted ones finish"""
+        self.draining = True
+
+    def drain(self, timeout=None):
+        """Stop admitting requests and wait for admitted ones to finish
+
+        Returns True if every pool emptied before the timeout.
+        """
+        self.start_draining()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not all(pool.idle() for pool in self.pools.values()):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self):
+        return {
+            'draining': self.draining,
+            'pools': {name: pool.stats() for name, pool in self.pools.items()}
+        }
@@ -0,0 +1,110 @@
+"""Per-group emotion statistics computed while a CSV is scored
+
+Rows are grouped by the values of one or more input columns, such as
+subject_id and session. Each scored chunk is reduced with a single
+groupby to per-group sums that are added to running totals, so the
+statistics cost one pass over the probability arrays and memory grows with
+the number of groups rather than the number of rows.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from outputs import OUTPUT_FORMATS
+
+# Result columns whose per-group means are reported
+MEAN_COLUMNS = ['confidence', 'prob_negative', 'prob_neutral', 'prob_positive']
+
+
+def aggregate_path(output_path):
+    """Return the grouped statistics file written next to a result file
+
+    The name keeps the whole result filename apart from its format
+    extension, so it stays unique and matches the result sweeper's pattern.
+    """
+    # Longest first, so '.csv.gz' is stripped whole rather than as '.gz'
+    for extension in sorted((extension for extension, _ in OUTPUT_FORMATS.values()), key=len, reverse=True):
+        if output_path.endswith(extension):
+            output_path = output_path[:-len(extension)]
+            break
+    return f"{output_path}_groups.csv"
+
+
+def parse_group_by(value):
+    """Split a comma-separated list of column names, returning None when empty"""
+    if isinstance(value, str):
+        value = value.split(',')
+    names = [name.strip() for name in value or [] if name.strip()]
+    return names or None
+
+
+class GroupAggregator:
+    """Running per-group emotion counts, mean probabilities and confidence
+
+    emotions lists the emotion names of the model's classes. add() takes the
+    group key columns and the result columns of one chunk; failed rows are
+    counted per group but left out of the counts and means.
+    """
+
+    def __init__(self, group_by, emotions):
+        self.group_by = list(group_by)
+        self.emotions = list(emotions)
+        self.totals = None
+
+    def add(self, keys, results):
+        """Add one chunk given its key columns in group_by order and its result columns"""
+        scored = pd.isnull(results['processing_error'])
+        columns = dict(zip(self.group_by, keys))
+        columns['rows'] = np.ones(len(scored), dtype=np.int64)
+        columns['successful_predictions'] = scored.astype(np.int64)
+
+        emotion = np.asarray(results['emotion'], dtype=object)
+        for name in self.emotions:
+            columns[name.lower()] = ((emotion == name) & scored).astype(np.int64)
+        for name in MEAN_COLUMNS:
+            columns[name] = np.where(scored, results[name], 0.0)
+
+        partial = pd.DataFrame(columns).groupby(self.group_by, sort=False, dropna=False).sum()
+        self.totals = partial if self.totals is None else self.totals.add(partial, fill_value=0)
+
+    def table(self):
+        """Return the statistics as a DataFrame with one row per group, sorted by key"""
+        count_columns = [name.lower() for name in self.emotions]
+        if self.totals is None:
+            columns = self.group_by + ['rows', 'successful_predictions', 'errors'] + count_columns
+            columns += [f"{name}_pct" for name in count_columns]
+            columns += [f"mean_{name}" for name in MEAN_COLUMNS] + ['dominant_emotion']
+            return pd.DataFrame(columns=columns)
+
+        totals = self.totals.sort_index()
+        table = totals[['rows', 'successful_predictions']].astype(np.int64)
+        table['errors'] = table['rows'] - table['successful_predictions']
+
+        counts = totals[count_columns].to_numpy(dtype=np.int64)
+        scored = table['successful_predictions'].to_numpy()
+        # Groups without a scored row get empty statistics
+        divisor = np.where(scored > 0, scored, np.nan)[:, np.newaxis]
+        table[count_columns] = counts
+        table[[f"{name}_pct" for name in count_columns]] = np.round(counts / divisor * 100, 2)
+
+        means = totals[MEAN_COLUMNS].to_numpy(dtype=np.float64) / divisor
+        table[[f"mean_{name}" for name in MEAN_COLUMNS]] = np.round(means, 2)
+
+        dominant = np.array(self.emotions, dtype=object)[counts.argmax(axis=1)]
+        table['dominant_emotion'] = np.where(scored > 0, dominant, None)
+
+        return table.reset_index()
+
+    def records(self, table=None):
+        """Return the statistics as JSON-ready dicts"""
+        table = self.table() if table is None else table
+        table = table.astype(object).where(table.notna(), None)
+        return table.to_dict(orient='records')
+
+
+def write_aggregates(records, columns, path):
+    """Write grouped statistics as CSV, via a temporary file so readers never see a partial one"""
+    part_path = f"{path}.part"
+    pd.DataFrame(records, columns=columns).to_csv(part_path, index=False, lineterminator='\n')
+    os.replace(part_path, path)
@@ -1,69 +1,255 @@
 import os
-from flask import Flask, request, render_template, send_file, jsonify
+import cProfile
+import random
+import threading
+import time
+import uuid
+import json
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Response, request, render_template, send_file, jsonify, g, has_request_context, stream_with_context
 import joblib
 import numpy as np
-import pandas as pd
 import logging
 from datetime import datetime
 import io
 import csv
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from werkzeug.utils import secure_filename
+from admission import AdmissionController, AdmissionPool, init_bulk_worker
+from aggregates import GroupAggregator, aggregate_path, parse_group_by, write_aggregates
+from batching import PredictionBatcher
+from compiled_forest import load_compiled_model, load_or_compile
+from csv_ingest import (FEATURE_DTYPES, CsvLayout, align_records, parse_features, read_key_columns,
+                        read_record_chunks, read_text_frame, split_records)
+from eeg_features import load_feature_extractor
+from jobs import COMPLETED, JobManager, QueueFullError
+from metrics import MetricsRegistry
+from model_metadata import LEGACY_FEATURES, read_model_metadata, variant_path
+from model_registry import ModelLoadError, ModelRegistry, ModelVersion
+from outputs import OUTPUT_FORMATS, OutputSweeper, available_formats, open_result_writer, output_extension, output_mimetype
+from payloads import (JSON_CONTENT_TYPE, NPY_CONTENT_TYPE, RAW_CONTENT_TYPE, PayloadError,
+                      encode_npy, encode_results, parse_json_payload, parse_json_windows, parse_npy,
+                      parse_npy_windows, parse_raw_buffer, parse_raw_windows)
+from prediction_cache import PredictionCache, dedupe_rows, file_fingerprint
+from result_store import ResultStore, hash_stream, make_key
+from streaming import SessionManager
 
 # Flask app setup
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 60 * 1024 * 1024  # 60MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 60 * 1024 * 1024  # 60MB max request body, JSON and binary bodies are read into memory
+app.config['UPLOAD_MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 1GB max CSV upload to /upload_csv and /jobs, uploads are streamed
+app.config['USE_COMPILED_MODEL'] = True  # Serve small batches from the compiled forest
+app.config['MODEL_MMAP'] = True  # Memory-map model arrays so worker processes share them
+app.config['MODEL_WARMUP'] = True  # Run synthetic predictions after loading the model
+app.config['MODEL_VARIANT'] = ''  # Variant written by compact_model.py, e.g. 'trees50-float32', '' serves brain_signals.pkl
+app.config['MODEL_RELOAD_INTERVAL'] = 5.0  # Seconds between checks of the model file for a new version, 0 disables hot reload
+app.config['BATCH_REQUESTS'] = True  # Coalesce concurrent single predictions
+app.config['BATCH_MAX_SIZE'] = 32  # Most rows scored together by the coalescer
+app.config['BATCH_MAX_WAIT_MS'] = 2.0  # Longest a request waits for others to join
+app.config['PREDICTION_CACHE_SIZE'] = 10000  # Cached single predictions, 0 disables the cache
+app.config['PREDICTION_CACHE_TTL'] = 3600  # Seconds before a cached prediction expires, 0 never
+app.config['PREDICTION_CACHE_POLICY'] = 'lru'  # Eviction order when full: 'lru' or 'fifo'
+app.config['CSV_FEATURE_DTYPE'] = 'float64'  # Parse CSV features as 'float64' or the lighter 'float32'
+app.config['OUTPUT_FORMAT'] = 'csv'  # Default result format: 'csv', 'csv.gz', 'parquet' or 'feather'
+app.config['OUTPUT_RESULTS_ONLY'] = False  # Leave the input columns out of result files by default
+app.config['GROUP_BY'] = ''  # Columns to aggregate CSV results by unless a request says otherwise, e.g. 'subject_id,session'
+app.config['GROUP_SUMMARY_MAX_GROUPS'] = 1000  # Groups listed in the JSON summary, the groups file has all of them
+app.config['OUTPUT_TTL'] = 86400  # Seconds before a result file is deleted, 0 keeps them
+app.config['OUTPUT_MAX_MB'] = 2048  # Total size of kept result files, oldest go first, 0 no limit
+app.config['OUTPUT_SWEEP_INTERVAL'] = 300  # Seconds between result file sweeps
+app.config['RESULT_STORE_MB'] = 1024  # Stored CSV results reused for repeated uploads, 0 disables the store
+app.config['RESULT_STORE_DIR'] = os.path.join(os.getcwd(), 'temp', 'results')
+app.config['JOB_WORKERS'] = 2  # Worker processes for background CSV jobs
+app.config['JOB_QUEUE_SIZE'] = 8  # Jobs allowed to wait for a worker
+app.config['JOB_STATE_DIR'] = os.path.join(os.getcwd(), 'temp', 'jobs')
+app.config['ADMISSION_CONTROL'] = True  # Admit requests through separate interactive and bulk pools
+app.config['INTERACTIVE_MAX_CONCURRENT'] = 8  # Interactive requests handled at once per worker process
+app.config['INTERACTIVE_MAX_QUEUED'] = 64  # Interactive requests allowed to wait for a slot
+app.config['INTERACTIVE_QUEUE_TIMEOUT'] = 2.0  # Seconds an interactive request waits before a 503
+app.config['INTERACTIVE_RETRY_AFTER'] = 1  # Retry-After seconds sent with interactive 503s
+app.config['BULK_MAX_CONCURRENT'] = 2  # CSV uploads, job submissions and large bodies handled at once
+app.config['BULK_MAX_QUEUED'] = 2  # Bulk requests allowed to wait for a slot
+app.config['BULK_QUEUE_TIMEOUT'] = 30.0  # Seconds a bulk request waits before a 503
+app.config['BULK_RETRY_AFTER'] = 10  # Retry-After seconds sent with bulk 503s
+app.config['BULK_MIN_BYTES'] = 1024 * 1024  # Request bodies at least this large count as bulk
+app.config['BULK_PROCESSES'] = 2  # Niced worker processes that score /upload_csv files, 0 scores in the request thread
+app.config['BULK_NICE'] = 19  # Niceness added to upload and job worker processes so interactive requests get the CPU first
+app.config['STREAM_WINDOW'] = 32  # Frames in each streaming session's rolling average
+app.config['STREAM_IDLE_TIMEOUT'] = 300  # Seconds before an idle streaming session is dropped
+app.config['STREAM_MAX_SESSIONS'] = 1000  # Streaming sessions kept per worker process
+app.config['SERVER_WORKERS'] = 1  # Server processes answering requests, set by gunicorn.conf.py; streaming needs 1
+app.config['METRICS_DIR'] = ''  # Directory where server processes share their metrics, '' keeps them per process
+app.config['METRICS_FLUSH_INTERVAL'] = 5.0  # Seconds between writes of a process's metrics to METRICS_DIR
+app.config['PROFILE_SAMPLE_RATE'] = 0.0  # Fraction of requests profiled with cProfile
+app.config['PROFILE_DIR'] = os.path.join(os.getcwd(), 'temp', 'profiles')
+
+# Override settings from FLASK_* environment variables
+app.config.from_prefixed_env()
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Global model variable
-model = None
-
-# ACTUAL FEATURE NAMES from your dataset
-EXPECTED_FEATURES = [
-    'min_q_2_a', 'min_q_17_b', 'min_2_b', 'min_q_7_a', 'min_q_7_b', 
-    'min_2_a', 'min_q_12_b', 'mean_2_b', 'mean_d_7_b', 'min_q_12_a', 
-    'min_q_5_b', 'covmat_104_b', 'min_q_17_a', 'min_q_10_b', 'min_q_2_b', 
-    'mean_d_12_a', 'mean_d_12_b', 'mean_d_15_b', 'min_q_5_a', 'mean_d_5_a', 
-    'mean_2_a', 'covmat_97_b', 'covmat_20_b', 'mean_d_18_a', 'mean_0_a', 
-    'mean_3_a', 'min_q_15_b', 'mean_d_7_a', 'logm_9_a', 'mean_d_2_a2', 
-    'covmat_104_a', 'covmat_96_b', 'stddev_2_a', 'stddev_2_b', 'min_q_15_a', 
-    'mean_d_8_b', 'covmat_8_a', 'covmat_1_a', 'mean_0_b', 'covmat_20_a', 
-    'mean_3_b', 'covmat_8_b', 'mean_d_2_b2', 'stddev_0_a', 'mean_d_17_a'
-]
+# Metrics served from /metrics, summed over all processes when METRICS_DIR is set
+metrics_registry = MetricsRegistry(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+stage_seconds = metrics_registry.histogram(
+    'emotion_stage_duration_seconds', 'Time spent in each processing stage', ['stage'])
+request_seconds = metrics_registry.histogram(
+    'emotion_request_duration_seconds', 'HTTP request latency', ['endpoint', 'status'])
+rows_scored = metrics_registry.counter(
+    'emotion_rows_scored_total', 'Rows scored by the model', ['source'])
+prediction_errors = metrics_registry.counter(
+    'emotion_errors_total', 'Rejected or failed predictions by type', ['type'])
+request_bytes = metrics_registry.counter(
+    'emotion_request_bytes_total', 'Request body bytes received', ['endpoint'])
+response_bytes = metrics_registry.counter(
+    'emotion_response_bytes_total', 'Response body bytes sent', ['endpoint'])
+
+# Rows scored per predict_proba call in batch processing
+BATCH_CHUNK_SIZE = 10000
+
+# Rows read from an uploaded CSV stream at a time
+STREAM_CHUNK_ROWS = 10000
+
+# Text read per chunk at most, so wide files use fewer rows per chunk
+STREAM_CHUNK_CHARS = 4 * 1024 * 1024
+
+# Columns appended to every scored CSV row and their types in columnar output
+RESULT_COLUMNS = {
+    'prediction': 'int64',
+    'emotion': 'string',
+    'confidence': 'float64',
+    'prob_negative': 'float64',
+    'prob_neutral': 'float64',
+    'prob_positive': 'float64',
+    'processing_error': 'string',
+    'missing_features_count': 'int64',
+    'processed_at': 'string'
+}
+
+# Routes that stream CSV uploads and accept UPLOAD_MAX_CONTENT_LENGTH bodies
+UPLOAD_ENDPOINTS = ('upload_csv', 'submit_job')
+
+# Routes that read the process-local streaming sessions
+STREAM_ENDPOINTS = ('open_stream_session', 'stream_session', 'push_stream_frames', 'stream_session_events')
+
+# Largest batch served by the compiled forest; sklearn is faster above this
+COMPILED_MAX_ROWS = 128
+
+# Labels map_prediction_to_emotion and the result columns expect, in order
+MODEL_CLASSES = [0, 1, 2]
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Model file served by the app; train.py and compact_model.py write its metadata next to it
+MODEL_PATH = variant_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'brain_signals.pkl'),
+                          app.config['MODEL_VARIANT'])
+
+def load_model_metadata(model_path):
+    """Read the feature list and serving settings stored with the model"""
+    try:
+        return read_model_metadata(model_path)
+    except (FileNotFoundError, ValueError) as e:
+        # Models saved before metadata files existed were trained on LEGACY_FEATURES
+        logger.warning("Model metadata for %s not readable (%s); assuming the legacy feature list", model_path, str(e))
+        return {}
+
+MODEL_METADATA = load_model_metadata(MODEL_PATH)
+
+# Feature names in the order the model expects them
+EXPECTED_FEATURES = MODEL_METADATA.get('features', LEGACY_FEATURES)
+
+# Computes EXPECTED_FEATURES from raw EEG windows
+feature_extractor = load_feature_extractor(EXPECTED_FEATURES)
+
+def load_model_version(model_path):
+    """Load, check and warm up a model file, raising ModelLoadError if it cannot be served"""
+    # Uncompressed joblib pickles keep their numpy arrays mmap-able
+    mmap_mode = 'r' if app.config['MODEL_MMAP'] else None
+    estimator = joblib.load(model_path, mmap_mode=mmap_mode)
+    logger.info("Model loaded from: %s", model_path)
+    
+    # Cached predictions and stored results are only valid for this exact model file
+    fingerprint = file_fingerprint(model_path)
+    metadata = load_model_metadata(model_path)
+    logger.info("Model fingerprint: %s", fingerprint)
+    logger.info("Model type: %s", type(estimator).__name__)
+    logger.info("Model classes: %s", getattr(estimator, 'classes_', 'Not available'))
+    
+    # Inputs are parsed and validated against the feature list read at startup
+    n_features = getattr(estimator, 'n_features_in_', None)
+    if n_features is not None and n_features != len(EXPECTED_FEATURES):
+        raise ModelLoadError(f"Model takes {n_features} features but the app serves {len(EXPECTED_FEATURES)}")
+    if metadata.get('features', EXPECTED_FEATURES) != EXPECTED_FEATURES:
+        raise ModelLoadError("Model metadata lists different features; restart the server to serve them")
+    # Models fitted on a DataFrame know their feature names
+    feature_names = getattr(estimator, 'feature_names_in_', None)
+    if feature_names is not None and list(feature_names) != EXPECTED_FEATURES:
+        raise ModelLoadError("Model was fitted on different feature names than the app serves")
+    classes = [int(c) for c in getattr(estimator, 'classes_', [])]
+    if classes != MODEL_CLASSES:
+        raise ModelLoadError(f"Model classes {classes} differ from {MODEL_CLASSES}")
+    
+    # Compile the forest for low-latency single predictions
+    compiled = None
+    if app.config['USE_COMPILED_MODEL']:
+        # Compacted variants may be served with float32 thresholds
+        threshold_dtype = metadata.get('compiled_threshold_dtype', 'float64')
+        if app.config['MODEL_MMAP']:
+            artifact_dir = os.path.splitext(model_path)[0] + '.compiled'
+            compiled = load_or_compile(estimator, artifact_dir, fingerprint, threshold_dtype)
+        else:
+            compiled = load_compiled_model(estimator, threshold_dtype)
+    
+    version = ModelVersion(estimator, compiled, model_path, fingerprint, metadata)
+    if app.config['MODEL_WARMUP']:
+        warm_up_model(version)
+    
+    return version
 
 def load_model():
     """Load the brain emotion detection model"""
-    global model
-    
-    model_path = os.path.join(os.path.dirname(__file__), 'brain_signals.pkl')
+    model_path = MODEL_PATH
+    if not os.path.exists(model_path):
+        # Try current directory
+        model_path = 'brain_signals.pkl'
     
     try:
-        if os.path.exists(model_path):
-            model = joblib.load(model_path)
-            logger.info("Model loaded successfully from: %s", model_path)
-        else:
-            # Try current directory
-            model = joblib.load('brain_signals.pkl')
-            logger.info("Model loaded from current directory")
-        
-        # Log model information
-        logger.info("Model type: %s", type(model).__name__)
-        logger.info("Model classes: %s", getattr(model, 'classes_', 'Not available'))
-        
-        if hasattr(model, 'n_features_in_'):
-            logger.info("Expected features: %d", model.n_features_in_)
-        
+        model_registry.load(model_path)
         return True
         
     except FileNotFoundError:
-        logger.error("Model file 'brain_signals.pkl' not found")
+        logger.error("Model file '%s' not found", os.path.basename(MODEL_PATH))
         return False
     except Exception as e:
         logger.error("Error loading model: %s", str(e))
         return False
 
+def served_model():
+    """Return the model version of the current request, or the latest one outside requests
+    
+    A request keeps the version it first used, so a reload never changes
+    the model halfway through it.
+    """
+    if not has_request_context():
+        return model_registry.current
+    if 'model_version' not in g:
+        g.model_version = model_registry.current
+    return g.model_version
+
+def warm_up_model(version):
+    """Run synthetic predictions through every inference path"""
+    start = datetime.now()
+    rng = np.random.default_rng(0)
+    
+    # One batch per path: compiled single row and small batch, sklearn large batch
+    for n_rows in (1, COMPILED_MAX_ROWS, 2 * COMPILED_MAX_ROWS):
+        version.estimator.predict_proba(rng.normal(size=(n_rows, len(EXPECTED_FEATURES))))
+        if version.compiled is not None and n_rows <= COMPILED_MAX_ROWS:
+            version.compiled.predict_proba(rng.normal(size=(n_rows, len(EXPECTED_FEATURES))))
+    
+    logger.info("Model warm-up finished in %.3fs", (datetime.now() - start).total_seconds())
+
 def validate_features(features):
     """Validate input features"""
     try:
@@ -75,14 +261,94 @@ def validate_features(features):
             return False, "Features contain invalid values (NaN or Inf)"
         
         # Check feature count
-        if len(feature_array) != 45:
-            return False, f"Expected 45 features, got {len(feature_array)}"
+        if len(feature_array) != len(EXPECTED_FEATURES):
+            return False, f"Expected {len(EXPECTED_FEATURES)} features, got {len(feature_array)}"
         
         return True, feature_array
         
     except (ValueError, TypeError) as e:
         return False, f"Invalid feature format: {str(e)}"
 
+def predict_proba(features, version=None):
+    """Return class probabilities, using the compiled forest for small batches"""
+    version = version or served_model()
+    
+    # Score each distinct row once
+    deduped = dedupe_rows(features)
+    if deduped is not None:
+        unique_rows, inverse = deduped
+        return predict_proba(unique_rows, version)[inverse]
+    
+    with stage_seconds.time(stage='inference'):
+        if version.compiled is not None and len(features) <= COMPILED_MAX_ROWS:
+            return version.compiled.predict_proba(features)
+        return version.estimator.predict_proba(features)
+
+# Memoized probabilities for repeated single-row requests
+prediction_cache = PredictionCache(
+    max_size=app.config['PREDICTION_CACHE_SIZE'],
+    ttl_seconds=app.config['PREDICTION_CACHE_TTL'],
+    policy=app.config['PREDICTION_CACHE_POLICY']
+)
+
+# Concurrent single-row requests share predict_proba calls
+prediction_batcher = PredictionBatcher(
+    predict_proba,
+    max_batch_size=app.config['BATCH_MAX_SIZE'],
+    max_wait_ms=app.config['BATCH_MAX_WAIT_MS']
+)
+
+stream_sessions = SessionManager(
+    window=app.config['STREAM_WINDOW'],
+    idle_timeout=app.config['STREAM_IDLE_TIMEOUT'],
+    max_sessions=app.config['STREAM_MAX_SESSIONS']
+)
+
+# Sessions live in one process's memory, so a session's frames and event
+# listeners could land on different workers
+STREAMING_ENABLED = app.config['SERVER_WORKERS'] == 1
+if not STREAMING_ENABLED:
+    logger.warning("Streaming sessions are disabled with %s server workers; run a single worker to use /stream",
+                   app.config['SERVER_WORKERS'])
+
+# Scored CSV results and chunks, shared by every process on this machine
+result_store = ResultStore(
+    app.config['RESULT_STORE_DIR'],
+    max_bytes=app.config['RESULT_STORE_MB'] * 1024 * 1024
+)
+
+def on_model_swap(version, previous):
+    """Let work after a reload use the new model"""
+    prediction_cache.clear()
+    # Worker processes keep the model they were forked with; submitted work
+    # finishes there and new work goes to processes forked from now on
+    reset_bulk_executor()
+    job_manager.recycle_workers()
+    logger.info("Model %s replaced %s", version.version, previous.version)
+
+# The served model version, swapped as a whole when the model file changes
+model_registry = ModelRegistry(
+    load_model_version,
+    poll_interval=app.config['MODEL_RELOAD_INTERVAL'],
+    on_swap=on_model_swap
+)
+
+def predict_single(feature_array):
+    """Return class probabilities for one validated feature vector"""
+    version = served_model()
+    cache_key = PredictionCache.make_key(version.fingerprint, feature_array)
+    probabilities = prediction_cache.get(cache_key)
+    if probabilities is not None:
+        return probabilities
+    
+    if app.config['BATCH_REQUESTS']:
+        probabilities = prediction_batcher.predict_proba(feature_array, context=version)
+    else:
+        probabilities = predict_proba(feature_array[np.newaxis, :], version)[0]
+    
+    prediction_cache.put(cache_key, probabilities)
+    return probabilities
+
 def map_prediction_to_emotion(prediction):
     """Map model prediction to emotion name"""
     try:
@@ -99,133 +365,314 @@ def map_prediction_to_emotion(prediction):
         logger.error("Error mapping prediction %s: %s", prediction, str(e))
         return f"UNKNOWN_{prediction}"
 
-def extract_features_from_row(row_data, available_columns):
-    """Extract the 45 required features from a CSV row"""
-    features = []
-    missing_features = []
-    
-    for feature_name in EXPECTED_FEATURES:
-        if feature_name in available_columns:
-            try:
-                value = float(row_data[feature_name])
-                features.append(value)
-            except (ValueError, TypeError):
-                features.append(0.0)
-                missing_features.append(f"{feature_name} (invalid value)")
-        else:
-            features.append(0.0)
-            missing_features.append(f"{feature_name} (not found)")
+def score_feature_matrix(features, missing_counts, row_offset=0):
+    """Validate and score a feature matrix, returning the result columns and errors"""
+    n_rows = len(features)
+    version = served_model()
+    classes = np.asarray(version.classes_)
+    class_emotions = np.array([map_prediction_to_emotion(c) for c in classes], dtype=object)
+    
+    # Result columns default to the error state and are overwritten for scored rows
+    prediction = np.full(n_rows, 'ERROR', dtype=object)
+    emotion = np.full(n_rows, 'ERROR', dtype=object)
+    probabilities = np.zeros((n_rows, len(classes)), dtype=float)
+    error = np.full(n_rows, None, dtype=object)
+    missing_count = missing_counts.astype(int, copy=True)
+    scored = np.zeros(n_rows, dtype=bool)
+    
+    # Rows with NaN or Inf values fail validation
+    with stage_seconds.time(stage='validation'):
+        invalid = ~np.isfinite(features).all(axis=1)
+        for i in np.flatnonzero(invalid):
+            error_msg = "Features contain invalid values (NaN or Inf)"
+            if missing_counts[i]:
+                error_msg += f" | Missing: {missing_counts[i]} features"
+            error[i] = error_msg
+    
+    # Score valid rows with one predict_proba call per chunk
+    valid_rows = np.flatnonzero(~invalid)
+    for start in range(0, len(valid_rows), BATCH_CHUNK_SIZE):
+        chunk_rows = valid_rows[start:start + BATCH_CHUNK_SIZE]
+        try:
+            probabilities[chunk_rows] = predict_proba(features[chunk_rows], version)
+            scored[chunk_rows] = True
+        except Exception:
+            # Fall back to single rows so the failing rows can be reported
+            for i in chunk_rows:
+                try:
+                    probabilities[i] = predict_proba(features[i:i + 1], version)[0]
+                    scored[i] = True
+                except Exception as e:
+                    error[i] = f"Processing error: {str(e)}"
+                    missing_count[i] = 0
+                    prediction_errors.inc(type='processing')
+    
+    result_start = time.perf_counter()
+    best = np.argmax(probabilities[scored], axis=1)
+    prediction[scored] = classes[best].astype(int)
+    emotion[scored] = class_emotions[best]
     
-    return features, missing_features
+    confidence = np.where(scored, np.round(probabilities.max(axis=1) * 100, 2), 0.0)
+    probabilities = np.round(probabilities * 100, 2)
+    
+    # Keep the numeric dtype when no row failed
+    if scored.all():
+        prediction = prediction.astype(int)
+    
+    results = {
+        'prediction': prediction,
+        'emotion': emotion,
+        'confidence': confidence,
+        'prob_negative': probabilities[:, 0],
+        'prob_neutral': probabilities[:, 1],
+        'prob_positive': probabilities[:, 2],
+        'processing_error': error,
+        'missing_features_count': missing_count
+    }
+    
+    errors = [f"Row {row_offset + i + 1}: {error[i]}" for i in np.flatnonzero(~scored)]
+    
+    stage_seconds.observe(time.perf_counter() - result_start, stage='result_assembly')
+    rows_scored.inc(int(scored.sum()), source='csv')
+    prediction_errors.inc(int(invalid.sum()), type='validation')
+    
+    return results, errors
 
-def process_csv_data(csv_content):
-    """Process CSV file and return predictions"""
+def summarize_feature_coverage(columns):
+    """Summarize how many of the required features a CSV header provides"""
+    available_features = [col for col in EXPECTED_FEATURES if col in columns]
+    
+    return {
+        'total_required_features': len(EXPECTED_FEATURES),
+        'available_features': len(available_features),
+        'missing_features': len(EXPECTED_FEATURES) - len(available_features),
+        'feature_coverage': round((len(available_features) / len(EXPECTED_FEATURES)) * 100, 1)
+    }
+
+def score_csv_records(records, layout, processed_at, row_offset=0, aggregator=None):
+    """Score raw CSV records, returning the aligned records, result columns and errors
+    
+    An aggregator, if given, gets the rows' group keys, parsed along with the
+    features, and their results.
+    """
+    key_names = aggregator.group_by if aggregator is not None else ()
+    with stage_seconds.time(stage='feature_extraction'):
+        records = align_records(records, layout.n_columns, row_offset + 2)
+        dtype = FEATURE_DTYPES[app.config['CSV_FEATURE_DTYPE']]
+        features, missing_counts, keys = parse_features(records, layout, dtype, key_names=key_names)
+    results, errors = score_feature_matrix(features, missing_counts, row_offset)
+    results['processed_at'] = processed_at
+    
+    if aggregator is not None:
+        with stage_seconds.time(stage='aggregation'):
+            aggregator.add(keys, results)
+    
+    return records, results, errors
+
+def make_group_aggregator(group_by, layout, version):
+    """Return a GroupAggregator for the model's emotions, or an error if a column is missing"""
+    missing = [name for name in group_by if name not in layout.positions]
+    if missing:
+        return None, f"Group columns not found in CSV: {', '.join(missing)}"
+    
+    emotions = [map_prediction_to_emotion(c) for c in version.classes_]
+    return GroupAggregator(group_by, emotions), None
+
+def process_csv_data(csv_content, group_by=None):
+    """Score CSV text held in memory, parsing only the feature columns as numbers
+    
+    Returns (results, errors, feature_summary, groups). results is a
+    DataFrame of the input columns, kept as their original strings, followed
+    by the result columns; groups holds the per-group emotion statistics for
+    group_by column names, otherwise None. When the CSV cannot be scored,
+    results is None and errors is the message.
+    """
     try:
-        # Read CSV
-        df = pd.read_csv(io.StringIO(csv_content))
+        # Read the header first so only the feature columns are parsed as numbers
+        header_line, _, body = csv_content.partition('\n')
+        layout = CsvLayout(header_line, EXPECTED_FEATURES)
         
-        logger.info(f"CSV loaded with {len(df)} rows and {len(df.columns)} columns")
-        logger.info(f"Available columns: {list(df.columns)}")
+        logger.info(f"CSV opened with {layout.n_columns} columns")
+        logger.debug(f"Available columns: {layout.columns}")
         
         # Check which of our required features are available
-        available_features = [col for col in EXPECTED_FEATURES if col in df.columns]
-        missing_features = [col for col in EXPECTED_FEATURES if col not in df.columns]
-        
-        logger.info(f"Found {len(available_features)} out of {len(EXPECTED_FEATURES)} required features")
-        
-        if len(available_features) == 0:
-            return None, f"No required features found in CSV. Expected features: {', '.join(EXPECTED_FEATURES[:10])}..."
-        
-        # Process each row
-        results = []
-        errors = []
-        
-        for idx, (_, row) in enumerate(df.iterrows()):
-            try:
-                # Extract features
-                features, row_missing = extract_features_from_row(row, df.columns)
-                
-                # Validate
-                is_valid, validation_result = validate_features(features)
-                if not is_valid:
-                    error_msg = f"{validation_result}"
-                    if row_missing:
-                        error_msg += f" | Missing: {len(row_missing)} features"
-                    
-                    errors.append(f"Row {idx + 1}: {error_msg}")
-                    results.append({
-                        'row_index': idx + 1,
-                        'prediction': 'ERROR',
-                        'emotion': 'ERROR',
-                        'confidence': 0.0,
-                        'prob_negative': 0.0,
-                        'prob_neutral': 0.0,
-                        'prob_positive': 0.0,
-                        'error': error_msg,
-                        'missing_features_count': len(row_missing)
-                    })
-                    continue
-                
-                # Make prediction
-                prediction = model.predict([features])[0]
-                probabilities = model.predict_proba([features])[0]
-                emotion = map_prediction_to_emotion(prediction)
-                confidence = max(probabilities) * 100
-                
-                results.append({
-                    'row_index': idx + 1,
-                    'prediction': int(prediction),
-                    'emotion': emotion,
-                    'confidence': round(confidence, 2),
-                    'prob_negative': round(probabilities[0] * 100, 2),
-                    'prob_neutral': round(probabilities[1] * 100, 2),
-                    'prob_positive': round(probabilities[2] * 100, 2),
-                    'error': None,
-                    'missing_features_count': len(row_missing)
-                })
-                
-            except Exception as e:
-                error_msg = f"Processing error: {str(e)}"
-                errors.append(f"Row {idx + 1}: {error_msg}")
-                results.append({
-                    'row_index': idx + 1,
-                    'prediction': 'ERROR',
-                    'emotion': 'ERROR',
-                    'confidence': 0.0,
-                    'prob_negative': 0.0,
-                    'prob_neutral': 0.0,
-                    'prob_positive': 0.0,
-                    'error': error_msg,
-                    'missing_features_count': 0
-                })
-        
-        # Create results DataFrame
-        results_df = pd.DataFrame(results)
-        
-        # Combine original data with results
-        output_df = df.copy()
-        output_df['prediction'] = results_df['prediction']
-        output_df['emotion'] = results_df['emotion']
-        output_df['confidence'] = results_df['confidence']
-        output_df['prob_negative'] = results_df['prob_negative']
-        output_df['prob_neutral'] = results_df['prob_neutral']
-        output_df['prob_positive'] = results_df['prob_positive']
-        output_df['processing_error'] = results_df['error']
-        output_df['missing_features_count'] = results_df['missing_features_count']
-        output_df['processed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Add feature availability summary
-        feature_summary = {
-            'total_required_features': len(EXPECTED_FEATURES),
-            'available_features': len(available_features),
-            'missing_features': len(missing_features),
-            'feature_coverage': round((len(available_features) / len(EXPECTED_FEATURES)) * 100, 1)
-        }
+        feature_summary = summarize_feature_coverage(layout.columns)
+        
+        logger.info(f"Found {feature_summary['available_features']} out of {len(EXPECTED_FEATURES)} required features")
+        
+        if feature_summary['available_features'] == 0:
+            return None, f"No required features found in CSV. Expected features: {', '.join(EXPECTED_FEATURES[:10])}...", None, None
+        
+        aggregator = None
+        if group_by:
+            aggregator, error = make_group_aggregator(group_by, layout, served_model())
+            if error:
+                return None, error, None, None
+        
+        with stage_seconds.time(stage='csv_decode'):
+            records = split_records(body.split('\n'))
+        
+        logger.info(f"CSV loaded with {len(records)} rows")
+        
+        processed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        records, results, errors = score_csv_records(records, layout, processed_at, aggregator=aggregator)
+        groups = aggregator.table() if aggregator is not None else None
+        
+        # Other columns are carried through as the original text, like CsvResultWriter does
+        with stage_seconds.time(stage='result_assembly'):
+            df = read_text_frame(records, layout)
+            for column, values in results.items():
+                df[column] = values
+        
+        return df, errors, feature_summary, groups
+        
+    except Exception as e:
+        return None, f"CSV processing error: {str(e)}", None, None
+
+def timed_chunks(reader):
+    """Yield chunks from a CSV reader, recording the parse time of each"""
+    chunks = iter(reader)
+    while True:
+        with stage_seconds.time(stage='csv_decode'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def process_csv_stream(stream, output_path, progress=None, output_format='csv', results_only=False, group_by=None):
+    """Process a CSV stream in row chunks, appending predictions to output_path
+    
+    progress, if given, is called with the running stats after each chunk and
+    can return False to stop processing. output_format is one of
+    OUTPUT_FORMATS; results_only leaves the input columns out of the output.
+    With group_by column names, per-group emotion statistics are added up
+    chunk by chunk, returned in stats['groups'] and written to
+    aggregate_path(output_path).
+    
+    With the result store enabled, an upload already scored with the same
+    model and options is answered with the stored output, and chunks scored
+    before are reused. stats['cache_status'] is 'hit', 'partial', 'miss' or
+    'disabled'.
+    """
+    dtype_name = app.config['CSV_FEATURE_DTYPE']
+    version = served_model()
+    store_key = None
+    if result_store.enabled and stream.seekable():
+        with stage_seconds.time(stage='cache_lookup'):
+            store_key = make_key(hash_stream(stream), version.fingerprint, output_format, results_only, dtype_name,
+                                 *(group_by or []))
+            cached = result_store.get_output(store_key, output_path)
+        
+        if cached is not None:
+            groups = cached['stats'].get('groups')
+            if groups is not None:
+                write_aggregates(groups['rows'], groups['columns'], aggregate_path(output_path))
+            stats = dict(cached['stats'], cache_status='hit', reused_rows=cached['stats']['total_rows'],
+                         model=version.describe())
+            if progress is not None:
+                progress(dict(stats))
+            logger.info(f"CSV stream answered from the result store: {stats['total_rows']} rows")
+            return stats, cached['error_details'], cached['feature_summary']
+    
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    writer = None
+    try:
+        with stage_seconds.time(stage='csv_decode'):
+            layout = CsvLayout(text_stream.readline(), EXPECTED_FEATURES)
+        logger.info(f"CSV stream opened with {layout.n_columns} columns")
+        
+        feature_summary = summarize_feature_coverage(layout.columns)
+        if feature_summary['available_features'] == 0:
+            return None, f"No required features found in CSV. Expected features: {', '.join(EXPECTED_FEATURES[:10])}...", None
+        
+        aggregator = None
+        if group_by:
+            aggregator, error = make_group_aggregator(group_by, layout, version)
+            if error:
+                return None, error, None
+        
+        # Result columns replace input columns of the same name
+        layout.exclude(RESULT_COLUMNS)
+        processed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        writer = open_result_writer(output_path, output_format, layout, RESULT_COLUMNS, results_only)
         
-        return output_df, errors, feature_summary
+        # Running aggregates so memory does not grow with file size
+        stats = {'total_rows': 0, 'successful_predictions': 0, 'errors': 0, 'reused_rows': 0}
+        error_details = []
+        
+        for records in timed_chunks(read_record_chunks(text_stream, STREAM_CHUNK_ROWS, STREAM_CHUNK_CHARS)):
+            # Chunks are addressed by their text, position and the header that
+            # gives their fields meaning, so a file with appended rows reuses
+            # every chunk before the first change
+            cached_chunk = None
+            if store_key is not None:
+                with stage_seconds.time(stage='cache_lookup'):
+                    chunk_key = make_key(layout.header_line, '\n'.join(records), stats['total_rows'],
+                                         version.fingerprint, dtype_name)
+                    cached_chunk = result_store.get_chunk(chunk_key)
+            
+            if cached_chunk is not None:
+                records = align_records(records, layout.n_columns, stats['total_rows'] + 2)
+                results, errors = cached_chunk
+                stats['reused_rows'] += len(records)
+                if aggregator is not None:
+                    with stage_seconds.time(stage='aggregation'):
+                        aggregator.add(read_key_columns(records, layout, group_by), results)
+            else:
+                records, results, errors = score_csv_records(records, layout, processed_at, stats['total_rows'],
+                                                             aggregator)
+                if store_key is not None:
+                    result_store.put_chunk(chunk_key, results, errors)
+            
+            with stage_seconds.time(stage='output_write'):
+                writer.write(records, results)
+            
+            stats['total_rows'] += len(records)
+            stats['errors'] += len(errors)
+            stats['successful_predictions'] = stats['total_rows'] - stats['errors']
+            error_details.extend(errors[:10 - len(error_details)])
+            
+            if progress is not None and progress(dict(stats)) is False:
+                writer.abort()
+                return None, "Processing cancelled", None
+        
+        # The output only appears under its final name once complete
+        writer.close()
+        
+        if aggregator is not None:
+            with stage_seconds.time(stage='aggregation'):
+                table = aggregator.table()
+                stats['groups'] = {
+                    'group_by': group_by,
+                    'columns': list(table.columns),
+                    'rows': aggregator.records(table)
+                }
+                write_aggregates(stats['groups']['rows'], stats['groups']['columns'], aggregate_path(output_path))
+        logger.info(f"CSV stream processed: {stats['total_rows']} rows, {stats['reused_rows']} reused")
+        
+        stats['model'] = version.describe()
+        if store_key is None:
+            stats['cache_status'] = 'disabled'
+        else:
+            stats['cache_status'] = 'partial' if stats['reused_rows'] else 'miss'
+            summary = {
+                'stats': {key: value for key, value in stats.items() if key not in ('cache_status', 'reused_rows', 'model')},
+                'error_details': error_details,
+                'feature_summary': feature_summary
+            }
+            result_store.put_output(store_key, output_path, summary)
+        
+        return stats, error_details, feature_summary
         
     except Exception as e:
+        # Do not leave a partial output behind
+        if writer is not None:
+            writer.abort()
         return None, f"CSV processing error: {str(e)}", None
+    
+    finally:
+        # Leave the caller's stream open
+        text_stream.detach()
 
 @app.route('/', methods=['GET', 'POST'])
 def home():
@@ -237,26 +684,32 @@ def home():
     # POST request - Process prediction
     try:
         # Check if model is loaded
-        if model is None:
+        if served_model() is None:
             logger.error("Model not available for prediction")
             return render_template('index.html', 
                                  error="Model not loaded. Please check server configuration.",
                                  expected_features=EXPECTED_FEATURES)
         
+        with stage_seconds.time(stage='request_parse'):
+            form = request.form
+        
         # Extract and validate features from form (using actual feature names)
-        features = []
-        for feature_name in EXPECTED_FEATURES:
-            value = request.form.get(feature_name, '0')
-            try:
-                numeric_value = float(value) if value.strip() else 0.0
-                features.append(numeric_value)
-            except (ValueError, TypeError):
-                features.append(0.0)
+        with stage_seconds.time(stage='feature_extraction'):
+            features = []
+            for feature_name in EXPECTED_FEATURES:
+                value = form.get(feature_name, '0')
+                try:
+                    numeric_value = float(value) if value.strip() else 0.0
+                    features.append(numeric_value)
+                except (ValueError, TypeError):
+                    features.append(0.0)
         
         # Validate features
-        is_valid, validation_result = validate_features(features)
+        with stage_seconds.time(stage='validation'):
+            is_valid, validation_result = validate_features(features)
         if not is_valid:
             logger.error("Feature validation failed: %s", validation_result)
+            prediction_errors.inc(type='validation')
             return render_template('index.html', error=validation_result, expected_features=EXPECTED_FEATURES)
         
         feature_array = validation_result
@@ -266,8 +719,8 @@ def home():
                    feature_array.min(), feature_array.max(), feature_array.mean())
         
         # Make prediction using pipeline (includes scaling)
-        prediction = model.predict([feature_array])[0]
-        probabilities = model.predict_proba([feature_array])[0]
+        probabilities = predict_single(feature_array)
+        prediction = served_model().classes_[np.argmax(probabilities)]
         
         # Convert probabilities to list for template
         prob_list = probabilities.tolist()
@@ -281,66 +734,523 @@ def home():
         logger.info("Mapped emotion: %s", emotion)
         logger.info("Confidence: %.1f%%", confidence)
         logger.info("Probabilities: %s", prob_list)
+        rows_scored.inc(source='form')
         
-        return render_template('index.html', 
-                             result=emotion,
-                             confidence=confidence,
-                             probabilities=prob_list,
-                             expected_features=EXPECTED_FEATURES)
+        with stage_seconds.time(stage='result_assembly'):
+            return render_template('index.html', 
+                                 result=emotion,
+                                 confidence=confidence,
+                                 probabilities=prob_list,
+                                 expected_features=EXPECTED_FEATURES)
         
     except Exception as e:
         error_msg = f"Prediction error: {str(e)}"
         logger.error("%s", error_msg)
         return render_template('index.html', error=error_msg, expected_features=EXPECTED_FEATURES)
 
-@app.route('/upload_csv', methods=['POST'])
-def upload_csv():
-    """Handle CSV file upload and batch processing"""
+@app.route('/predict', methods=['POST'])
+def predict_json():
+    """Single prediction from a JSON feature vector"""
     try:
-        if model is None:
+        if served_model() is None:
             return jsonify({'error': 'Model not loaded'}), 500
         
-        if 'csv_file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
+        with stage_seconds.time(stage='request_parse'):
+            payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or 'features' not in payload:
+            prediction_errors.inc(type='payload')
+            return jsonify({'error': "Request body must be a JSON object with a 'features' field"}), 400
         
-        file = request.files['csv_file']
+        # Accept either a list in EXPECTED_FEATURES order or a name -> value mapping
+        with stage_seconds.time(stage='feature_extraction'):
+            raw_features = payload['features']
+            missing_count = 0
+            if isinstance(raw_features, dict):
+                missing_count = sum(1 for name in EXPECTED_FEATURES if name not in raw_features)
+                raw_features = [raw_features.get(name, 0.0) for name in EXPECTED_FEATURES]
         
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        with stage_seconds.time(stage='validation'):
+            is_valid, validation_result = validate_features(raw_features)
+        if not is_valid:
+            prediction_errors.inc(type='validation')
+            return jsonify({'error': validation_result}), 400
+        
+        probabilities = predict_single(validation_result)
+        prediction = served_model().classes_[np.argmax(probabilities)]
+        rows_scored.inc(source='json')
         
-        if not file.filename.lower().endswith('.csv'):
-            return jsonify({'error': 'Please upload a CSV file'}), 400
+        return jsonify({
+            'success': True,
+            'prediction': int(prediction),
+            'emotion': map_prediction_to_emotion(prediction),
+            'confidence': round(float(probabilities.max()) * 100, 2),
+            'probabilities': probabilities.tolist(),
+            'missing_features_count': missing_count,
+            'model': served_model().describe()
+        })
+        
+    except Exception as e:
+        error_msg = f"Prediction error: {str(e)}"
+        logger.error("%s", error_msg)
+        return jsonify({'error': error_msg}), 500
+
+def predict_matrix(features):
+    """Score a validated feature matrix in chunks, returning labels and probabilities"""
+    version = served_model()
+    probabilities = np.empty((len(features), len(version.classes_)), dtype=float)
+    for start in range(0, len(features), BATCH_CHUNK_SIZE):
+        chunk = features[start:start + BATCH_CHUNK_SIZE]
+        probabilities[start:start + BATCH_CHUNK_SIZE] = predict_proba(chunk, version)
+    
+    labels = np.asarray(version.classes_)[np.argmax(probabilities, axis=1)]
+    return labels, probabilities
+
+def read_feature_payload(content_type):
+    """Decode a JSON, raw or .npy request body into an (n, n_features) matrix and the missing feature names
+
+    Returns (None, []) for unsupported content types.
+    """
+    with stage_seconds.time(stage='request_parse'):
+        if content_type == JSON_CONTENT_TYPE:
+            return parse_json_payload(request.get_json(silent=True), EXPECTED_FEATURES)
+        if content_type == RAW_CONTENT_TYPE:
+            dtype_name = request.args.get('dtype', 'float64')
+            return parse_raw_buffer(request.get_data(cache=False), dtype_name, len(EXPECTED_FEATURES)), []
+        if content_type == NPY_CONTENT_TYPE:
+            return parse_npy(request.get_data(cache=False), len(EXPECTED_FEATURES)), []
+        return None, []
+
+def bulk_prediction_response(content_type, labels, probabilities, dtype, **extra):
+    """Answer a bulk prediction in the format the caller used"""
+    result_start = time.perf_counter()
+    if content_type == JSON_CONTENT_TYPE:
+        response = jsonify({
+            'success': True,
+            'rows': len(labels),
+            'classes': [int(c) for c in served_model().classes_],
+            'predictions': labels.tolist(),
+            'emotions': [map_prediction_to_emotion(label) for label in labels],
+            'confidence': np.round(probabilities.max(axis=1) * 100, 2).tolist() if len(labels) else [],
+            'probabilities': probabilities.tolist(),
+            'model': served_model().describe(),
+            **extra
+        })
+        stage_seconds.observe(time.perf_counter() - result_start, stage='result_assembly')
+        return response
+    
+    results = encode_results(labels, probabilities, dtype)
+    if content_type == NPY_CONTENT_TYPE:
+        body = encode_npy(results)
+    else:
+        body = results.tobytes()
+    
+    response = app.response_class(body, mimetype=content_type)
+    response.headers['X-Rows'] = str(results.shape[0])
+    response.headers['X-Columns'] = str(results.shape[1])
+    response.headers['X-Classes'] = ','.join(str(int(c)) for c in served_model().classes_)
+    stage_seconds.observe(time.perf_counter() - result_start, stage='result_assembly')
+    return response
+
+@app.route('/api/v1/predict', methods=['POST'])
+def predict_bulk():
+    """Bulk prediction from JSON rows/columns, a raw float buffer or an .npy array"""
+    try:
+        if served_model() is None:
+            return jsonify({'error': 'Model not loaded'}), 500
         
-        # Read file content
-        csv_content = file.read().decode('utf-8')
+        content_type = request.mimetype
+        features, missing = read_feature_payload(content_type)
+        if features is None:
+            prediction_errors.inc(type='payload')
+            return jsonify({'error': f"Unsupported content type '{content_type}', expected {JSON_CONTENT_TYPE}, {RAW_CONTENT_TYPE} or {NPY_CONTENT_TYPE}"}), 415
         
-        # Process CSV
-        process_result = process_csv_data(csv_content)
+        # Rows with NaN or Inf values reject the whole request
+        with stage_seconds.time(stage='validation'):
+            invalid_rows = np.flatnonzero(~np.isfinite(features).all(axis=1))
+        if len(invalid_rows):
+            prediction_errors.inc(type='validation')
+            return jsonify({
+                'error': "Features contain invalid values (NaN or Inf)",
+                'invalid_rows': invalid_rows[:10].tolist(),
+                'invalid_row_count': len(invalid_rows)
+            }), 400
         
-        if len(process_result) == 3:
-            results_df, errors, feature_summary = process_result
-        else:
-            results_df, errors = process_result
-            feature_summary = None
+        labels, probabilities = predict_matrix(features)
+        rows_scored.inc(len(labels), source='bulk')
         
-        if results_df is None:
-            return jsonify({'error': errors}), 400
+        return bulk_prediction_response(content_type, labels, probabilities, features.dtype, missing_features=missing)
+        
+    except (PayloadError, ValueError, TypeError) as e:
+        prediction_errors.inc(type='payload')
+        return jsonify({'error': f"Invalid payload: {str(e)}"}), 400
+    except Exception as e:
+        error_msg = f"Prediction error: {str(e)}"
+        logger.error("%s", error_msg)
+        return jsonify({'error': error_msg}), 500
+
+@app.route('/api/v1/predict_windows', methods=['POST'])
+def predict_windows():
+    """Bulk prediction from raw EEG windows of shape (n_windows, n_samples, n_channels)"""
+    try:
+        if served_model() is None:
+            return jsonify({'error': 'Model not loaded'}), 500
+        if feature_extractor is None:
+            return jsonify({'error': 'Raw EEG feature extraction is not available'}), 503
+        
+        content_type = request.mimetype
+        
+        # Decode the payload into a (n_windows, n_samples, n_channels) array
+        with stage_seconds.time(stage='request_parse'):
+            if content_type == JSON_CONTENT_TYPE:
+                windows = parse_json_windows(request.get_json(silent=True))
+            elif content_type == RAW_CONTENT_TYPE:
+                windows = parse_raw_windows(
+                    request.get_data(cache=False),
+                    request.args.get('dtype', 'float32'),
+                    request.args.get('samples', 0, type=int),
+                    request.args.get('channels', 0, type=int)
+                )
+            elif content_type == NPY_CONTENT_TYPE:
+                windows = parse_npy_windows(request.get_data(cache=False))
+            else:
+                prediction_errors.inc(type='payload')
+                return jsonify({'error': f"Unsupported content type '{content_type}', expected {JSON_CONTENT_TYPE}, {RAW_CONTENT_TYPE} or {NPY_CONTENT_TYPE}"}), 415
+        
+        with stage_seconds.time(stage='feature_extraction'):
+            features = feature_extractor.transform(windows)
+        
+        # Flat or degenerate signals give undefined covariance logarithms
+        with stage_seconds.time(stage='validation'):
+            invalid_rows = np.flatnonzero(~np.isfinite(features).all(axis=1))
+        if len(invalid_rows):
+            prediction_errors.inc(type='validation')
+            return jsonify({
+                'error': "Windows produce invalid feature values (NaN or Inf)",
+                'invalid_rows': invalid_rows[:10].tolist(),
+                'invalid_row_count': len(invalid_rows)
+            }), 400
+        
+        labels, probabilities = predict_matrix(features)
+        rows_scored.inc(len(labels), source='windows')
+        
+        extra = {}
+        if content_type == JSON_CONTENT_TYPE and request.args.get('include_features', 'false').lower() == 'true':
+            extra['features'] = features.tolist()
+        return bulk_prediction_response(content_type, labels, probabilities, windows.dtype, **extra)
+        
+    except (PayloadError, ValueError, TypeError) as e:
+        prediction_errors.inc(type='payload')
+        return jsonify({'error': f"Invalid payload: {str(e)}"}), 400
+    except Exception as e:
+        error_msg = f"Prediction error: {str(e)}"
+        logger.error("%s", error_msg)
+        return jsonify({'error': error_msg}), 500
+
+def predict_frames(features):
+    """Score streamed frames, coalescing small pushes from concurrent sessions"""
+    if app.config['BATCH_REQUESTS'] and len(features) <= app.config['BATCH_MAX_SIZE']:
+        return prediction_batcher.predict_proba(features, context=served_model())
+    return predict_matrix(features)[1]
+
+def describe_probabilities(probabilities):
+    """Emotion, confidence and probabilities for one probability vector"""
+    index = int(np.argmax(probabilities))
+    return {
+        'emotion': map_prediction_to_emotion(int(served_model().classes_[index])),
+        'confidence': round(float(probabilities[index]) * 100, 2),
+        'probabilities': [round(float(p), 6) for p in probabilities]
+    }
+
+def session_response(stream):
+    """Session summary with its URLs and current smoothed estimate"""
+    smoothed = stream.smoothed()
+    return dict(
+        stream.summary(),
+        frames_url=f"/stream/sessions/{stream.session_id}/frames",
+        events_url=f"/stream/sessions/{stream.session_id}/events",
+        smoothed=describe_probabilities(smoothed) if smoothed is not None else None
+    )
+
+@app.route('/stream/sessions', methods=['POST'])
+def open_stream_session():
+    """Open or resume the streaming session of a subject_id/session pair"""
+    if served_model() is None:
+        return jsonify({'error': 'Model not loaded'}), 500
+    
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or 'subject_id' not in payload:
+        return jsonify({'error': "Request body must be a JSON object with 'subject_id' and optionally 'session'"}), 400
+    
+    stream, created = stream_sessions.open(payload['subject_id'], payload.get('session', ''), len(served_model().classes_))
+    if created:
+        logger.info("Streaming session %s opened for subject %s, session %s", stream.session_id, stream.subject_id, stream.session)
+    return jsonify(session_response(stream)), 201 if created else 200
+
+@app.route('/stream/sessions/<session_id>', methods=['GET', 'DELETE'])
+def stream_session(session_id):
+    """Report or close a streaming session"""
+    if request.method == 'DELETE':
+        if not stream_sessions.close(session_id):
+            return jsonify({'error': 'Session not found'}), 404
+        return jsonify({'session_id': session_id, 'closed': True})
+    
+    stream = stream_sessions.get(session_id)
+    if stream is None:
+        return jsonify({'error': 'Session not found'}), 404
+    return jsonify(session_response(stream))
+
+@app.route('/stream/sessions/<session_id>/frames', methods=['POST'])
+def push_stream_frames(session_id):
+    """Score pushed feature frames and update the session's rolling estimate"""
+    try:
+        stream = stream_sessions.get(session_id)
+        if stream is None:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        content_type = request.mimetype
+        features, missing = read_feature_payload(content_type)
+        if features is None:
+            prediction_errors.inc(type='payload')
+            return jsonify({'error': f"Unsupported content type '{content_type}', expected {JSON_CONTENT_TYPE}, {RAW_CONTENT_TYPE} or {NPY_CONTENT_TYPE}"}), 415
+        
+        with stage_seconds.time(stage='validation'):
+            invalid_rows = np.flatnonzero(~np.isfinite(features).all(axis=1))
+        if len(invalid_rows):
+            prediction_errors.inc(type='validation')
+            return jsonify({
+                'error': "Features contain invalid values (NaN or Inf)",
+                'invalid_rows': invalid_rows[:10].tolist(),
+                'invalid_row_count': len(invalid_rows)
+            }), 400
+        
+        if len(features) == 0:
+            return jsonify(dict(session_response(stream), first_sequence=stream.sequence, predictions=[]))
+        
+        probabilities = predict_frames(np.asarray(features, dtype=float))
+        first_sequence, smoothed = stream.add(probabilities)
+        rows_scored.inc(len(features), source='stream')
+        
+        with stage_seconds.time(stage='result_assembly'):
+            labels = np.asarray(served_model().classes_)[np.argmax(probabilities, axis=1)]
+            return jsonify({
+                'session_id': session_id,
+                'first_sequence': first_sequence,
+                'frames': stream.sequence,
+                'predictions': labels.tolist(),
+                'emotions': [map_prediction_to_emotion(label) for label in labels],
+                'probabilities': np.round(probabilities, 6).tolist(),
+                'smoothed_probabilities': np.round(smoothed, 6).tolist(),
+                'smoothed': describe_probabilities(smoothed[-1]),
+                'missing_features': missing,
+                'model': served_model().describe()
+            })
+        
+    except (PayloadError, ValueError, TypeError) as e:
+        prediction_errors.inc(type='payload')
+        return jsonify({'error': f"Invalid payload: {str(e)}"}), 400
+    except Exception as e:
+        error_msg = f"Prediction error: {str(e)}"
+        logger.error("%s", error_msg)
+        return jsonify({'error': error_msg}), 500
+
+@app.route('/stream/sessions/<session_id>/events')
+def stream_session_events(session_id):
+    """Server-sent events with each frame's prediction and the rolling estimate"""
+    stream = stream_sessions.get(session_id)
+    if stream is None:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    # Reconnecting clients resume after the last event they saw, as far as the ring buffer reaches
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    last_sequence = int(last_event_id) if last_event_id.isdigit() else stream.sequence - 1
+    
+    def generate():
+        sequence = last_sequence
+        yield "retry: 2000\n\n"
+        while not stream.closed:
+            frames = stream.frames_since(sequence)
+            if not frames:
+                stream.wait(sequence, STREAM_KEEPALIVE_SECONDS)
+                frames = stream.frames_since(sequence)
+                if not frames:
+                    yield ": keepalive\n\n"
+                    continue
+            
+            for frame_sequence, probabilities, smoothed in frames:
+                event = dict(describe_probabilities(probabilities), sequence=frame_sequence, smoothed=describe_probabilities(smoothed))
+                yield f"id: {frame_sequence}\nevent: prediction\ndata: {json.dumps(event)}\n\n"
+                sequence = frame_sequence
+        
+        yield "event: closed\ndata: {}\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def get_uploaded_csv():
+    """Return the uploaded CSV file, or an error response if the upload is invalid"""
+    if served_model() is None:
+        return None, (jsonify({'error': 'Model not loaded'}), 500)
+    
+    # Parsing the multipart body spools the upload to a temporary file
+    with stage_seconds.time(stage='request_parse'):
+        files = request.files
+    
+    if 'csv_file' not in files:
+        prediction_errors.inc(type='upload')
+        return None, (jsonify({'error': 'No file uploaded'}), 400)
+    
+    file = files['csv_file']
+    
+    if file.filename == '':
+        prediction_errors.inc(type='upload')
+        return None, (jsonify({'error': 'No file selected'}), 400)
+    
+    if not file.filename.lower().endswith('.csv'):
+        prediction_errors.inc(type='upload')
+        return None, (jsonify({'error': 'Please upload a CSV file'}), 400)
+    
+    return file, None
+
+def make_output_filename(upload_filename, output_format='csv'):
+    """Generate the predictions filename for an uploaded CSV"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    original_name = secure_filename(upload_filename.rsplit('.', 1)[0])
+    # The suffix keeps uploads of the same file within a second apart
+    return f"{original_name}_predictions_{timestamp}_{uuid.uuid4().hex[:8]}{output_extension(output_format)}"
+
+def read_output_options():
+    """Return the requested result format options, or an error response"""
+    output_format = request.values.get('format', app.config['OUTPUT_FORMAT']).lower()
+    if output_format not in OUTPUT_FORMATS:
+        return None, (jsonify({'error': f"Unknown output format '{output_format}'. Available: {', '.join(available_formats())}"}), 400)
+    if output_format not in available_formats():
+        return None, (jsonify({'error': f"Output format '{output_format}' requires pyarrow"}), 400)
+    
+    results_only = request.values.get('results_only', str(app.config['OUTPUT_RESULTS_ONLY']))
+    
+    # Comma-separated column names, e.g. 'subject_id,session'
+    group_by = parse_group_by(request.values.get('group_by', app.config['GROUP_BY']))
+    
+    return {
+        'output_format': output_format,
+        'results_only': results_only.lower() in ('1', 'true', 'yes'),
+        'group_by': group_by
+    }, None
+
+def summarize_groups(groups, output_filename):
+    """Describe grouped statistics for a JSON response, listing at most GROUP_SUMMARY_MAX_GROUPS groups"""
+    limit = app.config['GROUP_SUMMARY_MAX_GROUPS']
+    groups_filename = os.path.basename(aggregate_path(output_filename))
+    
+    return {
+        'group_by': groups['group_by'],
+        'count': len(groups['rows']),
+        'groups': groups['rows'][:limit],
+        'truncated': len(groups['rows']) > limit,
+        'filename': groups_filename,
+        'download_url': f'/download/{groups_filename}'
+    }
+
+# Niced worker processes score uploads, so the interactive threads keep the
+# CPU and the GIL while a large file is processed
+bulk_executor = None
+bulk_executor_lock = threading.Lock()
+
+def init_bulk_process(niceness):
+    """Initializer of the upload and job worker pools"""
+    init_bulk_worker(niceness)
+    # Jobs report their metrics through METRICS_DIR, if set
+    metrics_registry.ensure_flushing()
+
+def get_bulk_executor():
+    global bulk_executor
+    with bulk_executor_lock:
+        if bulk_executor is None:
+            bulk_executor = ProcessPoolExecutor(
+                max_workers=app.config['BULK_PROCESSES'],
+                initializer=init_bulk_process,
+                initargs=(app.config['BULK_NICE'],)
+            )
+        return bulk_executor
+
+def reset_bulk_executor():
+    """Fork new worker processes for the next uploads, letting submitted ones finish"""
+    global bulk_executor
+    with bulk_executor_lock:
+        if bulk_executor is not None:
+            bulk_executor.shutdown(wait=False)
+            bulk_executor = None
+
+def score_spooled_csv(input_path, output_path, output_options):
+    """Score a spooled upload in a bulk worker, returning the result and the metrics it recorded"""
+    before = metrics_registry.snapshot()
+    with open(input_path, 'rb') as f:
+        result = process_csv_stream(f, output_path, **output_options)
+    
+    # With a shared metrics directory the worker reports through its own file
+    if metrics_registry.directory:
+        metrics_registry.flush()
+        return result, None
+    return result, metrics_registry.changes_since(before)
+
+def score_upload_in_worker(file, output_path, output_options):
+    """Spool an uploaded CSV to disk and score it in a bulk worker process"""
+    spool_dir = os.path.join(os.getcwd(), 'temp', 'uploads')
+    os.makedirs(spool_dir, exist_ok=True)
+    input_path = os.path.join(spool_dir, f"{uuid.uuid4().hex}.csv")
+    
+    try:
+        file.save(input_path)
+        future = get_bulk_executor().submit(score_spooled_csv, input_path, output_path, output_options)
+        result, metric_changes = future.result()
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool for the next upload
+        reset_bulk_executor()
+        raise
+    finally:
+        if os.path.exists(input_path):
+            os.remove(input_path)
+    
+    if metric_changes is not None:
+        metrics_registry.merge(metric_changes)
+    return result
+
+@app.route('/upload_csv', methods=['POST'])
+def upload_csv():
+    """Handle CSV file upload and batch processing"""
+    try:
+        file, error_response = get_uploaded_csv()
+        if error_response:
+            return error_response
+        
+        output_options, error_response = read_output_options()
+        if error_response:
+            return error_response
         
         # Generate output filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        original_name = secure_filename(file.filename.rsplit('.', 1)[0])
-        output_filename = f"{original_name}_predictions_{timestamp}.csv"
+        output_filename = make_output_filename(file.filename, output_options['output_format'])
         
         # Save to temporary location
         temp_dir = os.path.join(os.getcwd(), 'temp')
         os.makedirs(temp_dir, exist_ok=True)
         output_path = os.path.join(temp_dir, output_filename)
-        results_df.to_csv(output_path, index=False)
+        
+        # Stream the upload through the model chunk by chunk
+        if app.config['BULK_PROCESSES'] > 0:
+            stats, errors, feature_summary = score_upload_in_worker(file, output_path, output_options)
+        else:
+            stats, errors, feature_summary = process_csv_stream(file.stream, output_path, **output_options)
+        
+        if stats is None:
+            prediction_errors.inc(type='upload')
+            return jsonify({'error': errors}), 400
         
         # Calculate summary statistics
-        total_rows = len(results_df)
-        successful_predictions = len(results_df[results_df['emotion'] != 'ERROR'])
-        error_count = len(results_df[results_df['emotion'] == 'ERROR'])
+        total_rows = stats['total_rows']
+        successful_predictions = stats['successful_predictions']
+        error_count = stats['errors']
         
         # Return summary with feature information
         summary = {
@@ -350,12 +1260,22 @@ def upload_csv():
             'success_rate': round((successful_predictions / total_rows) * 100, 1) if total_rows > 0 else 0,
             'error_details': errors[:10],  # First 10 errors
             'output_filename': output_filename,
+            'output_format': output_options['output_format'],
+            'results_only': output_options['results_only'],
+            'output_bytes': os.path.getsize(output_path),
+            'cache_status': stats['cache_status'],
+            'reused_rows': stats['reused_rows'],
             'download_url': f'/download/{output_filename}',
-            'feature_summary': feature_summary
+            'expires_in': app.config['OUTPUT_TTL'] or None,
+            'feature_summary': feature_summary,
+            'model': stats['model']
         }
         
         logger.info(f"CSV processed: {summary}")
         
+        if stats.get('groups') is not None:
+            summary['groups'] = summarize_groups(stats['groups'], output_filename)
+        
         return jsonify({
             'success': True,
             'summary': summary,
@@ -367,6 +1287,64 @@ def upload_csv():
         logger.error(error_msg)
         return jsonify({'error': error_msg}), 500
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a CSV file for background batch processing"""
+    try:
+        file, error_response = get_uploaded_csv()
+        if error_response:
+            return error_response
+        
+        output_options, error_response = read_output_options()
+        if error_response:
+            return error_response
+        
+        output_filename = make_output_filename(file.filename, output_options['output_format'])
+        job_id = job_manager.submit(file, output_filename, output_options)
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}'
+        }), 202
+        
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    except Exception as e:
+        error_msg = f"Job submission error: {str(e)}"
+        logger.error(error_msg)
+        return jsonify({'error': error_msg}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_status(job_id):
+    """Report progress of a background job, or cancel it with DELETE"""
+    # Job ids are uuid4 hex strings
+    if not job_id.isalnum():
+        return jsonify({'error': 'Invalid job id'}), 400
+    
+    if request.method == 'DELETE':
+        state = job_manager.cancel(job_id)
+    else:
+        state = job_manager.status(job_id)
+    
+    if state is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = {key: value for key, value in state.items() if key not in ('output_dir', 'owner')}
+    if state['status'] == COMPLETED:
+        # Results are swept after OUTPUT_TTL or when over the size quota
+        if os.path.exists(os.path.join(state['output_dir'], state['output_filename'])):
+            response['download_url'] = f"/download/{state['output_filename']}"
+            groups_filename = os.path.basename(aggregate_path(state['output_filename']))
+            if os.path.exists(os.path.join(state['output_dir'], groups_filename)):
+                response['groups_download_url'] = f"/download/{groups_filename}"
+        else:
+            response['output_expired'] = True
+    
+    return jsonify(response)
+
 @app.route('/download/<filename>')
 def download_file(filename):
     try:
@@ -389,17 +1367,120 @@ def download_file(filename):
         
         logger.info(f"Downloading: {file_path}")
         
+        # Streamed from disk; conditional responses answer Range requests with 206
         return send_file(
             file_path,
             as_attachment=True,
             download_name=safe_filename,
-            mimetype='text/csv'
+            mimetype=output_mimetype(safe_filename),
+            conditional=True
         )
         
+    except RequestedRangeNotSatisfiable:
+        # Answered with 416 and the file's length
+        raise
     except Exception as e:
         logger.error(f"Download error: {str(e)}")
         return f"Download error: {str(e)}", 500
 
+@app.before_request
+def limit_request_body():
+    """Reject bodies over the route's limit before the view reads them
+    
+    Only CSV uploads, which are spooled to disk and streamed, may exceed
+    MAX_CONTENT_LENGTH; every other body is read into memory.
+    """
+    if request.endpoint in UPLOAD_ENDPOINTS:
+        request.max_content_length = app.config['UPLOAD_MAX_CONTENT_LENGTH']
+    
+    limit = request.max_content_length
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        return jsonify({'error': f"Request body is larger than the {limit} byte limit"}), 413
+
+@app.before_request
+def require_single_worker():
+    """Turn streaming requests away when several workers would split a session's state"""
+    if request.endpoint in STREAM_ENDPOINTS and not STREAMING_ENABLED:
+        return jsonify({'error': f"Streaming sessions need a single server worker, this server runs {app.config['SERVER_WORKERS']}"}), 503
+
+@app.before_request
+def share_metrics():
+    """Start writing this process's metrics to METRICS_DIR with its first request"""
+    metrics_registry.ensure_flushing()
+
+@app.before_request
+def watch_model_file():
+    """Start the model file watcher of this process with its first request"""
+    model_registry.ensure_watching()
+
+@app.before_request
+def recover_jobs():
+    """Take over jobs left by stopped server processes with this process's first request"""
+    job_manager.ensure_recovered()
+
+@app.before_request
+def start_request_timer():
+    """Start timing the request and, for a sampled fraction, profiling it"""
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    
+    sample_rate = app.config['PROFILE_SAMPLE_RATE']
+    if sample_rate > 0 and random.random() < sample_rate:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record latency and byte counts, and save the profile of sampled requests"""
+    endpoint = request.endpoint or 'unknown'
+    
+    if g.get('profiler') is not None:
+        g.profiler.disable()
+        try:
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            profile_path = os.path.join(
+                app.config['PROFILE_DIR'],
+                f"{endpoint}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.prof"
+            )
+            g.profiler.dump_stats(profile_path)
+            logger.info("Request profile saved: %s", profile_path)
+        except OSError as e:
+            logger.error("Could not save request profile: %s", str(e))
+    
+    # Responses name the model version that served them
+    version = g.get('model_version')
+    if version is not None:
+        response.headers['X-Model-Version'] = version.version
+        response.headers['X-Model-Fingerprint'] = version.fingerprint
+    
+    if 'request_start' in g:
+        request_seconds.observe(time.perf_counter() - g.request_start, endpoint=endpoint, status=response.status_code)
+    request_bytes.inc(request.content_length or 0, endpoint=endpoint)
+    response_bytes.inc(response.content_length or 0, endpoint=endpoint)
+    
+    return response
+
+@app.route('/model/reload', methods=['POST'])
+def reload_model():
+    """Load the model file again in this worker process and serve it if it changed"""
+    if model_registry.path is None:
+        return jsonify({'error': 'Model not loaded'}), 500
+    
+    reloaded = model_registry.reload()
+    if model_registry.last_error:
+        return jsonify({'error': f"Model reload failed: {model_registry.last_error}"}), 500
+    
+    return jsonify({
+        'reloaded': reloaded,
+        'model': model_registry.current.describe(),
+        'reloads': model_registry.reloads
+    })
+
+@app.route('/metrics')
+def metrics():
+    """Serve process metrics in Prometheus text format"""
+    return app.response_class(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/features')
 def get_features():
     """Return the list of expected features"""
@@ -419,21 +1500,24 @@ def get_features():
 def test_model():
     """Test endpoint with actual feature patterns"""
     
-    if model is None:
+    version = served_model()
+    if version is None:
         return "<h2>Model not loaded</h2>"
     
+    n_features = len(EXPECTED_FEATURES)
+    
     # Test patterns using actual feature ranges
     test_patterns = [
         # Test with typical EEG values
-        ([0.1] * 45, "Typical Positive Values"),
-        ([0.01] * 45, "Small Positive Values"),
-        ([0.0] * 45, "Zero Values"),
-        ([-0.01] * 45, "Small Negative Values"),
-        ([-0.1] * 45, "Moderate Negative Values"),
-        ([-1.0] * 45, "Large Negative Values"),
+        ([0.1] * n_features, "Typical Positive Values"),
+        ([0.01] * n_features, "Small Positive Values"),
+        ([0.0] * n_features, "Zero Values"),
+        ([-0.01] * n_features, "Small Negative Values"),
+        ([-0.1] * n_features, "Moderate Negative Values"),
+        ([-1.0] * n_features, "Large Negative Values"),
         
         # Mixed patterns
-        ([0.1 if i % 2 == 0 else -0.1 for i in range(45)], "Alternating Pattern"),
+        ([0.1 if i % 2 == 0 else -0.1 for i in range(n_features)], "Alternating Pattern"),
     ]
     
     html = ["<html><head><title>Brain Emotion Model Test</title></head><body>"]
@@ -441,7 +1525,7 @@ def test_model():
     html.append("<style>body{font-family:Arial;margin:20px;} .test{margin:10px 0;padding:10px;border:1px solid #ddd;} .positive{background:#d4edda;} .negative{background:#f8d7da;} .neutral{background:#fff3cd;}</style>")
     
     # Show expected features
-    html.append("<h2>Expected Features (45 total):</h2>")
+    html.append(f"<h2>Expected Features ({n_features} total):</h2>")
     html.append("<div style='max-height:200px;overflow-y:scroll;border:1px solid #ccc;padding:10px;'>")
     for i, feature in enumerate(EXPECTED_FEATURES):
         html.append(f"<p><b>F{i+1}:</b> {feature}</p>")
@@ -449,8 +1533,8 @@ def test_model():
     
     for i, (pattern, description) in enumerate(test_patterns):
         try:
-            pred = model.predict([pattern])[0]
-            prob = model.predict_proba([pattern])[0]
+            prob = predict_single(np.array(pattern, dtype=float))
+            pred = version.classes_[np.argmax(prob)]
             emotion = map_prediction_to_emotion(pred)
             
             css_class = emotion.lower() if emotion in ['POSITIVE', 'NEGATIVE', 'NEUTRAL'] else ''
@@ -471,8 +1555,10 @@ def test_model():
     
     # Model info
     html.append("<h2>Model Information</h2>")
-    html.append(f"<p><b>Model Type:</b> {type(model).__name__}</p>")
-    html.append(f"<p><b>Classes:</b> {getattr(model, 'classes_', 'Not available')}</p>")
+    html.append(f"<p><b>Model Type:</b> {type(version.estimator).__name__}</p>")
+    html.append(f"<p><b>Model Version:</b> {version.version} ({version.fingerprint})</p>")
+    html.append(f"<p><b>Compiled Inference:</b> {'enabled' if version.compiled is not None else 'disabled'}</p>")
+    html.append(f"<p><b>Classes:</b> {getattr(version.estimator, 'classes_', 'Not available')}</p>")
     html.append(f"<p><b>Expected Features:</b> {len(EXPECTED_FEATURES)}</p>")
     
     html.append("</body></html>")
@@ -481,14 +1567,170 @@ def test_model():
 @app.route('/health')
 def health():
     """Health check endpoint"""
+    version = served_model()
+    compiled = version.compiled if version is not None else None
     return {
-        "status": "healthy" if model is not None else "unhealthy",
-        "model_loaded": model is not None,
-        "model_type": type(model).__name__ if model else None,
+        "status": "healthy" if version is not None else "unhealthy",
+        "model_loaded": version is not None,
+        "model_type": type(version.estimator).__name__ if version else None,
+        "compiled_model": compiled is not None,
+        "raw_eeg_extraction": feature_extractor is not None,
+        "model_version": version.version if version else None,
+        "model_fingerprint": version.fingerprint if version else None,
+        "model_variant": app.config['MODEL_VARIANT'] or None,
+        "model_reload": model_registry.stats(),
+        "compiled_thresholds": compiled.threshold_dtype if compiled is not None else None,
+        "batching": prediction_batcher.metrics() if app.config['BATCH_REQUESTS'] else None,
+        "admission": admission_controller.stats() if app.config['ADMISSION_CONTROL'] else None,
+        "prediction_cache": prediction_cache.stats(),
+        "streaming": dict(stream_sessions.stats(), enabled=STREAMING_ENABLED),
+        "outputs": dict(output_sweeper.stats(), formats=available_formats()),
+        "result_store": result_store.stats(),
         "expected_features": len(EXPECTED_FEATURES),
         "feature_names": EXPECTED_FEATURES[:5] + ["..."] if len(EXPECTED_FEATURES) > 5 else EXPECTED_FEATURES
     }
 
+# Background jobs write into the same temp directory that /download serves
+job_manager = JobManager(
+    process_csv_stream,
+    state_dir=app.config['JOB_STATE_DIR'],
+    output_dir=os.path.join(os.getcwd(), 'temp'),
+    max_workers=app.config['JOB_WORKERS'],
+    max_queued=app.config['JOB_QUEUE_SIZE'],
+    initializer=init_bulk_process,
+    initargs=(app.config['BULK_NICE'],)
+)
+
+# Result files expire by age and total size; other files in temp are left alone
+output_sweeper = OutputSweeper(
+    os.path.join(os.getcwd(), 'temp'),
+    ttl=app.config['OUTPUT_TTL'],
+    max_bytes=app.config['OUTPUT_MAX_MB'] * 1024 * 1024,
+    interval=app.config['OUTPUT_SWEEP_INTERVAL'],
+    pattern='*_predictions_*'
+)
+
+# Components that keep their own statistics are read at scrape time
+metrics_registry.callback(
+    'emotion_model_loaded', 'Whether a model is loaded', lambda: int(model_registry.current is not None))
+metrics_registry.callback(
+    'emotion_model_reloads_total', 'Model reload attempts by result',
+    lambda: {('success',): model_registry.reloads, ('failure',): model_registry.failed_reloads},
+    labelnames=['result'], type_name='counter')
+metrics_registry.callback(
+    'emotion_prediction_cache_entries', 'Entries in the prediction cache',
+    lambda: prediction_cache.stats()['size'])
+metrics_registry.callback(
+    'emotion_prediction_cache_lookups_total', 'Prediction cache lookups by result',
+    lambda: {('hit',): prediction_cache.hits, ('miss',): prediction_cache.misses},
+    labelnames=['result'], type_name='counter')
+metrics_registry.callback(
+    'emotion_prediction_cache_evictions_total', 'Prediction cache removals by reason',
+    lambda: {('size',): prediction_cache.evictions, ('ttl',): prediction_cache.expirations},
+    labelnames=['reason'], type_name='counter')
+metrics_registry.callback(
+    'emotion_batcher_batches_total', 'Batches dispatched by the request coalescer',
+    lambda: prediction_batcher.metrics()['batches'], type_name='counter')
+metrics_registry.callback(
+    'emotion_batcher_rows_total', 'Rows dispatched by the request coalescer',
+    lambda: prediction_batcher.metrics()['rows'], type_name='counter')
+metrics_registry.callback(
+    'emotion_stream_sessions', 'Open streaming sessions in this process',
+    lambda: stream_sessions.stats()['active_sessions'])
+metrics_registry.callback(
+    'emotion_jobs_active', 'Background jobs queued or running in this process',
+    lambda: job_manager.active_count())
+metrics_registry.callback(
+    'emotion_result_store_lookups_total', 'Result store lookups by kind and result',
+    lambda: {
+        ('output', 'hit'): result_store.hits, ('output', 'miss'): result_store.misses,
+        ('chunk', 'hit'): result_store.chunk_hits, ('chunk', 'miss'): result_store.chunk_misses
+    },
+    labelnames=['kind', 'result'], type_name='counter')
+metrics_registry.callback(
+    'emotion_result_store_bytes', 'Bytes held by the result store',
+    lambda: result_store.stats()['stored_bytes'])
+metrics_registry.callback(
+    'emotion_output_bytes', 'Bytes of result files kept in the output directory',
+    lambda: output_sweeper.stats()['stored_bytes'])
+metrics_registry.callback(
+    'emotion_output_files_removed_total', 'Result files deleted by the retention sweeper',
+    lambda: output_sweeper.removed_files, type_name='counter')
+
+# Uploads and job submissions get their own small pool, so they queue and
+# are turned away with 503 before they can take the threads of / and /predict
+BULK_PATHS = ('/upload_csv', '/jobs')
+
+def classify_request(environ):
+    """Return the admission pool of a request, or None if it is never queued"""
+    path = environ.get('PATH_INFO', '')
+    # Probes must answer under load, and event streams stay open for a session
+    if path in ('/health', '/metrics') or path.endswith('/events'):
+        return None
+    
+    if environ.get('REQUEST_METHOD') == 'POST' and path in BULK_PATHS:
+        return 'bulk'
+    
+    try:
+        content_length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    return 'bulk' if content_length >= app.config['BULK_MIN_BYTES'] else 'interactive'
+
+admission_controller = AdmissionController(
+    app.wsgi_app,
+    pools=[
+        AdmissionPool(
+            'interactive',
+            max_concurrent=app.config['INTERACTIVE_MAX_CONCURRENT'],
+            max_queued=app.config['INTERACTIVE_MAX_QUEUED'],
+            queue_timeout=app.config['INTERACTIVE_QUEUE_TIMEOUT'],
+            retry_after=app.config['INTERACTIVE_RETRY_AFTER']
+        ),
+        AdmissionPool(
+            'bulk',
+            max_concurrent=app.config['BULK_MAX_CONCURRENT'],
+            max_queued=app.config['BULK_MAX_QUEUED'],
+            queue_timeout=app.config['BULK_QUEUE_TIMEOUT'],
+            retry_after=app.config['BULK_RETRY_AFTER']
+        )
+    ],
+    classify=classify_request
+)
+if app.config['ADMISSION_CONTROL']:
+    app.wsgi_app = admission_controller
+    
+    metrics_registry.callback(
+        'emotion_admission_active', 'Requests being handled by admission pool',
+        lambda: {(name,): pool.active for name, pool in admission_controller.pools.items()},
+        labelnames=['pool'])
+    metrics_registry.callback(
+        'emotion_admission_queued', 'Requests waiting for a slot by admission pool',
+        lambda: {(name,): pool.queued for name, pool in admission_controller.pools.items()},
+        labelnames=['pool'])
+    metrics_registry.callback(
+        'emotion_admission_rejected_total', 'Requests answered with 503 by admission pool and reason',
+        lambda: {
+            (name, reason): count
+            for name, pool in admission_controller.pools.items()
+            for reason, count in pool.stats()['rejected'].items()
+        },
+        labelnames=['pool', 'reason'], type_name='counter')
+
+def drain_server(timeout=30):
+    """Finish in-flight work before the process exits
+
+    New requests are answered with 503 while admitted ones complete,
+    running jobs get until timeout to finish and queued jobs stay on disk
+    for the next start.
+    """
+    deadline = time.monotonic() + timeout
+    admission_controller.drain(timeout)
+    job_manager.drain(max(deadline - time.monotonic(), 0))
+    reset_bulk_executor()
+    output_sweeper.stop()
+    logger.info("Server drained")
+
 # Initialize model on startup
 if __name__ == '__main__':
     print("Brain Emotion Detection Server with Real Features")
@@ -506,9 +1748,17 @@ if __name__ == '__main__':
     print("Test: http://localhost:8000/test")
     print("Health: http://localhost:8000/health")
     print("Features: http://localhost:8000/features")
+    print("Metrics: http://localhost:8000/metrics")
     print("=" * 60)
     
+    # Only the reloader's serving process owns the job queue
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_manager.ensure_recovered()
+        output_sweeper.start()
+    
     app.run(debug=True, port=8000, host='0.0.0.0')
 else:
-    # Load model when imported
-    load_model()
\ No newline at end of file
+    # Load model when imported; unfinished jobs are recovered by the
+    # processes that serve requests, never by a pre-fork master
+    load_model()
+    output_sweeper.start()
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class _PendingRequest:
+    __slots__ = ('features', 'single', 'context', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, features, context=None):
+        self.single = features.ndim == 1
+        self.features = features.reshape(1, -1) if self.single else features
+        self.context = context
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PredictionBatcher:
+    """Coalesce concurrent small predictions into batched calls
+
+    Callers block in predict_proba while a background thread collects
+    rows for up to max_wait_ms after the first one arrives (or until
+    max_batch_size rows are waiting), scores them with one call and
+    hands each caller its own rows. Requests given a context, such as the
+    model version they must be scored with, are only batched with requests
+    of the same context, which is passed on to predict_proba.
+    """
+
+    def __init__(self, predict_proba, max_batch_size=32, max_wait_ms=2.0):
+        self._predict_proba = predict_proba
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._rows = 0
+        self._largest_batch_size = 0
+        self._batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self._queue_delay_total = 0.0
+        self._queue_delay_max = 0.0
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so start one per process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+                self._thread.start()
+
+    def predict_proba(self, features, timeout=None, context=None):
+        """Return class probabilities for a validated feature vector or a small matrix of rows"""
+        self._ensure_started()
+
+        request = _PendingRequest(np.asarray(features, dtype=float), context)
+        self._queue.put(request)
+
+        if not request.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for a batched prediction")
+        if request.error is not None:
+            raise request.error
+
+        return request.result[0] if request.single else request.result
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        rows = len(first.features)
+        deadline = first.enqueued_at + self.max_wait
+
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    request = self._queue.get(timeout=remaining)
+                else:
+                    # Past the deadline, only take rows that are already waiting
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            rows += len(request.features)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            dispatched_at = time.perf_counter()
+
+            # Nearly always one group; several only right after a model swap
+            groups = {}
+            for request in batch:
+                groups.setdefault(id(request.context), []).append(request)
+            for group in groups.values():
+                self._score(group)
+
+            self._record(batch, dispatched_at)
+
+    def _score(self, group):
+        context = group[0].context
+        try:
+            features = np.vstack([request.features for request in group])
+            if context is None:
+                probabilities = self._predict_proba(features)
+            else:
+                probabilities = self._predict_proba(features, context)
+            offset = 0
+            for request in group:
+                request.result = probabilities[offset:offset + len(request.features)]
+                offset += len(request.features)
+        except Exception as e:
+            for request in group:
+                request.error = e
+        finally:
+            for request in group:
+                request.done.set()
+
+    def _record(self, batch, dispatched_at):
+        delays = [dispatched_at - request.enqueued_at for request in batch]
+        rows = sum(len(request.features) for request in batch)
+        bucket = np.searchsorted(BATCH_SIZE_BUCKETS, rows)
+
+        with self._metrics_lock:
+            self._batches += 1
+            self._rows += rows
+            self._largest_batch_size = max(self._largest_batch_size, rows)
+            self._batch_size_counts[bucket] += 1
+            self._queue_delay_total += sum(delay * len(request.features) for delay, request in zip(delays, batch))
+            self._queue_delay_max = max(self._queue_delay_max, max(delays))
+
+    def metrics(self):
+        """Return batch size and queueing delay statistics"""
+        with self._metrics_lock:
+            labels = [f"<={bound}" for bound in BATCH_SIZE_BUCKETS] + [f">{BATCH_SIZE_BUCKETS[-1]}"]
+            return {
+                'batches': self._batches,
+                'rows': self._rows,
+                'mean_batch_size': round(self._rows / self._batches, 2) if self._batches else 0.0,
+                'largest_batch_size': self._largest_batch_size,
+                'batch_size_counts': dict(zip(labels, self._batch_size_counts)),
+                'mean_queue_delay_ms': round(self._queue_delay_total / self._rows * 1000, 3) if self._rows else 0.0,
+                'max_queue_delay_ms': round(self._queue_delay_max * 1000, 3),
+                'max_wait_ms': self.max_wait * 1000,
+                'max_batch_size': self.max_batch_size
+            }
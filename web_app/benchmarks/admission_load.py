@@ -0,0 +1,298 @@
+"""Show that single predictions stay fast while CSV uploads run
+
+Sends single-row predictions to POST / at a fixed rate, first on an idle
+server and then while --uploaders clients keep uploading synthetic CSV
+files to /upload_csv. The run passes when the p99 latency of / during
+uploads stays within --tolerance times its idle p99. Rejected requests
+(503 with Retry-After) are counted separately for both kinds of traffic.
+
+    python benchmarks/admission_load.py --spawn-server --duration 20 --uploaders 2
+    python benchmarks/admission_load.py --spawn-server --env FLASK_ADMISSION_CONTROL=false
+    python benchmarks/admission_load.py --url http://localhost:8000 --output admission.json
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+WEB_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_SCRIPT = (
+    "import sys; from werkzeug.serving import run_simple; import app; "
+    "run_simple('127.0.0.1', int(sys.argv[1]), app.app, threaded=True)"
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(server, workers, env_overrides):
+    """Start the app on a free port with gunicorn or werkzeug and wait until it is healthy"""
+    port = free_port()
+    env = dict(os.environ, GUNICORN_WORKERS=str(workers), **env_overrides)
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f"127.0.0.1:{port}", 'app:app']
+    else:
+        command = [sys.executable, '-c', SERVER_SCRIPT, str(port)]
+    process = subprocess.Popen(command, cwd=WEB_APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 90
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+
+    process.kill()
+    raise RuntimeError("Server did not become healthy within 90 seconds")
+
+
+def fetch_features(host):
+    connection = http.client.HTTPConnection(host, timeout=30)
+    connection.request('GET', '/features')
+    return json.loads(connection.getresponse().read())['features']
+
+
+# Replaced in every row before each upload, so the result store never answers
+UPLOAD_TOKEN = b'TOKEN000'
+
+
+def build_upload(feature_names, n_rows, seed):
+    """Return a multipart body with a synthetic CSV and its content type"""
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.normal(size=(n_rows, len(feature_names))) * 100, 4)
+    lines = [','.join(feature_names + ['subject_id', 'session'])]
+    token = UPLOAD_TOKEN.decode('ascii')
+    lines += [','.join(map(str, row)) + f",S{i % 500:03d}-{token},{i % 4 + 1}" for i, row in enumerate(values.tolist())]
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"csv_file\"; filename=\"load.csv\"\r\n"
+        f"Content-Type: text/csv\r\n\r\n" + '\n'.join(lines) + f"\r\n--{boundary}--\r\n"
+    ).encode('utf-8')
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class InteractiveClient:
+    """Posts single-row predictions to / on a fixed schedule"""
+
+    def __init__(self, host, feature_names, rate, seed):
+        self.host = host
+        self.feature_names = feature_names
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+        self.latencies = []
+        self.statuses = {}
+        self.errors = []
+
+    def run(self, start_at, duration):
+        connection = http.client.HTTPConnection(self.host, timeout=60)
+        next_send = start_at
+        try:
+            while next_send < start_at + duration:
+                time.sleep(max(next_send - time.monotonic(), 0))
+                # Distinct values every time, so the prediction cache never answers
+                form = dict(zip(self.feature_names, np.round(self.rng.normal(size=len(self.feature_names)) * 100, 4)))
+                sent = time.perf_counter()
+                try:
+                    connection.request('POST', '/', body=urlencode(form),
+                                       headers={'Content-Type': 'application/x-www-form-urlencoded'})
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException) as e:
+                    self.errors.append(str(e))
+                    connection.close()
+                    connection = http.client.HTTPConnection(self.host, timeout=60)
+                else:
+                    self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+                    if response.status == 200:
+                        self.latencies.append(time.perf_counter() - sent)
+                next_send += 1.0 / self.rate
+        finally:
+            connection.close()
+
+
+class Uploader:
+    """Uploads the same CSV back to back until stopped, backing off on 503"""
+
+    def __init__(self, host, body, content_type):
+        self.host = host
+        self.body = body
+        self.content_type = content_type
+        self.durations = []
+        self.rejected = 0
+        self.errors = []
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set():
+            connection = http.client.HTTPConnection(self.host, timeout=600)
+            start = time.perf_counter()
+            try:
+                body = self.body.replace(UPLOAD_TOKEN, uuid.uuid4().hex[:len(UPLOAD_TOKEN)].encode('ascii'))
+                try:
+                    connection.request('POST', '/upload_csv', body=body, headers={'Content-Type': self.content_type})
+                except (BrokenPipeError, ConnectionResetError):
+                    # A rejected upload is answered before its body is read,
+                    # and the server closes the connection on the rest
+                    pass
+                response = connection.getresponse()
+                payload = response.read()
+                if response.status == 503:
+                    self.rejected += 1
+                    self.stop.wait(min(float(response.getheader('Retry-After', '1')), 1.0))
+                elif response.status != 200:
+                    self.errors.append(f"{response.status}: {payload[:200]!r}")
+                else:
+                    self.durations.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException) as e:
+                self.errors.append(str(e))
+                self.stop.wait(1.0)
+            finally:
+                connection.close()
+
+
+def summarize(clients):
+    latencies = np.array([latency for client in clients for latency in client.latencies]) * 1000
+    statuses = {}
+    for client in clients:
+        for status, count in client.statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        'requests': sum(statuses.values()),
+        'statuses': statuses,
+        'errors': sum(len(client.errors) for client in clients),
+        'latency_ms': {
+            'p50': round(float(np.percentile(latencies, 50)), 2),
+            'p95': round(float(np.percentile(latencies, 95)), 2),
+            'p99': round(float(np.percentile(latencies, 99)), 2),
+            'max': round(float(latencies.max()), 2)
+        } if len(latencies) else None
+    }
+
+
+def run_phase(host, feature_names, args, uploaders, seed):
+    """Run the interactive clients for one phase, with the given uploaders running alongside"""
+    clients = [InteractiveClient(host, feature_names, args.rate / args.clients, seed + i) for i in range(args.clients)]
+    upload_threads = [threading.Thread(target=uploader.run) for uploader in uploaders]
+    for thread in upload_threads:
+        thread.start()
+
+    # Let the uploads get going before measuring
+    if uploaders:
+        time.sleep(args.ramp)
+
+    start_at = time.monotonic() + 0.5
+    threads = [
+        threading.Thread(target=client.run, args=(start_at + i / args.rate, args.duration))
+        for i, client in enumerate(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for uploader in uploaders:
+        uploader.stop.set()
+    for thread in upload_threads:
+        thread.join()
+
+    report = summarize(clients)
+    if uploaders:
+        durations = [duration for uploader in uploaders for duration in uploader.durations]
+        report['uploads'] = {
+            'completed': len(durations),
+            'rejected': sum(uploader.rejected for uploader in uploaders),
+            'errors': sum(len(uploader.errors) for uploader in uploaders),
+            'error_samples': [error for uploader in uploaders for error in uploader.errors][:3],
+            'mean_seconds': round(float(np.mean(durations)), 2) if durations else None
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000', help='server to test')
+    parser.add_argument('--spawn-server', action='store_true', help='start a local server for the run')
+    parser.add_argument('--server', choices=['gunicorn', 'werkzeug'],
+                        default='gunicorn' if importlib.util.find_spec('gunicorn') else 'werkzeug',
+                        help='server started by --spawn-server')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes for --spawn-server')
+    parser.add_argument('--env', action='append', default=[], help='KEY=VALUE setting for the spawned server')
+    parser.add_argument('--rate', type=float, default=20.0, help='single predictions per second')
+    parser.add_argument('--clients', type=int, default=4, help='connections sending single predictions')
+    parser.add_argument('--uploaders', type=int, default=2, help='concurrent upload loops in the second phase')
+    parser.add_argument('--upload-rows', type=int, default=50000, help='rows in each uploaded CSV')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds measured in each phase')
+    parser.add_argument('--ramp', type=float, default=3.0, help='seconds uploads run before measuring')
+    parser.add_argument('--tolerance', type=float, default=2.0, help='allowed p99 ratio of the upload phase to idle')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic data')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    env_overrides = dict(item.split('=', 1) for item in args.env)
+    server = None
+    base_url = args.url.rstrip('/')
+    if args.spawn_server:
+        server, base_url = spawn_server(args.server, args.workers, env_overrides)
+
+    try:
+        host = urlsplit(base_url).netloc
+        feature_names = fetch_features(host)
+        body, content_type = build_upload(feature_names, args.upload_rows, args.seed)
+
+        idle = run_phase(host, feature_names, args, [], args.seed)
+        uploaders = [Uploader(host, body, content_type) for _ in range(args.uploaders)]
+        loaded = run_phase(host, feature_names, args, uploaders, args.seed + 1000)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'url': base_url,
+        'server': args.server if args.spawn_server else None,
+        'settings': env_overrides,
+        'rate': args.rate,
+        'uploaders': args.uploaders,
+        'upload_rows': args.upload_rows,
+        'upload_bytes': len(body),
+        'idle': idle,
+        'during_uploads': loaded
+    }
+    idle_p99 = idle['latency_ms'] and idle['latency_ms']['p99']
+    loaded_p99 = loaded['latency_ms'] and loaded['latency_ms']['p99']
+    report['p99_ratio'] = round(loaded_p99 / idle_p99, 2) if idle_p99 and loaded_p99 else None
+    report['flat'] = report['p99_ratio'] is not None and report['p99_ratio'] <= args.tolerance
+
+    print(f"/ p99 idle {idle_p99} ms, during uploads {loaded_p99} ms (x{report['p99_ratio']}), "
+          f"uploads completed {loaded['uploads']['completed']}, rejected {loaded['uploads']['rejected']}, "
+          f"flat={report['flat']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    return 0 if report['flat'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
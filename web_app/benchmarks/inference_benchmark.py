@@ -0,0 +1,286 @@
+"""Benchmark single-row latency, CSV batch throughput and model load time
+
+Generates synthetic rows with the EXPECTED_FEATURES schema plus the extra
+subject_id, session and electrode_quality columns found in real uploads,
+then measures:
+
+- single-row latency (p50/p95/p99) of POST / through home()
+- rows per second and peak RSS of process_csv_data per CSV size, each size
+  in a fresh interpreter so peaks do not carry over
+- model load time
+
+Results are written as JSON. Passing an earlier result file as --baseline
+flags metrics that got worse by more than --tolerance and exits non-zero.
+
+    python benchmarks/inference_benchmark.py --output bench.json
+    python benchmarks/inference_benchmark.py --sizes 1000,10000 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+WEB_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = '1000,10000,100000,1000000'
+
+# Metrics compared against a baseline run, and whether higher is better
+TRACKED_METRICS = {
+    'single_row.p50_ms': False,
+    'single_row.p95_ms': False,
+    'single_row.p99_ms': False,
+    'model_load.median_seconds': False,
+    'batch.rows_per_second': True,
+    'batch.peak_rss_mb': False
+}
+
+ELECTRODE_QUALITIES = ['excellent', 'good', 'fair', 'poor']
+
+
+def import_app():
+    """Import the app (which loads the model) and return it with the import time"""
+    sys.path.insert(0, WEB_APP_DIR)
+    start = time.perf_counter()
+    import app
+    return app, time.perf_counter() - start
+
+
+def feature_distribution(app):
+    """Return per-feature means and scales, taken from the model's scaler if it has one"""
+    n_features = len(app.EXPECTED_FEATURES)
+    steps = getattr(app.model_registry.current.estimator, 'named_steps', {})
+    for step in steps.values():
+        if hasattr(step, 'mean_') and hasattr(step, 'scale_') and len(step.mean_) == n_features:
+            return np.asarray(step.mean_, dtype=float), np.asarray(step.scale_, dtype=float)
+    return np.zeros(n_features), np.ones(n_features)
+
+
+def generate_frame(feature_names, means, scales, n_rows, seed=0):
+    """Build a synthetic upload with the feature columns and the usual extra columns"""
+    rng = np.random.default_rng(seed)
+    values = rng.standard_normal((n_rows, len(feature_names))) * scales + means
+    df = pd.DataFrame(np.round(values, 4), columns=feature_names)
+    df['subject_id'] = np.char.add('S', np.char.zfill(rng.integers(1, 500, n_rows).astype(str), 3))
+    df['session'] = rng.integers(1, 5, n_rows)
+    df['electrode_quality'] = rng.choice(ELECTRODE_QUALITIES, n_rows)
+    return df
+
+
+def percentiles(samples):
+    """Summarize latency samples in milliseconds"""
+    ms = np.asarray(samples) * 1000
+    return {
+        'requests': len(ms),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'max_ms': round(float(ms.max()), 4)
+    }
+
+
+def bench_single_row(app, n_requests, warmup, seed):
+    """Time POST / with a distinct row per request so the prediction cache never hits"""
+    means, scales = feature_distribution(app)
+    rows = generate_frame(app.EXPECTED_FEATURES, means, scales, n_requests + warmup, seed)
+    forms = rows[app.EXPECTED_FEATURES].astype(str).to_dict('records')
+
+    client = app.app.test_client()
+    samples = []
+    for i, form in enumerate(forms):
+        start = time.perf_counter()
+        # Closing the response releases its admission slot
+        with client.post('/', data=form) as response:
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError(f"POST / returned {response.status_code}")
+        if i >= warmup:
+            samples.append(elapsed)
+
+    return percentiles(samples)
+
+
+def bench_model_load(app, repeats):
+    """Time repeated calls to load_model with a warm page cache"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        if not app.load_model():
+            raise RuntimeError("Model failed to load")
+        samples.append(time.perf_counter() - start)
+
+    return {
+        'repeats': repeats,
+        'min_seconds': round(min(samples), 4),
+        'median_seconds': round(float(np.median(samples)), 4)
+    }
+
+
+def stage_totals(app):
+    """Return the seconds recorded per processing stage so far"""
+    return {
+        labels.split('"')[1]: round(value, 4)
+        for name, labels, value in app.stage_seconds.samples()
+        if name.endswith('_sum')
+    }
+
+
+def batch_worker(csv_path):
+    """Child process: score one CSV through process_csv_data and report the numbers"""
+    app, import_seconds = import_app()
+    app.warm_up_model(app.model_registry.current)
+
+    with open(csv_path) as f:
+        csv_content = f.read()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    stages_before = stage_totals(app)
+
+    start = time.perf_counter()
+    result = app.process_csv_data(csv_content)
+    elapsed = time.perf_counter() - start
+    if result[0] is None:
+        raise RuntimeError(result[1])
+
+    output_df, errors, _, _ = result
+    stages = stage_totals(app)
+    print(json.dumps({
+        'rows': len(output_df),
+        'errors': len(errors),
+        'seconds': round(elapsed, 4),
+        'rows_per_second': round(len(output_df) / elapsed, 1),
+        'rss_before_mb': round(rss_before, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'import_seconds': round(import_seconds, 4),
+        'stage_seconds': {stage: round(seconds - stages_before.get(stage, 0.0), 4) for stage, seconds in stages.items()}
+    }), flush=True)
+
+
+def bench_batch(app, sizes, seed, workdir):
+    """Write one synthetic CSV per size and score each in a fresh interpreter"""
+    means, scales = feature_distribution(app)
+    results = {}
+
+    for n_rows in sizes:
+        csv_path = os.path.join(workdir, f"bench_{n_rows}.csv")
+        generate_frame(app.EXPECTED_FEATURES, means, scales, n_rows, seed).to_csv(csv_path, index=False)
+        csv_mb = round(os.path.getsize(csv_path) / 1024 / 1024, 1)
+
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--batch-worker', csv_path],
+            cwd=workdir, capture_output=True, text=True
+        )
+        os.remove(csv_path)
+        if output.returncode != 0:
+            raise RuntimeError(f"Batch worker failed for {n_rows} rows:\n{output.stderr[-2000:]}")
+
+        result = dict(json.loads(output.stdout.strip().splitlines()[-1]), csv_mb=csv_mb)
+        results[str(n_rows)] = result
+        print(f"{n_rows:>9} rows: {result['rows_per_second']:>10.1f} rows/s, peak RSS {result['peak_rss_mb']} MB", file=sys.stderr)
+
+    return results
+
+
+def flatten(report):
+    """Yield (metric, size, value) for every tracked metric in a report"""
+    for metric in TRACKED_METRICS:
+        section, key = metric.split('.')
+        if section == 'batch':
+            for size, result in report.get('batch', {}).items():
+                yield metric, size, result.get(key)
+        else:
+            yield metric, None, report.get(section, {}).get(key)
+
+
+def compare(report, baseline, tolerance):
+    """Return regressions of report against baseline beyond the relative tolerance"""
+    previous = {(metric, size): value for metric, size, value in flatten(baseline)}
+    regressions = []
+
+    for metric, size, value in flatten(report):
+        old = previous.get((metric, size))
+        if value is None or not old:
+            continue
+
+        change = (value - old) / old
+        worse = -change if TRACKED_METRICS[metric] else change
+        if worse > tolerance:
+            regressions.append({'metric': metric, 'rows': size, 'baseline': old, 'current': value, 'change': round(change, 4)})
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated CSV row counts for the batch benchmark')
+    parser.add_argument('--requests', type=int, default=2000, help='single-row requests to time')
+    parser.add_argument('--warmup', type=int, default=100, help='untimed single-row requests sent first')
+    parser.add_argument('--load-repeats', type=int, default=5, help='times to reload the model')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic data')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='relative slowdown reported as a regression')
+    parser.add_argument('--batch-worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.batch_worker:
+        return batch_worker(args.batch_worker)
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # The app writes temp files relative to the working directory
+        os.chdir(workdir)
+        app, import_seconds = import_app()
+
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'cpu_count': os.cpu_count(),
+                'machine': platform.machine()
+            },
+            'config': {
+                key: app.app.config[key]
+                for key in ('USE_COMPILED_MODEL', 'MODEL_MMAP', 'BATCH_REQUESTS', 'PREDICTION_CACHE_SIZE')
+            },
+            'model_fingerprint': app.model_registry.current.fingerprint
+        }
+
+        report['model_load'] = dict(bench_model_load(app, args.load_repeats), import_seconds=round(import_seconds, 4))
+        print(f"model load: {report['model_load']}", file=sys.stderr)
+
+        report['single_row'] = bench_single_row(app, args.requests, args.warmup, args.seed)
+        print(f"single row: {report['single_row']}", file=sys.stderr)
+
+        sizes = [int(size) for size in args.sizes.split(',') if size]
+        report['batch'] = bench_batch(app, sizes, args.seed, workdir)
+
+    exit_code = 0
+    if baseline_path:
+        with open(baseline_path) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+        for regression in report['regressions']:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        exit_code = 1 if report['regressions'] else 0
+
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Measure model cold-start time and per-worker memory for each serving mode
+
+Starts N worker processes per mode, waits until all of them have loaded the
+model, then reads each worker's RSS, PSS and USS from /proc. PSS splits
+shared pages between the processes mapping them, so it is the number that
+drops when workers share the model.
+
+    python benchmarks/startup_benchmark.py --workers 4 --output startup.json
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+WEB_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# FLASK_* overrides for each independently started worker mode
+MODES = {
+    'pickle': {'FLASK_USE_COMPILED_MODEL': 'false', 'FLASK_MODEL_MMAP': 'false'},
+    'compiled': {'FLASK_USE_COMPILED_MODEL': 'true', 'FLASK_MODEL_MMAP': 'false'},
+    'mmap': {'FLASK_USE_COMPILED_MODEL': 'true', 'FLASK_MODEL_MMAP': 'true'}
+}
+
+
+def read_memory(pid='self'):
+    """Return RSS, PSS and USS in MB for a process (Linux only)"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[key] = int(value.split()[0])
+    except OSError:
+        return {'rss_mb': None, 'pss_mb': None, 'uss_mb': None}
+
+    return {
+        'rss_mb': round(fields.get('Rss', 0) / 1024, 1),
+        'pss_mb': round(fields.get('Pss', 0) / 1024, 1),
+        'uss_mb': round((fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024, 1)
+    }
+
+
+def load_app():
+    """Import the app (which loads the model) and return the load time"""
+    sys.path.insert(0, WEB_APP_DIR)
+    start = time.perf_counter()
+    import app
+    app.warm_up_model(app.model_registry.current)
+    return time.perf_counter() - start
+
+
+def worker_main():
+    """Child process: load, report, wait for the measure signal, report memory"""
+    load_seconds = load_app()
+    print(json.dumps({'load_seconds': load_seconds}), flush=True)
+    sys.stdin.readline()
+    print(json.dumps(read_memory()), flush=True)
+
+
+def preload_main(n_workers):
+    """Load once, fork workers that share the model, and report their memory"""
+    load_seconds = load_app()
+    gc.freeze()
+
+    children = []
+    for _ in range(n_workers):
+        ready_read, ready_write = os.pipe()
+        go_read, go_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Forked worker: serve a few predictions, then wait to be measured
+            import app
+            fork_start = time.perf_counter()
+            app.warm_up_model(app.model_registry.current)
+            os.write(ready_write, json.dumps({'load_seconds': time.perf_counter() - fork_start}).encode())
+            os.read(go_read, 1)
+            os._exit(0)
+        children.append((pid, ready_read, go_write))
+
+    results = []
+    for pid, ready_read, _ in children:
+        results.append(json.loads(os.read(ready_read, 4096)))
+    for (pid, _, _), result in zip(children, results):
+        result.update(read_memory(pid))
+    for pid, _, go_write in children:
+        os.write(go_write, b'x')
+        os.waitpid(pid, 0)
+
+    print(json.dumps({'master_load_seconds': load_seconds, 'workers': results}), flush=True)
+
+
+def run_mode(mode, n_workers, workdir):
+    """Start n_workers fresh interpreters in one mode and collect their numbers"""
+    env = dict(os.environ, **MODES[mode])
+    workers = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker'],
+            cwd=workdir, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True
+        )
+        for _ in range(n_workers)
+    ]
+
+    results = [json.loads(worker.stdout.readline()) for worker in workers]
+    for worker, result in zip(workers, results):
+        worker.stdin.write('\n')
+        worker.stdin.flush()
+        result.update(json.loads(worker.stdout.readline()))
+        worker.wait()
+
+    return results
+
+
+def run_preload(n_workers, workdir):
+    """Run the pre-fork mode in its own interpreter"""
+    env = dict(os.environ, **MODES['mmap'])
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--preload-worker', str(n_workers)],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['workers'], result['master_load_seconds']
+
+
+def summarize(results):
+    """Average the per-worker numbers of one mode"""
+    summary = {'workers': len(results)}
+    for key in ('load_seconds', 'rss_mb', 'pss_mb', 'uss_mb'):
+        values = [result[key] for result in results if result.get(key) is not None]
+        summary[f"mean_{key}"] = round(sum(values) / len(values), 4) if values else None
+        summary[f"total_{key}"] = round(sum(values), 4) if values else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='worker processes per mode')
+    parser.add_argument('--modes', default='pickle,compiled,mmap,preload', help='comma-separated modes to run')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--preload-worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker_main()
+    if args.preload_worker:
+        return preload_main(args.preload_worker)
+
+    report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'workers': args.workers, 'modes': {}}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Build the compiled artifact once so the mmap modes measure a warm disk
+        run_mode('mmap', 1, workdir)
+
+        for mode in args.modes.split(','):
+            if mode == 'preload':
+                results, master_load_seconds = run_preload(args.workers, workdir)
+                report['modes'][mode] = dict(summarize(results), master_load_seconds=round(master_load_seconds, 4))
+            else:
+                report['modes'][mode] = summarize(run_mode(mode, args.workers, workdir))
+            print(f"{mode:>9}: {report['modes'][mode]}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
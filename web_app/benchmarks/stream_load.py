@@ -0,0 +1,226 @@
+"""Load-test the streaming session endpoints with N concurrent sessions
+
+Each simulated headset opens a session, pushes feature frames at a fixed
+rate for the test duration and, with --listen, also follows the session's
+server-sent events. The run passes when every session kept its frame rate
+without errors.
+
+    python benchmarks/stream_load.py --spawn-server --sessions 50 --rate 10 --duration 30
+    python benchmarks/stream_load.py --url http://localhost:8000 --sessions 200 --output stream.json
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+WEB_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+N_FEATURES = 45
+
+SERVER_SCRIPT = (
+    "import sys; from werkzeug.serving import run_simple; import app; "
+    "run_simple('127.0.0.1', int(sys.argv[1]), app.app, threaded=True)"
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spawn_server():
+    """Start the app in a threaded server on a free port and wait until it is healthy"""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-c', SERVER_SCRIPT, str(port)],
+        cwd=WEB_APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return server, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+
+    server.kill()
+    raise RuntimeError("Server did not become healthy within 60 seconds")
+
+
+class SimulatedSession:
+    """One headset pushing frames at a fixed rate over a keep-alive connection"""
+
+    def __init__(self, base_url, index, rate, frames_per_push, duration, listen, seed):
+        self.host = urlsplit(base_url).netloc
+        self.subject_id = f"LOAD{index:04d}"
+        self.rate = rate
+        self.frames_per_push = frames_per_push
+        self.duration = duration
+        self.listen = listen
+        self.rng = np.random.default_rng(seed + index)
+        self.latencies = []
+        self.frames_sent = 0
+        self.events_received = 0
+        self.errors = []
+        self.session_id = None
+
+    def request(self, connection, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = connection.getresponse()
+        payload = json.loads(response.read() or b'{}')
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status}: {payload.get('error')}")
+        return payload
+
+    def run(self, start_at):
+        connection = http.client.HTTPConnection(self.host, timeout=30)
+        try:
+            session = self.request(connection, 'POST', '/stream/sessions', {'subject_id': self.subject_id, 'session': 1})
+            self.session_id = session['session_id']
+
+            listener = None
+            if self.listen:
+                listener = threading.Thread(target=self.follow_events, daemon=True)
+                listener.start()
+
+            # Push on a fixed schedule; a slow server pushes the whole schedule back
+            interval = self.frames_per_push / self.rate
+            next_push = start_at
+            while next_push < start_at + self.duration:
+                time.sleep(max(next_push - time.monotonic(), 0))
+                frames = self.rng.normal(size=(self.frames_per_push, N_FEATURES)) * 100
+                sent = time.perf_counter()
+                self.request(connection, 'POST', session['frames_url'], {'rows': frames.round(4).tolist()})
+                self.latencies.append(time.perf_counter() - sent)
+                self.frames_sent += self.frames_per_push
+                next_push += interval
+
+            self.request(connection, 'DELETE', f"/stream/sessions/{self.session_id}")
+            if listener is not None:
+                listener.join(timeout=5)
+        except Exception as e:
+            self.errors.append(str(e))
+        finally:
+            connection.close()
+
+    def follow_events(self):
+        """Count prediction events until the session is closed"""
+        connection = http.client.HTTPConnection(self.host, timeout=60)
+        try:
+            connection.request('GET', f"/stream/sessions/{self.session_id}/events")
+            response = connection.getresponse()
+            for line in response:
+                if line.startswith(b'event: prediction'):
+                    self.events_received += 1
+                elif line.startswith(b'event: closed'):
+                    break
+        except Exception as e:
+            self.errors.append(f"events: {str(e)}")
+        finally:
+            connection.close()
+
+
+def run_load(base_url, args):
+    sessions = [
+        SimulatedSession(base_url, i, args.rate, args.frames_per_push, args.duration, args.listen, args.seed)
+        for i in range(args.sessions)
+    ]
+
+    # Stagger starts across one push interval so pushes do not arrive in lockstep
+    start_at = time.monotonic() + 1.0
+    interval = args.frames_per_push / args.rate
+    threads = [
+        threading.Thread(target=session.run, args=(start_at + interval * i / len(sessions),))
+        for i, session in enumerate(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start_at
+
+    latencies = np.array([latency for session in sessions for latency in session.latencies]) * 1000
+    frames_sent = sum(session.frames_sent for session in sessions)
+    expected_frames = args.sessions * args.rate * args.duration
+    errors = [error for session in sessions for error in session.errors]
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'url': base_url,
+        'sessions': args.sessions,
+        'rate_per_session': args.rate,
+        'frames_per_push': args.frames_per_push,
+        'duration_seconds': args.duration,
+        'frames_sent': frames_sent,
+        'expected_frames': int(expected_frames),
+        'frames_per_second': round(frames_sent / elapsed, 1),
+        'push_latency_ms': {
+            'p50': round(float(np.percentile(latencies, 50)), 3),
+            'p95': round(float(np.percentile(latencies, 95)), 3),
+            'p99': round(float(np.percentile(latencies, 99)), 3),
+            'max': round(float(latencies.max()), 3)
+        } if len(latencies) else None,
+        'errors': len(errors),
+        'error_samples': errors[:5]
+    }
+    if args.listen:
+        report['events_received'] = sum(session.events_received for session in sessions)
+
+    # Late pushes stretch the run, so a server that cannot keep up lowers frames_per_second
+    report['target_frames_per_second'] = args.sessions * args.rate
+    report['sustained'] = not errors and report['frames_per_second'] >= 0.95 * report['target_frames_per_second']
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000', help='server to test')
+    parser.add_argument('--spawn-server', action='store_true', help='start a local threaded server for the run')
+    parser.add_argument('--sessions', type=int, default=50, help='concurrent streaming sessions')
+    parser.add_argument('--rate', type=float, default=10.0, help='frames per second per session')
+    parser.add_argument('--frames-per-push', type=int, default=1, help='frames sent in each request')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds each session streams')
+    parser.add_argument('--listen', action='store_true', help='also follow each session over server-sent events')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the synthetic frames')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url.rstrip('/')
+    if args.spawn_server:
+        server, base_url = spawn_server()
+
+    try:
+        report = run_load(base_url, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"{report['sessions']} sessions: {report['frames_per_second']} frames/s, "
+          f"p99 push {report['push_latency_ms'] and report['push_latency_ms']['p99']} ms, "
+          f"{report['errors']} errors, sustained={report['sustained']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    return 0 if report['sustained'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""Build smaller, faster variants of brain_signals.pkl and report what they cost
+
+A variant combines any of these changes to the served forest:
+
+    trees=N     keep N trees, picked by greedy forward selection on held-out rows
+    depth=D     cut every tree at depth D; cut nodes become leaves with their class mix
+    merge=T     merge sibling leaves whose class probabilities differ by at most T
+    float32     serve the compiled forest with float32 thresholds
+
+Each variant is written next to the model as brain_signals.<name>.pkl with
+its metadata, and the report lists accuracy on held-out rows next to
+single-row latency, batch throughput and memory for every variant and the
+original model. Serve one with FLASK_MODEL_VARIANT=<name>.
+
+    python compact_model.py --data ../emotions.csv
+    python compact_model.py --data holdout.csv --no-split --variant trees=30 --variant trees=30,depth=10,float32
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.tree._tree import TREE_LEAF, TREE_UNDEFINED, Tree
+
+from compiled_forest import compile_model, check_parity
+from csv_ingest import DEFAULT_ENGINE
+from model_metadata import read_model_metadata, variant_path, write_model_metadata
+from prediction_cache import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+WEB_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Built when no --variant is given
+DEFAULT_VARIANTS = [
+    'float32', 'trees=50', 'trees=25', 'depth=10', 'depth=8', 'merge=0.2', 'trees=25,depth=10,float32'
+]
+
+# Single-row predictions timed per variant, and rows per timed batch
+LATENCY_REPEATS = 500
+BATCH_ROWS = 10000
+
+
+def parse_variant(spec):
+    """Turn 'trees=30,depth=10,float32' into settings and a file-safe name"""
+    settings = {'trees': None, 'depth': None, 'merge': None, 'float32': False}
+    for part in filter(None, spec.split(',')):
+        name, _, value = part.partition('=')
+        if name == 'float32' and not value:
+            settings['float32'] = True
+        elif name in ('trees', 'depth') and value.isdigit() and int(value) > 0:
+            settings[name] = int(value)
+        elif name == 'merge' and value:
+            settings['merge'] = float(value)
+        else:
+            raise ValueError(f"Invalid variant setting '{part}' in '{spec}'")
+
+    parts = [f"{name}{settings[name]}" for name in ('trees', 'depth', 'merge') if settings[name] is not None]
+    if settings['float32']:
+        parts.append('float32')
+    if not parts:
+        raise ValueError(f"Variant '{spec}' changes nothing")
+    return settings, '-'.join(parts)
+
+
+def load_holdout(data_path, label_column, metadata, split, random_state):
+    """Return held-out (X, y) in model feature order with labels as class indices
+
+    With split, the rows are the test part of the split train.py made, so
+    they are rows the model was not fitted on when data_path is the
+    training export.
+    """
+    frame = pd.read_csv(data_path, engine=DEFAULT_ENGINE)
+    missing = [name for name in metadata['features'] + [label_column] if name not in frame.columns]
+    if missing:
+        raise ValueError(f"{data_path} is missing columns: {', '.join(missing[:10])}")
+
+    X = frame[metadata['features']].to_numpy(dtype=np.float64)
+    labels = frame[label_column]
+    classes = metadata.get('classes', [])
+    if labels.dtype == object or pd.api.types.is_string_dtype(labels):
+        unknown = set(labels) - set(classes)
+        if unknown:
+            raise ValueError(f"Labels not in the model's classes {classes}: {sorted(unknown)[:5]}")
+        y = labels.map({name: i for i, name in enumerate(classes)}).to_numpy()
+    else:
+        y = labels.to_numpy(dtype=int)
+
+    if split:
+        params = metadata.get('params', {})
+        _, X, _, y = train_test_split(
+            X, y, test_size=params.get('test_size', 0.2),
+            random_state=params.get('random_state', random_state), stratify=y
+        )
+    return X, y
+
+
+def tree_probabilities(forest, X_scaled):
+    """Return (n_trees, n_rows, n_classes) probabilities of each tree"""
+    X_scaled = X_scaled.astype(np.float32)
+    return np.stack([tree.predict_proba(X_scaled) for tree in forest.estimators_])
+
+
+def greedy_tree_order(tree_proba, y, n_trees):
+    """Pick trees one at a time, each time the one that most improves the ensemble
+
+    Candidates are ranked by held-out accuracy of the averaged probabilities,
+    then by log loss, so the first k picked trees form the selected k-tree
+    ensemble for every k.
+    """
+    remaining = list(range(len(tree_proba)))
+    order = []
+    total = np.zeros(tree_proba.shape[1:])
+    rows = np.arange(len(y))
+
+    for _ in range(min(n_trees, len(remaining))):
+        candidates = (total + tree_proba[remaining]) / (len(order) + 1)
+        accuracy = (candidates.argmax(axis=2) == y).mean(axis=1)
+        log_loss = -np.log(np.clip(candidates[:, rows, y], 1e-15, None)).mean(axis=1)
+        best = min(range(len(remaining)), key=lambda i: (-accuracy[i], log_loss[i]))
+        order.append(remaining.pop(best))
+        total += tree_proba[order[-1]]
+
+    return order
+
+
+def prune_tree(tree, max_depth=None, merge_tolerance=None):
+    """Return a copy of a fitted tree cut at max_depth, with similar sibling leaves merged
+
+    A cut or merged node keeps the class distribution it had during
+    fitting, which is what a tree grown to that depth would predict.
+    """
+    state = tree.tree_.__getstate__()
+    nodes = state['nodes']
+    left = nodes['left_child']
+    right = nodes['right_child']
+    n_nodes = len(nodes)
+
+    # Children always come after their parent in sklearn's node order
+    depth = np.zeros(n_nodes, dtype=int)
+    for node in range(n_nodes):
+        if left[node] != TREE_LEAF:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+
+    is_leaf = left == TREE_LEAF
+    if max_depth is not None:
+        is_leaf |= depth >= max_depth
+
+    if merge_tolerance is not None:
+        proba = state['values'][:, 0, :]
+        proba = proba / np.maximum(proba.sum(axis=1, keepdims=True), np.finfo(float).tiny)
+        # Bottom-up, so merged pairs can merge again with their sibling
+        for node in range(n_nodes - 1, -1, -1):
+            if not is_leaf[node] and is_leaf[left[node]] and is_leaf[right[node]]:
+                if np.abs(proba[left[node]] - proba[right[node]]).max() <= merge_tolerance:
+                    is_leaf[node] = True
+
+    # Keep the nodes still reachable, renumbered in depth-first order
+    keep = []
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        keep.append(node)
+        if not is_leaf[node]:
+            stack.extend((right[node], left[node]))
+    keep = np.array(keep)
+    new_ids = np.full(n_nodes, TREE_LEAF)
+    new_ids[keep] = np.arange(len(keep))
+
+    kept_leaf = is_leaf[keep]
+    pruned_nodes = nodes[keep]
+    pruned_nodes['left_child'] = np.where(kept_leaf, TREE_LEAF, new_ids[np.where(kept_leaf, 0, left[keep])])
+    pruned_nodes['right_child'] = np.where(kept_leaf, TREE_LEAF, new_ids[np.where(kept_leaf, 0, right[keep])])
+    pruned_nodes['feature'][kept_leaf] = TREE_UNDEFINED
+    pruned_nodes['threshold'][kept_leaf] = TREE_UNDEFINED
+    pruned_nodes['missing_go_to_left'][kept_leaf] = 0
+
+    pruned_tree = Tree(*tree.tree_.__reduce__()[1])
+    pruned_tree.__setstate__(dict(
+        state,
+        max_depth=int(depth[keep].max()),
+        node_count=len(keep),
+        nodes=np.ascontiguousarray(pruned_nodes),
+        values=np.ascontiguousarray(state['values'][keep])
+    ))
+
+    pruned = copy.copy(tree)
+    pruned.tree_ = pruned_tree
+    return pruned
+
+
+def build_variant(model, settings, tree_order):
+    """Return a copy of the model pipeline with the variant's trees"""
+    variant = copy.deepcopy(model)
+    forest = variant.steps[-1][1]
+    selected = tree_order[:settings['trees']] if settings['trees'] else range(len(forest.estimators_))
+
+    forest.estimators_ = [
+        prune_tree(forest.estimators_[i], settings['depth'], settings['merge'])
+        if settings['depth'] is not None or settings['merge'] is not None else forest.estimators_[i]
+        for i in selected
+    ]
+    forest.n_estimators = len(forest.estimators_)
+    return variant
+
+
+def tree_bytes(forest):
+    """Memory of the sklearn node and value arrays"""
+    total = 0
+    for tree in forest.estimators_:
+        state = tree.tree_.__getstate__()
+        total += state['nodes'].nbytes + state['values'].nbytes
+    return total
+
+
+def measure(model, threshold_dtype, X, y, base_predictions):
+    """Return accuracy, latency and memory of a model as the app would serve it
+
+    compiled_parity is False when the compiled forest does not reproduce
+    predict_proba; the app then serves single rows from sklearn, and so
+    does the latency measurement.
+    """
+    forest = model.steps[-1][1]
+    compiled = compile_model(model, threshold_dtype)
+    parity = check_parity(model, compiled)
+    single_row_model = compiled if parity else model
+
+    predictions = single_row_model.predict(X)
+
+    # Single rows go through the compiled forest, as in the app
+    for i in range(50):
+        single_row_model.predict_proba(X[i % len(X):i % len(X) + 1])
+    latencies = []
+    for i in range(LATENCY_REPEATS):
+        row = X[i % len(X):i % len(X) + 1]
+        start = time.perf_counter()
+        single_row_model.predict_proba(row)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1e6
+
+    # Large batches go through sklearn
+    batch = np.resize(X, (BATCH_ROWS, X.shape[1]))
+    model.predict_proba(batch[:100])
+    start = time.perf_counter()
+    model.predict_proba(batch)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        'accuracy': round(float((predictions == y).mean()), 4),
+        'agreement_with_base': round(float((predictions == base_predictions).mean()), 4),
+        'trees': forest.n_estimators,
+        'nodes': int(sum(tree.tree_.node_count for tree in forest.estimators_)),
+        'max_depth': int(max(tree.tree_.max_depth for tree in forest.estimators_)),
+        'single_row_us': {
+            'p50': round(float(np.percentile(latencies, 50)), 1),
+            'p99': round(float(np.percentile(latencies, 99)), 1)
+        },
+        'batch_rows_per_second': round(BATCH_ROWS / batch_seconds),
+        'tree_bytes': tree_bytes(forest),
+        'compiled_bytes': int(compiled.nbytes),
+        'compiled_parity': parity,
+        'threshold_dtype': threshold_dtype
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.path.join(WEB_APP_DIR, 'brain_signals.pkl'), help='model to compact')
+    parser.add_argument('--data', required=True, help='labelled feature export with the model features')
+    parser.add_argument('--label', default='label', help='name of the label column')
+    parser.add_argument('--no-split', dest='split', action='store_false',
+                        help="use every row of --data instead of the test split recorded by train.py")
+    parser.add_argument('--variant', action='append', help='variant to build, e.g. trees=30,depth=10,float32 (repeatable)')
+    parser.add_argument('--selection-fraction', type=float, default=0.5,
+                        help='share of the held-out rows used to choose trees; the rest measures accuracy')
+    parser.add_argument('--seed', type=int, default=42, help='random state for splitting the held-out rows')
+    parser.add_argument('--dry-run', action='store_true', help='report without writing variant files')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        variants = [parse_variant(spec) for spec in args.variant or DEFAULT_VARIANTS]
+    except ValueError as e:
+        parser.error(str(e))
+
+    model = joblib.load(args.model)
+    metadata = read_model_metadata(args.model)
+    forest = model.steps[-1][1]
+    if not isinstance(forest, RandomForestClassifier):
+        parser.error(f"{args.model} does not end in a RandomForestClassifier")
+
+    X, y = load_holdout(args.data, args.label, metadata, args.split, args.seed)
+    X_select, X_eval, y_select, y_eval = train_test_split(
+        X, y, train_size=args.selection_fraction, random_state=args.seed, stratify=y
+    )
+    logger.info("Held-out rows: %d for tree selection, %d for evaluation", len(y_select), len(y_eval))
+
+    # One greedy order serves every tree count
+    X_select_scaled = model[:-1].transform(X_select) if len(model.steps) > 1 else X_select
+    max_trees = max([settings['trees'] or 0 for settings, _ in variants])
+    tree_order = greedy_tree_order(tree_probabilities(forest, X_select_scaled), y_select, max_trees)
+
+    base_predictions = model.predict(X_eval)
+    report = {
+        'model': os.path.abspath(args.model),
+        'model_fingerprint': file_fingerprint(args.model),
+        'selection_rows': len(y_select),
+        'evaluation_rows': len(y_eval),
+        'variants': {'base': measure(model, 'float64', X_eval, y_eval, base_predictions)}
+    }
+
+    for settings, name in variants:
+        variant = build_variant(model, settings, tree_order)
+        threshold_dtype = 'float32' if settings['float32'] else 'float64'
+        result = measure(variant, threshold_dtype, X_eval, y_eval, base_predictions)
+
+        # A variant the app could not serve from its compiled forest is reported but not written
+        if not result['compiled_parity']:
+            result['rejected'] = 'compiled forest does not match predict_proba'
+            logger.warning("Variant %s rejected: %s", name, result['rejected'])
+        elif not args.dry_run:
+            path = variant_path(args.model, name)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            joblib.dump(variant, tmp_path)
+            result['file'] = os.path.basename(path)
+            result['file_bytes'] = os.path.getsize(tmp_path)
+            write_model_metadata(path, dict(
+                metadata,
+                model_file=os.path.basename(path),
+                version=f"{metadata['version']}-{name}" if metadata.get('version') else None,
+                compiled_threshold_dtype=threshold_dtype,
+                variant={
+                    'name': name,
+                    'settings': settings,
+                    'base_model': os.path.basename(args.model),
+                    'base_fingerprint': report['model_fingerprint'],
+                    'measurements': result
+                }
+            ))
+            # Moved into place after its metadata, so a running app never pairs it with old metadata
+            os.replace(tmp_path, path)
+        report['variants'][name] = result
+
+    for name, result in report['variants'].items():
+        print(f"{name:28s} accuracy {result['accuracy']:.4f}  agreement {result['agreement_with_base']:.4f}  "
+              f"trees {result['trees']:3d}  nodes {result['nodes']:6d}  "
+              f"p50 {result['single_row_us']['p50']:7.1f}us  p99 {result['single_row_us']['p99']:7.1f}us  "
+              f"batch {result['batch_rows_per_second']:8d} rows/s  compiled {result['compiled_bytes'] / 1024:7.1f}KB"
+              f"{'' if result['compiled_parity'] else '  REJECTED: no compiled parity'}",
+              file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
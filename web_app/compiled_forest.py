@@ -0,0 +1,431 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Arrays stored as .npy files in a compiled model artifact directory
+ARTIFACT_ARRAYS = ('feature', 'threshold', 'left', 'right', 'leaf_proba', 'roots', 'classes_')
+ARTIFACT_VERSION = 1
+
+# Scaler arrays stored with float32 artifacts, which compare scaled features
+SCALER_ARRAYS = ('mean', 'scale')
+
+THRESHOLD_DTYPES = ('float64', 'float32')
+
+# Held while a process compiles into an artifact directory
+COMPILE_LOCK = '.compile.lock'
+
+# Sign bit and magnitude mask for float64 bit patterns
+_SIGN_BIT = np.int64(-0x8000000000000000)
+_MAGNITUDE_MASK = np.int64(0x7FFFFFFFFFFFFFFF)
+
+
+def _float_to_key(values):
+    """Map float64 values to int64 keys that sort in the same order"""
+    bits = np.asarray(values, dtype=np.float64).view(np.int64)
+    return np.where(bits < 0, -(bits & _MAGNITUDE_MASK), bits)
+
+
+def _key_to_float(keys):
+    """Inverse of _float_to_key"""
+    keys = np.asarray(keys, dtype=np.int64)
+    bits = np.where(keys < 0, (-keys) | _SIGN_BIT, keys)
+    return bits.view(np.float64)
+
+
+def fold_scaler_thresholds(thresholds, mean, scale):
+    """Translate split thresholds on scaled features into raw feature space
+
+    The fitted trees compare float32((x - mean) / scale) <= threshold. That
+    function of x is monotone, so for each node there is a largest float64
+    raw value that still goes left. It is found by bisection over the
+    ordered float64 bit patterns, which makes the folded comparison
+    x <= raw_threshold take exactly the same branch as sklearn for every
+    finite input.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    mean = np.asarray(mean, dtype=np.float64)
+    scale = np.asarray(scale, dtype=np.float64)
+
+    def goes_left(x):
+        scaled = ((x - mean) / scale).astype(np.float32).astype(np.float64)
+        return scaled <= thresholds
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        lo = np.full(thresholds.shape, _float_to_key(-np.inf), dtype=np.int64)
+        hi = np.full(thresholds.shape, _float_to_key(np.inf), dtype=np.int64)
+
+        # Invariant: goes_left(lo) is true and goes_left(hi) is false
+        all_left = goes_left(_key_to_float(hi))
+        none_left = ~goes_left(_key_to_float(lo))
+        searching = ~(all_left | none_left)
+
+        while True:
+            # Midpoint without overflowing the int64 key range
+            mid = (lo >> 1) + (hi >> 1) + (lo & hi & 1)
+            open_gap = searching & (mid > lo) & (mid < hi)
+            if not open_gap.any():
+                break
+            left = goes_left(_key_to_float(mid))
+            lo = np.where(open_gap & left, mid, lo)
+            hi = np.where(open_gap & ~left, mid, hi)
+
+    raw = _key_to_float(lo)
+    raw = np.where(all_left, np.inf, raw)
+    raw = np.where(none_left, -np.inf, raw)
+    return raw
+
+
+def float32_floor(values):
+    """Return the largest float32 not above each value
+
+    sklearn's trees compare float32 features with float64 thresholds, and
+    for a float32 x, x <= t holds exactly when x <= float32_floor(t).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(over='ignore'):
+        rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class CompiledForest:
+    """Array-backed RandomForest inference over flattened node arrays
+
+    With float64 thresholds the scaler is folded into the thresholds and
+    raw features are compared directly. With float32 thresholds, mean and
+    scale are kept and rows are scaled and cast to float32 as the pipeline
+    does, which halves the threshold array for the same predictions. Node
+    indices stay intp: int32 indices are converted on every lookup and
+    double the latency.
+    """
+
+    def __init__(self, feature, threshold, left, right, leaf_proba, roots, classes, max_depth, mean=None, scale=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = max_depth
+        self.mean = mean
+        self.scale = scale
+        self.n_estimators = len(roots)
+        self.n_features_in_ = None
+
+    @property
+    def threshold_dtype(self):
+        return self.threshold.dtype.name
+
+    @property
+    def nbytes(self):
+        """Size of the node and leaf arrays"""
+        arrays = [self.feature, self.threshold, self.left, self.right, self.leaf_proba, self.roots]
+        return sum(array.nbytes for array in arrays + [self.mean, self.scale] if array is not None)
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree for every row"""
+        X = np.asarray(X, dtype=np.float64)
+        if self.mean is not None:
+            X = ((X - self.mean) / self.scale).astype(np.float32)
+        rows = np.arange(len(X))[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (len(X), self.n_estimators))
+
+        # Leaves loop back to themselves, so a fixed number of steps is enough
+        for _ in range(self.max_depth):
+            goes_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(goes_left, self.left[node], self.right[node])
+
+        return node
+
+    def predict_proba(self, X):
+        """Average the per-tree class distributions like RandomForestClassifier"""
+        tree_proba = self.leaf_proba[self.apply(X)]
+
+        # Accumulate trees in estimator order to match sklearn's summation
+        proba = np.cumsum(tree_proba, axis=1)[:, -1]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        """Return the class with the highest averaged probability"""
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def _split_pipeline(estimator):
+    """Return (scaler, forest) for a StandardScaler+RandomForest pipeline"""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    steps = [step for _, step in estimator.steps] if isinstance(estimator, Pipeline) else [estimator]
+    steps = [step for step in steps if step is not None and step != 'passthrough']
+
+    if len(steps) == 1 and isinstance(steps[0], RandomForestClassifier):
+        return None, steps[0]
+    if len(steps) == 2 and isinstance(steps[0], StandardScaler) and isinstance(steps[1], RandomForestClassifier):
+        return steps[0], steps[1]
+
+    raise ValueError(f"Unsupported model layout: {[type(step).__name__ for step in steps]}")
+
+
+def _leaf_values_are_fractions(values):
+    """Whether tree values hold class fractions rather than class counts"""
+    return np.allclose(values.sum(axis=1), 1.0, rtol=0.0, atol=1e-6)
+
+
+def compile_model(estimator, threshold_dtype='float64'):
+    """Compile a fitted StandardScaler+RandomForestClassifier pipeline"""
+    if threshold_dtype not in THRESHOLD_DTYPES:
+        raise ValueError(f"Unsupported threshold dtype: {threshold_dtype}")
+    scaler, forest = _split_pipeline(estimator)
+
+    if forest.n_outputs_ != 1:
+        raise ValueError("Only single-output forests can be compiled")
+
+    n_features = forest.n_features_in_
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+    if scaler is not None:
+        if scaler.mean_ is not None:
+            mean = scaler.mean_
+        if scaler.scale_ is not None:
+            scale = scaler.scale_
+
+    features, thresholds, lefts, rights, leaf_probas, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for tree in forest.estimators_:
+        tree_ = tree.tree_
+        n_nodes = tree_.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree_.children_left == -1
+
+        # Leaves point back to themselves and always take the left branch
+        left = np.where(is_leaf, node_ids, tree_.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree_.children_right) + offset
+        feature = np.where(is_leaf, 0, tree_.feature)
+        threshold = np.where(is_leaf, 0.0, tree_.threshold)
+        if threshold_dtype == 'float32':
+            threshold = float32_floor(threshold)
+        else:
+            threshold = fold_scaler_thresholds(threshold, mean[feature], scale[feature])
+        threshold[is_leaf] = np.inf
+
+        # Leaf values as DecisionTreeClassifier.predict_proba returns them:
+        # scikit-learn 1.4+ stores fractions and uses them as they are, older
+        # trees store class counts that predict_proba normalizes
+        proba = tree_.value[:, 0, :forest.n_classes_].astype(np.float64)
+        if not _leaf_values_are_fractions(proba):
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left)
+        rights.append(right)
+        leaf_probas.append(proba)
+        roots.append(offset)
+
+        offset += n_nodes
+        max_depth = max(max_depth, tree_.max_depth)
+
+    compiled = CompiledForest(
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts).astype(np.intp),
+        right=np.concatenate(rights).astype(np.intp),
+        leaf_proba=np.concatenate(leaf_probas),
+        roots=np.array(roots, dtype=np.intp),
+        classes=np.asarray(forest.classes_),
+        max_depth=max_depth,
+        mean=np.asarray(mean, dtype=np.float64) if threshold_dtype == 'float32' else None,
+        scale=np.asarray(scale, dtype=np.float64) if threshold_dtype == 'float32' else None
+    )
+    compiled.n_features_in_ = n_features
+
+    return compiled
+
+
+def check_parity(estimator, compiled, n_samples=2000, random_state=0):
+    """Check that the compiled model reproduces estimator.predict_proba exactly"""
+    _, forest = _split_pipeline(estimator)
+    rng = np.random.default_rng(random_state)
+
+    # Probe at several magnitudes so both sides of most splits are exercised
+    n_features = compiled.n_features_in_
+    magnitudes = rng.choice([1e-2, 1.0, 1e2, 1e4, 5e4], size=(n_samples, 1))
+    X = rng.normal(size=(n_samples, n_features)) * magnitudes
+
+    # Threaded accumulation makes sklearn's tree order nondeterministic
+    n_jobs = forest.n_jobs
+    forest.n_jobs = 1
+    try:
+        expected = estimator.predict_proba(X)
+    finally:
+        forest.n_jobs = n_jobs
+
+    return np.array_equal(expected, compiled.predict_proba(X))
+
+
+def load_compiled_model(estimator, threshold_dtype='float64'):
+    """Compile an estimator and verify parity, returning None if unusable"""
+    try:
+        start = time.perf_counter()
+        compiled = compile_model(estimator, threshold_dtype)
+        if not check_parity(estimator, compiled):
+            logger.warning("Compiled model does not match predict_proba, using sklearn")
+            return None
+
+        logger.info("Compiled model with %d trees and %d nodes (%s thresholds) in %.2fs",
+                    compiled.n_estimators, len(compiled.feature), threshold_dtype, time.perf_counter() - start)
+        return compiled
+
+    except Exception as e:
+        logger.warning("Model could not be compiled, using sklearn: %s", str(e))
+        return None
+
+
+def artifact_name(source_fingerprint, threshold_dtype):
+    """Return the directory name of the artifact built from a model file with these settings"""
+    return f"{source_fingerprint}-{threshold_dtype}-v{ARTIFACT_VERSION}"
+
+
+def _remove_stale_artifacts(directory, keep):
+    """Delete artifacts other than keep, leaving other processes' unfinished writes alone"""
+    for entry in os.scandir(directory):
+        if entry.name == keep or entry.name.endswith('.tmp') or entry.name.startswith('.'):
+            continue
+        # Processes serving an older model keep their maps; the files go when they unmap
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def save_compiled_artifact(compiled, directory, source_fingerprint):
+    """Write the compiled arrays as uncompressed .npy files that can be memory-mapped
+
+    Each artifact gets its own subdirectory of directory, named by
+    artifact_name(), and is never changed once it is in place, so processes
+    can map it while others write newer ones.
+    """
+    name = artifact_name(source_fingerprint, compiled.threshold_dtype)
+    artifact_directory = os.path.join(directory, name)
+    tmp_directory = f"{artifact_directory}.{os.getpid()}.tmp"
+    os.makedirs(tmp_directory, exist_ok=True)
+
+    names = ARTIFACT_ARRAYS + (SCALER_ARRAYS if compiled.mean is not None else ())
+    for array_name in names:
+        np.save(os.path.join(tmp_directory, f"{array_name}.npy"), np.ascontiguousarray(getattr(compiled, array_name)))
+
+    with open(os.path.join(tmp_directory, 'metadata.json'), 'w') as f:
+        json.dump({
+            'version': ARTIFACT_VERSION,
+            'source_fingerprint': source_fingerprint,
+            'threshold_dtype': compiled.threshold_dtype,
+            'max_depth': int(compiled.max_depth),
+            'n_features_in': int(compiled.n_features_in_)
+        }, f)
+
+    # Renaming a finished directory into place means readers never see a partial artifact
+    try:
+        os.rename(tmp_directory, artifact_directory)
+    except OSError:
+        if not os.path.isdir(artifact_directory):
+            raise
+        # Another process published the same artifact first
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    _remove_stale_artifacts(directory, name)
+
+
+def load_compiled_artifact(directory, source_fingerprint, threshold_dtype='float64', mmap_mode='r'):
+    """Map a compiled artifact built from the given model file, or return None"""
+    artifact_directory = os.path.join(directory, artifact_name(source_fingerprint, threshold_dtype))
+    try:
+        with open(os.path.join(artifact_directory, 'metadata.json')) as f:
+            metadata = json.load(f)
+
+        if metadata.get('version') != ARTIFACT_VERSION or metadata.get('source_fingerprint') != source_fingerprint:
+            return None
+        if metadata.get('threshold_dtype', 'float64') != threshold_dtype:
+            return None
+
+        # Read-only maps share the same page cache pages across worker processes
+        names = ARTIFACT_ARRAYS + (SCALER_ARRAYS if threshold_dtype == 'float32' else ())
+        arrays = {
+            name: np.asarray(np.load(os.path.join(artifact_directory, f"{name}.npy"), mmap_mode=mmap_mode))
+            for name in names
+        }
+    except (OSError, ValueError):
+        # Missing, or removed while it was being read; the caller compiles instead
+        return None
+
+    compiled = CompiledForest(
+        feature=arrays['feature'],
+        threshold=arrays['threshold'],
+        left=arrays['left'],
+        right=arrays['right'],
+        leaf_proba=arrays['leaf_proba'],
+        roots=arrays['roots'],
+        classes=arrays['classes_'],
+        max_depth=metadata['max_depth'],
+        mean=arrays.get('mean'),
+        scale=arrays.get('scale')
+    )
+    compiled.n_features_in_ = metadata['n_features_in']
+
+    return compiled
+
+
+def load_or_compile(estimator, directory, source_fingerprint, threshold_dtype='float64'):
+    """Map a matching compiled artifact, building and saving it first if needed
+
+    Processes that need the same artifact at once, such as workers
+    reloading a new model together, take turns on a lock file: the first
+    compiles and saves it, and the others then map the saved arrays.
+    """
+    compiled = load_compiled_artifact(directory, source_fingerprint, threshold_dtype)
+    if compiled is not None:
+        logger.info("Compiled model mapped from: %s", directory)
+        return compiled
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        lock_file = open(os.path.join(directory, COMPILE_LOCK), 'a')
+    except OSError as e:
+        logger.warning("Compiled model could not be saved to %s: %s", directory, str(e))
+        return load_compiled_model(estimator, threshold_dtype)
+
+    # The lock is released when the file is closed
+    with lock_file:
+        fcntl.lockf(lock_file, fcntl.LOCK_EX)
+        compiled = load_compiled_artifact(directory, source_fingerprint, threshold_dtype)
+        if compiled is not None:
+            logger.info("Compiled model mapped from: %s", directory)
+            return compiled
+
+        compiled = load_compiled_model(estimator, threshold_dtype)
+        if compiled is None:
+            return None
+
+        try:
+            save_compiled_artifact(compiled, directory, source_fingerprint)
+            return load_compiled_artifact(directory, source_fingerprint, threshold_dtype) or compiled
+        except OSError as e:
+            logger.warning("Compiled model could not be saved to %s: %s", directory, str(e))
+            return compiled
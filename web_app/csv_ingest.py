@@ -0,0 +1,358 @@
+"""Column-pruned CSV ingestion
+
+The header is read first and the positions of the model features are
+resolved once. Only those columns are parsed, straight into a float
+matrix; every other column is carried through as the original record
+text, so wide exports are neither type-inferred nor re-serialized.
+"""
+import csv
+import io
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# pyarrow's parser is multi-threaded, pandas' C parser is the fallback
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+    DEFAULT_ENGINE = 'pyarrow'
+except ImportError:
+    pyarrow = None
+    DEFAULT_ENGINE = 'c'
+
+FEATURE_DTYPES = {
+    'float32': np.float32,
+    'float64': np.float64
+}
+
+# Cells pandas reads as missing by default, so both engines agree
+NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+
+class CsvLayout:
+    """Column names of a CSV file and the positions of the model features in it"""
+
+    def __init__(self, header_line, feature_names):
+        self.header_line = header_line.lstrip('\ufeff').rstrip('\r\n')
+        self.columns = next(csv.reader([self.header_line]), [])
+        self.n_columns = len(self.columns)
+        self.feature_names = list(feature_names)
+
+        # Like pandas, a repeated column name refers to its first occurrence
+        positions = {}
+        for position, name in enumerate(self.columns):
+            positions.setdefault(name, position)
+        self.positions = positions
+        self.feature_positions = {name: positions[name] for name in self.feature_names if name in positions}
+        self.passthrough_positions = list(range(self.n_columns))
+
+    @property
+    def available_features(self):
+        return list(self.feature_positions)
+
+    def exclude(self, names):
+        """Leave the columns with these names out of the passthrough output"""
+        names = set(names)
+        self.passthrough_positions = [i for i, name in enumerate(self.columns) if name not in names]
+
+    @property
+    def passthrough_columns(self):
+        return [self.columns[i] for i in self.passthrough_positions]
+
+    @property
+    def passthrough_header(self):
+        if len(self.passthrough_positions) == self.n_columns:
+            return self.header_line
+        return _write_rows([self.passthrough_columns])[0]
+
+
+def _write_rows(rows):
+    """Serialize rows of fields to CSV lines"""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue().split('\n')[:-1]
+
+
+def _quote_balanced(line):
+    return line.count('"') % 2 == 0
+
+
+def split_records(lines):
+    """Group raw lines into CSV records, joining quoted fields that span lines
+
+    Blank lines are dropped as pandas does; line endings are removed.
+    """
+    records = []
+    pending = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if pending is not None:
+            pending += '\n' + line
+            if not _quote_balanced(pending):
+                continue
+            line, pending = pending, None
+        elif not _quote_balanced(line):
+            pending = line
+            continue
+
+        if line:
+            records.append(line)
+
+    if pending is not None:
+        records.append(pending)
+    return records
+
+
+def read_record_chunks(text_stream, n_records, max_chars=None):
+    """Yield lists of up to n_records complete records from a text stream
+
+    With max_chars, a chunk also ends once its lines reach that many
+    characters, so wide files are read in proportionally fewer rows.
+    """
+    while True:
+        if max_chars is None:
+            lines = list(itertools.islice(text_stream, n_records))
+        else:
+            lines = []
+            size = 0
+            for line in itertools.islice(text_stream, n_records):
+                lines.append(line)
+                size += len(line)
+                if size >= max_chars:
+                    break
+        if not lines:
+            return
+
+        # Keep reading until an open quoted field is closed
+        while not _quote_balanced(''.join(lines)):
+            line = text_stream.readline()
+            if not line:
+                break
+            lines.append(line)
+
+        records = split_records(lines)
+        if records:
+            yield records
+
+
+def _field_counts(records):
+    """Number of fields in each record"""
+    counts = pd.Series(records, dtype=object).str.count(',').to_numpy() + 1
+    quoted = [i for i, record in enumerate(records) if '"' in record]
+    for i, row in zip(quoted, csv.reader([records[i] for i in quoted])):
+        counts[i] = len(row)
+    return counts
+
+
+def align_records(records, n_columns, first_line=2):
+    """Pad short records with empty fields and reject records with too many
+
+    Returns the records to write back out, each with exactly n_columns fields.
+    """
+    counts = _field_counts(records)
+
+    too_long = np.flatnonzero(counts > n_columns)
+    if len(too_long):
+        i = too_long[0]
+        raise ValueError(f"Error tokenizing data. Expected {n_columns} fields in line {first_line + i}, saw {counts[i]}")
+
+    short = np.flatnonzero(counts < n_columns)
+    if len(short):
+        records = list(records)
+        for i in short:
+            records[i] += ',' * (n_columns - counts[i])
+    return records
+
+
+def _read_typed(text, n_columns, positions, dtype, engine, key_positions=()):
+    """Parse the given column positions of headerless CSV text as floats
+
+    With pyarrow, the key_positions columns are read as text in the same
+    pass and returned as the second value, which is None otherwise.
+    """
+    if engine == 'pyarrow' and not set(key_positions) & set(positions):
+        # Synthetic names keep repeated or empty header names apart
+        names = [f"c{i}" for i in range(n_columns)]
+        selected = [names[position] for position in positions]
+        keys = [names[position] for position in key_positions]
+        arrow_type = pyarrow.float32() if dtype == np.float32 else pyarrow.float64()
+        # Null values only apply to the float columns, text keeps empty cells
+        column_types = {name: arrow_type for name in selected}
+        column_types.update({name: pyarrow.string() for name in keys})
+        table = pyarrow_csv.read_csv(
+            io.BytesIO(text.encode('utf-8')),
+            read_options=pyarrow_csv.ReadOptions(column_names=names),
+            parse_options=pyarrow_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pyarrow_csv.ConvertOptions(
+                include_columns=list(column_types),
+                column_types=column_types,
+                null_values=NULL_VALUES
+            )
+        )
+        features = np.column_stack([table.column(name).to_numpy() for name in selected])
+        return features, [table.column(name).to_numpy(zero_copy_only=False) for name in keys]
+
+    frame = pd.read_csv(
+        io.StringIO(text), header=None, usecols=positions,
+        dtype={position: dtype for position in positions}, engine=engine
+    )
+    return frame[positions].to_numpy(dtype=np.float64), None
+
+
+def parse_features(records, layout, dtype=np.float64, engine=DEFAULT_ENGINE, key_names=()):
+    """Parse only the feature columns of aligned records
+
+    Returns (features, missing_counts, keys) with features in
+    layout.feature_names order. Absent columns and non-numeric cells become
+    0.0 and are counted as missing; empty cells stay NaN so the row fails
+    validation. keys holds the text of the key_names columns, one array per
+    name, read along with the features where the engine allows.
+    """
+    n_rows = len(records)
+    features = np.zeros((n_rows, len(layout.feature_names)), dtype=np.float64)
+    missing_counts = np.full(n_rows, len(layout.feature_names) - len(layout.feature_positions), dtype=int)
+    if not n_rows or not layout.feature_positions:
+        return features, missing_counts, read_key_columns(records, layout, key_names)
+
+    names = list(layout.feature_positions)
+    positions = [layout.feature_positions[name] for name in names]
+    targets = [layout.feature_names.index(name) for name in names]
+    key_positions = [layout.positions[name] for name in key_names]
+    text = '\n'.join(records)
+
+    # Typed parse: no inference, no per-cell Python objects
+    try:
+        values, keys = _read_typed(text, layout.n_columns, positions, dtype, engine, key_positions)
+        features[:, targets] = values
+        if keys is None:
+            keys = read_key_columns(records, layout, key_names)
+        return features, missing_counts, keys
+    except (ValueError, TypeError):
+        pass
+
+    # Some cells are not numbers: parse as text and coerce column by column
+    frame = pd.read_csv(
+        io.StringIO(text), header=None, usecols=positions,
+        dtype={position: object for position in positions}, engine='c'
+    )
+    for position, target in zip(positions, targets):
+        raw_values = frame[position]
+        values = np.array(pd.to_numeric(raw_values, errors='coerce'), dtype=np.float64)
+        invalid = np.isnan(values) & raw_values.notna().to_numpy()
+        values[invalid] = 0.0
+        missing_counts += invalid
+        features[:, target] = values
+
+    return features, missing_counts, read_key_columns(records, layout, key_names)
+
+
+def read_key_columns(records, layout, names):
+    """Parse the named columns of aligned records as text, one array per name"""
+    if not names:
+        return []
+    positions = [layout.positions[name] for name in names]
+    if not records:
+        return [np.array([], dtype=object) for _ in positions]
+    text = '\n'.join(records)
+
+    if pyarrow is not None:
+        columns = [f"c{i}" for i in range(layout.n_columns)]
+        selected = sorted({columns[position] for position in positions})
+        table = pyarrow_csv.read_csv(
+            io.BytesIO(text.encode('utf-8')),
+            read_options=pyarrow_csv.ReadOptions(column_names=columns),
+            parse_options=pyarrow_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pyarrow_csv.ConvertOptions(
+                include_columns=selected,
+                column_types={name: pyarrow.string() for name in selected},
+                null_values=[]
+            )
+        )
+        return [table.column(columns[position]).to_numpy(zero_copy_only=False) for position in positions]
+
+    frame = pd.read_csv(
+        io.StringIO(text), header=None, usecols=sorted(set(positions)),
+        dtype=str, keep_default_na=False, engine='c'
+    )
+    return [frame[position].to_numpy(dtype=object) for position in positions]
+
+
+def passthrough_records(records, layout):
+    """Return aligned records with only the layout's passthrough fields
+
+    Records are returned as they are when nothing is excluded.
+    """
+    if len(layout.passthrough_positions) == layout.n_columns:
+        return records
+    positions = layout.passthrough_positions
+    return _write_rows([row[i] for i in positions] for row in csv.reader(records))
+
+
+def read_text_columns(records, layout):
+    """Parse the passthrough fields of aligned records as pyarrow string columns
+
+    Cells keep their exact text; empty cells are empty strings, not nulls.
+    """
+    names = [f"c{i}" for i in range(layout.n_columns)]
+    selected = [names[position] for position in layout.passthrough_positions]
+    table = pyarrow_csv.read_csv(
+        io.BytesIO('\n'.join(records).encode('utf-8')),
+        read_options=pyarrow_csv.ReadOptions(column_names=names),
+        parse_options=pyarrow_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pyarrow_csv.ConvertOptions(
+            include_columns=selected,
+            column_types={name: pyarrow.string() for name in selected},
+            null_values=[]
+        )
+    )
+    return [table.column(name) for name in selected]
+
+
+def read_text_frame(records, layout):
+    """Parse the passthrough fields of aligned records into a DataFrame of strings
+
+    Cells keep their exact text and repeated names are numbered as pandas
+    does, so the frame matches a read_csv(dtype=str, keep_default_na=False).
+    """
+    names = unique_names(layout.passthrough_columns)
+    if not records:
+        return pd.DataFrame({name: np.array([], dtype=object) for name in names}, columns=names)
+
+    if pyarrow is not None:
+        columns = [column.to_numpy(zero_copy_only=False) for column in read_text_columns(records, layout)]
+    else:
+        positions = layout.passthrough_positions
+        frame = pd.read_csv(
+            io.StringIO('\n'.join(records)), header=None, usecols=positions,
+            dtype=str, keep_default_na=False, engine='c'
+        )
+        columns = [frame[position].to_numpy(dtype=object) for position in positions]
+    return pd.DataFrame(dict(zip(names, columns)), columns=names)
+
+
+def unique_names(names):
+    """Number repeated column names the way pandas does: a, a.1, a.2"""
+    seen = {}
+    unique = []
+    for name in names:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        unique.append(f"{name}.{count}" if count else name)
+    return unique
+
+
+def format_rows(columns):
+    """Serialize result columns to CSV lines without a header"""
+    text = pd.DataFrame(columns).to_csv(header=False, index=False, lineterminator='\n')
+    return text.split('\n')[:-1]
+
+
+def join_records(records, result_lines):
+    """Append result fields to the original record text"""
+    return '\n'.join(
+        record + ',' + result for record, result in zip(records, result_lines)
+    ) + '\n'
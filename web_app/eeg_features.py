@@ -0,0 +1,194 @@
+"""Compute model features directly from raw multichannel EEG windows
+
+Feature names follow the offline generator that produced the training
+data: ``<family>_<index>_<half>`` where half ``a`` is the first half of
+the window and ``b`` the second. Within one half (T samples, C channels):
+
+- ``mean_i``, ``stddev_i``, ``min_i`` - mean, sample standard deviation and
+  minimum of channel i
+- ``mean_d_i`` (i < C) - mean of the second half minus mean of the first half
+- ``mean_d_k`` (k >= C) and ``mean_d_k<half>2`` - entry k of the quarter-window
+  mean block. The first C entries collide with the half differences above and
+  carry a trailing ``2`` instead.
+- ``min_q_k`` - entry k of the quarter-window minimum block
+- ``covmat_k`` - entry k of the row-major upper triangle (with diagonal) of
+  the channel covariance matrix
+- ``logm_k`` - absolute value of entry k of the same triangle of the matrix
+  logarithm of the covariance matrix
+
+A quarter-window block holds the statistic of each quarter q1..q4 (C values
+each) followed by the pairwise differences q1-q2, q1-q3, q1-q4, q2-q3, q2-q4
+and q3-q4, so entry k is channel k % C of block part k // C.
+"""
+import logging
+import re
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FEATURE_NAME_PATTERN = re.compile(r'^(mean_d|mean|stddev|min_q|min|covmat|logm)_(\d+)_([ab])(2?)$')
+
+# Pairs of quarters whose differences follow the four quarter values
+QUARTER_PAIRS = ((0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3))
+
+# Each half is split into quarters and needs two samples per quarter
+MIN_HALF_SAMPLES = 8
+
+
+def parse_feature_name(name):
+    """Return (family, index, half) for a feature name
+
+    The collided quarter-block names ``mean_d_<k>_<half>2`` are returned
+    with the family ``mean_q``.
+    """
+    match = FEATURE_NAME_PATTERN.match(name)
+    if match is None:
+        raise ValueError(f"Feature '{name}' cannot be computed from raw EEG")
+
+    family, index, half, collided = match.groups()
+    if collided:
+        if family != 'mean_d':
+            raise ValueError(f"Feature '{name}' cannot be computed from raw EEG")
+        family = 'mean_q'
+    return family, int(index), half
+
+
+def required_channels(feature_names):
+    """Return the smallest channel count that defines every feature"""
+    channels = 1
+    for name in feature_names:
+        family, index, _ = parse_feature_name(name)
+        if family in ('mean', 'stddev', 'min'):
+            needed = index + 1
+        elif family in ('covmat', 'logm'):
+            # Smallest C with C * (C + 1) / 2 > index
+            needed = int(np.ceil((np.sqrt(8 * index + 9) - 1) / 2))
+        else:
+            needed = index // (4 + len(QUARTER_PAIRS)) + 1
+        channels = max(channels, needed)
+    return channels
+
+
+def _quarter_bounds(n_samples):
+    return [0, int(0.25 * n_samples), int(0.50 * n_samples), int(0.75 * n_samples)]
+
+
+def _quarter_block(quarters):
+    """Turn per-quarter values (n, 4, C) into the (n, 10 * C) quarter block"""
+    differences = [quarters[:, i] - quarters[:, j] for i, j in QUARTER_PAIRS]
+    return np.concatenate([quarters.reshape(len(quarters), -1)] + differences, axis=1)
+
+
+def _matrix_log(covariance):
+    """Matrix logarithm of a stack of symmetric matrices"""
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    # Singular matrices give -inf/NaN entries, which callers reject as invalid rows
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_eigenvalues = np.log(eigenvalues)
+        return (eigenvectors * log_eigenvalues[:, np.newaxis, :]) @ eigenvectors.transpose(0, 2, 1)
+
+
+class FeatureExtractor:
+    """Vectorized extraction of a fixed feature list from raw EEG windows
+
+    Each statistic is computed once per half-window for all windows and
+    all features that use it: the covariance matrix for every covmat_*
+    and logm_* entry, the quarter minima for every min_q_* entry, and so on.
+    """
+
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self.n_channels = required_channels(self.feature_names)
+
+        # Output column positions and source indices per (half, family)
+        self._plan = {}
+        for column, name in enumerate(self.feature_names):
+            family, index, half = parse_feature_name(name)
+            columns, indices = self._plan.setdefault((half, family), ([], []))
+            columns.append(column)
+            indices.append(index)
+
+    def transform(self, windows):
+        """Return an (n_windows, n_features) matrix for windows of shape (n_windows, n_samples, n_channels)"""
+        windows = np.asarray(windows, dtype=np.float64)
+        if windows.ndim == 2:
+            windows = windows[np.newaxis]
+        if windows.ndim != 3:
+            raise ValueError(f"Expected windows of shape (n_windows, n_samples, n_channels), got {windows.shape}")
+
+        n_windows, n_samples, n_channels = windows.shape
+        if n_channels < self.n_channels:
+            raise ValueError(f"Windows have {n_channels} channels, the features need at least {self.n_channels}")
+        if n_samples // 2 < MIN_HALF_SAMPLES:
+            raise ValueError(f"Windows need at least {2 * MIN_HALF_SAMPLES} samples, got {n_samples}")
+
+        features = np.empty((n_windows, len(self.feature_names)), dtype=np.float64)
+        middle = n_samples // 2
+        for half, signal in (('a', windows[:, :middle]), ('b', windows[:, middle:])):
+            families = {family: plan for (plan_half, family), plan in self._plan.items() if plan_half == half}
+            if not families:
+                continue
+
+            # Shared computations may yield families this extractor does not use
+            statistics = self._half_statistics(signal, families)
+            for family, (columns, indices) in families.items():
+                features[:, columns] = statistics[family][:, indices]
+
+        return features
+
+    def _half_statistics(self, signal, families):
+        """Compute each requested family for one half-window of every window"""
+        n_samples = signal.shape[1]
+        statistics = {}
+
+        mean = signal.mean(axis=1)
+        if 'mean' in families:
+            statistics['mean'] = mean
+
+        # The covariance diagonal doubles as the variance for stddev_*
+        covariance = None
+        if families.keys() & {'covmat', 'logm', 'stddev'}:
+            centered = signal - mean[:, np.newaxis, :]
+            covariance = centered.transpose(0, 2, 1) @ centered / (n_samples - 1)
+            statistics['stddev'] = np.sqrt(np.diagonal(covariance, axis1=1, axis2=2))
+
+        if 'min' in families:
+            statistics['min'] = signal.min(axis=1)
+
+        bounds = _quarter_bounds(n_samples)
+        if 'mean_d' in families or 'mean_q' in families:
+            counts = np.diff(bounds + [n_samples])[np.newaxis, :, np.newaxis]
+            quarter_means = _quarter_block(np.add.reduceat(signal, bounds, axis=1) / counts)
+            statistics['mean_q'] = quarter_means
+
+            # Indices below C are half-window differences, the rest quarter means
+            middle = n_samples // 2
+            half_difference = signal[:, middle:].mean(axis=1) - signal[:, :middle].mean(axis=1)
+            mean_d = quarter_means.copy()
+            mean_d[:, :signal.shape[2]] = half_difference
+            statistics['mean_d'] = mean_d
+
+        if 'min_q' in families:
+            statistics['min_q'] = _quarter_block(np.minimum.reduceat(signal, bounds, axis=1))
+
+        if 'covmat' in families or 'logm' in families:
+            upper = np.triu_indices(signal.shape[2])
+            statistics['covmat'] = covariance[:, upper[0], upper[1]]
+            if 'logm' in families:
+                statistics['logm'] = np.abs(_matrix_log(covariance)[:, upper[0], upper[1]])
+
+        return statistics
+
+
+def load_feature_extractor(feature_names):
+    """Build an extractor for the feature names, returning None if some cannot be computed"""
+    try:
+        extractor = FeatureExtractor(feature_names)
+        logger.info("Raw EEG feature extraction ready for %d features from %d channels",
+                    len(extractor.feature_names), extractor.n_channels)
+        return extractor
+
+    except ValueError as e:
+        logger.warning("Raw EEG feature extraction unavailable: %s", str(e))
+        return None
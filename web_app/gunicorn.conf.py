@@ -0,0 +1,68 @@
+"""Gunicorn settings for multi-worker serving
+
+Run from the web_app directory with: gunicorn -c gunicorn.conf.py app:app
+"""
+import gc
+import multiprocessing
+import os
+import signal
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+
+# Streaming sessions are kept in one process, so the app turns /stream away
+# when requests are spread over several workers
+os.environ['FLASK_SERVER_WORKERS'] = str(workers)
+
+# Enough threads for the interactive and bulk admission pools plus their
+# waiting requests, so queued uploads never hold every thread
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+worker_class = 'gthread'
+
+# Uploads are scored while the request is open
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+
+# Seconds in-flight requests and running jobs get after SIGTERM
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))
+
+# Load the model once in the master so workers share its pages after fork
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+# Workers write their metrics here so /metrics reports all of them; files
+# left by an earlier server would count twice, so start empty
+metrics_dir = os.environ.setdefault('FLASK_METRICS_DIR', os.path.join(os.getcwd(), 'temp', 'metrics'))
+if os.path.isdir(metrics_dir):
+    for name in os.listdir(metrics_dir):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def when_ready(server):
+    # Move preloaded objects out of the collector's reach so workers do not
+    # dirty the shared pages while scanning them
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    import app
+
+    # Jobs left by stopped workers restart without waiting for a request
+    app.job_manager.ensure_recovered()
+
+    # Turn new requests away with 503 as soon as shutdown starts, while
+    # gunicorn lets the admitted ones finish
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def start_draining(signum, frame):
+        app.admission_controller.start_draining()
+        handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, start_draining)
+
+
+def worker_exit(server, worker):
+    # Running jobs get the rest of the graceful timeout, queued ones are
+    # recovered by the next worker
+    import app
+
+    app.drain_server(worker.cfg.graceful_timeout)
@@ -0,0 +1,398 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle states
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# Lock files of the server processes that own jobs, and of recovery itself
+OWNERS_DIR = 'owners'
+RECOVER_LOCK = 'recover.lock'
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+def _state_path(state_dir, job_id):
+    return os.path.join(state_dir, f"{job_id}.json")
+
+
+def _input_path(state_dir, job_id):
+    return os.path.join(state_dir, f"{job_id}.csv")
+
+
+def _cancel_path(state_dir, job_id):
+    return os.path.join(state_dir, f"{job_id}.cancel")
+
+
+def read_job_state(state_dir, job_id):
+    """Read a job state file, returning None if it does not exist"""
+    try:
+        with open(_state_path(state_dir, job_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_job_state(state_dir, state):
+    """Atomically replace a job state file"""
+    path = _state_path(state_dir, state['job_id'])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _owner_path(state_dir, owner):
+    return os.path.join(state_dir, OWNERS_DIR, f"{owner}.lock")
+
+
+def _owner_alive(state_dir, owner):
+    """Whether the process that owns a job still holds its owner lock"""
+    path = _owner_path(state_dir, owner)
+    try:
+        with open(path, 'a') as f:
+            fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return True
+
+    # The owner exited and released its lock
+    os.remove(path)
+    return False
+
+
+def _remove_job_files(state_dir, job_id):
+    """Remove the spooled upload and cancel marker of a finished job"""
+    for path in (_input_path(state_dir, job_id), _cancel_path(state_dir, job_id)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_job(process_stream, state_dir, job_id):
+    """Score one job's CSV in a worker process, recording progress on disk"""
+    state = read_job_state(state_dir, job_id)
+    cancel_path = _cancel_path(state_dir, job_id)
+    output_path = os.path.join(state['output_dir'], state['output_filename'])
+    started = time.time()
+
+    # Cancelled while waiting in the executor's call queue
+    if os.path.exists(cancel_path):
+        state.update(status=CANCELLED, finished_at=started)
+        write_job_state(state_dir, state)
+        _remove_job_files(state_dir, job_id)
+        return CANCELLED
+
+    state.update(status=RUNNING, started_at=started, rows_done=0, errors=0, rows_per_second=0.0)
+    write_job_state(state_dir, state)
+
+    def progress(stats):
+        # Returning False stops processing at the next chunk boundary
+        if os.path.exists(cancel_path):
+            return False
+
+        elapsed = time.time() - started
+        state.update(
+            rows_done=stats['total_rows'],
+            errors=stats['errors'],
+            rows_per_second=round(stats['total_rows'] / elapsed, 1) if elapsed > 0 else 0.0
+        )
+        write_job_state(state_dir, state)
+        return True
+
+    try:
+        with open(_input_path(state_dir, job_id), 'rb') as f:
+            stats, errors, feature_summary = process_stream(
+                f, output_path, progress=progress, **state.get('output_options', {}))
+
+        if os.path.exists(cancel_path):
+            state.update(status=CANCELLED)
+        elif stats is None:
+            state.update(status=FAILED, error=errors)
+        else:
+            elapsed = time.time() - started
+            state.update(
+                status=COMPLETED,
+                rows_done=stats['total_rows'],
+                errors=stats['errors'],
+                successful_predictions=stats['successful_predictions'],
+                cache_status=stats.get('cache_status'),
+                reused_rows=stats.get('reused_rows', 0),
+                model=stats.get('model'),
+                rows_per_second=round(stats['total_rows'] / elapsed, 1) if elapsed > 0 else 0.0,
+                error_details=errors,
+                feature_summary=feature_summary
+            )
+
+    except Exception as e:
+        state.update(status=FAILED, error=f"Job error: {str(e)}")
+
+    finally:
+        state['finished_at'] = time.time()
+        write_job_state(state_dir, state)
+
+        # The spooled upload is only needed until the job finishes
+        _remove_job_files(state_dir, job_id)
+
+    return state['status']
+
+
+class JobManager:
+    """Run CSV scoring jobs on a local process pool with on-disk state
+
+    Each job is a spooled input CSV plus a JSON state file in state_dir,
+    so unfinished jobs can be resubmitted after a restart. Several server
+    processes can share a state directory: every job records the process
+    that queued it, which holds a lock on its owner file while it lives,
+    and recovery only takes over jobs whose owner has exited. POSIX locks
+    are not inherited by forked children, so worker pools do not keep
+    a dead owner alive.
+    """
+
+    def __init__(self, process_stream, state_dir, output_dir, max_workers=2, max_queued=8,
+                 initializer=None, initargs=()):
+        self.process_stream = process_stream
+        self.state_dir = state_dir
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._owner = None
+        self._owner_file = None
+        self._owner_pid = None
+        self._recovered_pid = None
+        self._recover_lock = threading.Lock()
+
+    def _claim_owner(self):
+        """Return this process's owner id, locking its owner file for the life of the process"""
+        with self._lock:
+            if self._owner_pid != os.getpid():
+                owner = uuid.uuid4().hex
+                os.makedirs(os.path.join(self.state_dir, OWNERS_DIR), exist_ok=True)
+                owner_file = open(_owner_path(self.state_dir, owner), 'w')
+                fcntl.lockf(owner_file, fcntl.LOCK_EX)
+                self._owner, self._owner_file, self._owner_pid = owner, owner_file, os.getpid()
+            return self._owner
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=self.initializer, initargs=self.initargs)
+        return self._executor
+
+    def active_count(self):
+        """Number of jobs queued or running in this process"""
+        with self._lock:
+            return sum(1 for future in self._futures.values() if not future.done())
+
+    def _submit(self, job_id):
+        with self._lock:
+            active = sum(1 for future in self._futures.values() if not future.done())
+            if active >= self.max_workers + self.max_queued:
+                raise QueueFullError(f"Job queue is full ({active} jobs queued or running)")
+
+            future = self._get_executor().submit(run_job, self.process_stream, self.state_dir, job_id)
+            self._futures[job_id] = future
+
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+        if future.cancelled():
+            return
+
+        # A crashed worker never writes its final state
+        error = future.exception()
+        if error is not None:
+            state = read_job_state(self.state_dir, job_id)
+            if state is not None and state['status'] not in FINISHED_STATES:
+                state.update(status=FAILED, error=f"Job error: {str(error)}", finished_at=time.time())
+                write_job_state(self.state_dir, state)
+            logger.error("Job %s failed: %s", job_id, str(error))
+
+    def submit(self, file_storage, output_filename, output_options=None):
+        """Spool an uploaded CSV to disk and queue it for scoring
+
+        output_options are passed on to process_stream as keyword arguments.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        if self.active_count() >= self.max_workers + self.max_queued:
+            raise QueueFullError("Job queue is full")
+
+        job_id = uuid.uuid4().hex
+        file_storage.save(_input_path(self.state_dir, job_id))
+
+        write_job_state(self.state_dir, {
+            'job_id': job_id,
+            'owner': self._claim_owner(),
+            'status': QUEUED,
+            'input_filename': file_storage.filename,
+            'output_dir': self.output_dir,
+            'output_filename': output_filename,
+            'output_options': output_options or {},
+            'submitted_at': time.time(),
+            'rows_done': 0,
+            'errors': 0,
+            'rows_per_second': 0.0
+        })
+
+        try:
+            self._submit(job_id)
+        except QueueFullError:
+            os.remove(_input_path(self.state_dir, job_id))
+            os.remove(_state_path(self.state_dir, job_id))
+            raise
+
+        logger.info("Job %s queued for %s", job_id, file_storage.filename)
+        return job_id
+
+    def status(self, job_id):
+        """Return the current state of a job, or None if unknown"""
+        return read_job_state(self.state_dir, job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued job or ask a running one to stop"""
+        state = read_job_state(self.state_dir, job_id)
+        if state is None or state['status'] in FINISHED_STATES:
+            return state
+
+        with self._lock:
+            future = self._futures.get(job_id)
+
+        if future is not None and future.cancel():
+            state.update(status=CANCELLED, finished_at=time.time())
+            write_job_state(self.state_dir, state)
+            os.remove(_input_path(self.state_dir, job_id))
+        else:
+            # Running workers check for this marker between chunks
+            open(_cancel_path(self.state_dir, job_id), 'w').close()
+
+        logger.info("Job %s cancellation requested", job_id)
+        return read_job_state(self.state_dir, job_id)
+
+    def ensure_recovered(self):
+        """Run recover() once in this process"""
+        if self._recovered_pid == os.getpid():
+            return 0
+
+        with self._recover_lock:
+            if self._recovered_pid == os.getpid():
+                return 0
+            self._recovered_pid = os.getpid()
+            return self.recover()
+
+    def recover(self):
+        """Resubmit unfinished jobs whose server process has stopped
+
+        Processes recover one at a time and take over the jobs they
+        resubmit, so each job is recovered by exactly one of them.
+        """
+        if not os.path.isdir(self.state_dir):
+            return 0
+
+        owner = self._claim_owner()
+        with open(os.path.join(self.state_dir, RECOVER_LOCK), 'w') as lock:
+            fcntl.lockf(lock, fcntl.LOCK_EX)
+            recovered = self._recover_orphaned(owner)
+
+        if recovered:
+            logger.info("Recovered %d unfinished jobs", recovered)
+        return recovered
+
+    def _recover_orphaned(self, owner):
+        recovered = 0
+        for name in sorted(os.listdir(self.state_dir)):
+            if not name.endswith('.json'):
+                continue
+
+            job_id = name[:-len('.json')]
+            state = read_job_state(self.state_dir, job_id)
+            if state is None or state['status'] in FINISHED_STATES:
+                continue
+
+            # Queued by this process or by one that is still running
+            job_owner = state.get('owner')
+            if job_owner == owner or (job_owner and _owner_alive(self.state_dir, job_owner)):
+                continue
+
+            if not os.path.exists(_input_path(self.state_dir, job_id)):
+                state.update(status=FAILED, error="Job input was lost during restart", finished_at=time.time())
+                write_job_state(self.state_dir, state)
+                continue
+
+            # Restart from scratch so the output is never partially duplicated
+            output_path = os.path.join(state['output_dir'], state['output_filename'])
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+            state.update(owner=owner, status=QUEUED, rows_done=0, errors=0, rows_per_second=0.0)
+            write_job_state(self.state_dir, state)
+
+            try:
+                self._submit(job_id)
+                recovered += 1
+            except QueueFullError:
+                # Leave it queued on disk for the next restart
+                logger.warning("Job %s could not be recovered: queue is full", job_id)
+
+        return recovered
+
+    def recycle_workers(self):
+        """Run the next jobs in new worker processes
+
+        Jobs already submitted finish in the old ones, which exit after.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def drain(self, timeout=None):
+        """Let running jobs finish, then stop the worker pool
+
+        Jobs still waiting for a worker are left queued on disk for
+        recover() on the next start. Returns True if every running job
+        finished within timeout seconds.
+        """
+        with self._lock:
+            futures = list(self._futures.values())
+
+        # Only jobs that have not reached a worker can be cancelled
+        running = [future for future in futures if not future.cancel()]
+        if running:
+            logger.info("Waiting for %d running jobs", len(running))
+        _, not_done = wait(running, timeout=timeout)
+        if not_done:
+            logger.warning("%d jobs still running at shutdown, they restart on the next start", len(not_done))
+
+        self.shutdown(wait=not not_done)
+        return not not_done
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
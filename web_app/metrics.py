@@ -0,0 +1,341 @@
+"""Prometheus-style counters and histograms without a client library
+
+A registry keeps its values in the process that records them. Given a
+directory, every process also writes its counters and histograms to its
+own file there every flush_interval seconds, and /metrics adds up the
+files of all processes, including forked worker pools and processes that
+have exited. Callback metrics are read at scrape time in the process that
+answers and carry its pid as a label.
+"""
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond predictions to long uploads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing value per label combination"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def changes_since(self, snapshot):
+        """Return the amounts added since snapshot was taken"""
+        return {
+            key: value - snapshot.get(key, 0.0)
+            for key, value in self.snapshot().items() if value != snapshot.get(key, 0.0)
+        }
+
+    @staticmethod
+    def _add(values, changes):
+        for key, amount in changes.items():
+            values[key] = values.get(key, 0.0) + amount
+
+    def merge(self, changes):
+        with self._lock:
+            self._add(self._values, changes)
+
+    def reset(self):
+        # Called in a forked child, where another thread may have held the lock
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def dump(self):
+        """Return the values in a JSON-serializable form read by load"""
+        return [[list(key), value] for key, value in self.snapshot().items()]
+
+    @staticmethod
+    def load(data):
+        return {tuple(key): value for key, value in data}
+
+    def samples(self, values=None):
+        values = self.snapshot() if values is None else values
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    def changes_since(self, snapshot):
+        """Return the observations made since snapshot was taken"""
+        changes = {}
+        for key, (counts, total) in self.snapshot().items():
+            old_counts, old_total = snapshot.get(key, ([0] * len(self.buckets), 0.0))
+            if counts != old_counts:
+                changes[key] = ([new - old for new, old in zip(counts, old_counts)], total - old_total)
+        return changes
+
+    def _add(self, values, changes):
+        for key, (counts, total) in changes.items():
+            current, current_total = values.get(key, ([0] * len(self.buckets), 0.0))
+            values[key] = ([a + b for a, b in zip(current, counts)], current_total + total)
+
+    def merge(self, changes):
+        with self._lock:
+            self._add(self._values, changes)
+
+    def reset(self):
+        # Called in a forked child, where another thread may have held the lock
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def dump(self):
+        """Return the values in a JSON-serializable form read by load"""
+        return [[list(key), counts, total] for key, (counts, total) in self.snapshot().items()]
+
+    @staticmethod
+    def load(data):
+        return {tuple(key): (counts, total) for key, counts, total in data}
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self, values=None):
+        values = self.snapshot() if values is None else values
+        samples = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                samples.append((f"{self.name}_bucket", labels, cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), total))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), cumulative))
+        return samples
+
+
+class CallbackMetric:
+    """Gauge or counter whose values are read from a callback at scrape time
+
+    The callback returns a number or a dict mapping label value tuples to
+    numbers. It lets components that keep their own statistics, such as
+    the prediction cache, be exported without double bookkeeping.
+    """
+
+    def __init__(self, name, documentation, callback, labelnames=(), type_name='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.type_name = type_name
+
+    def samples(self, extra=None):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            (self.name, _format_labels(self.labelnames, key, extra), value)
+            for key, value in sorted(values.items()) if value is not None
+        ]
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in Prometheus text format
+
+    Without a directory each server process keeps its own metrics, so with
+    several workers every scrape reports the worker that answered it. With
+    one, counters and histograms are shared as described in the module
+    docstring; the directory must be emptied before the server starts.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self._metrics = []
+        self.directory = directory or None
+        self.flush_interval = flush_interval
+        self._path = None
+        self._pid = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        if self.directory:
+            # A forked process reports only what it records itself
+            os.register_at_fork(after_in_child=self._reset)
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, callback, labelnames=(), type_name='gauge'):
+        return self.register(CallbackMetric(name, documentation, callback, labelnames, type_name))
+
+    def snapshot(self):
+        """Copy the counter and histogram values, to diff with changes_since
+
+        Together with merge this lets a forked worker process report the
+        metrics it recorded back to the process that serves /metrics.
+        Callback metrics are read at scrape time and are not included.
+        """
+        return [metric.snapshot() if hasattr(metric, 'snapshot') else None for metric in self._metrics]
+
+    def changes_since(self, snapshot):
+        return [
+            metric.changes_since(values) if values is not None else None
+            for metric, values in zip(self._metrics, snapshot)
+        ]
+
+    def merge(self, changes):
+        """Add the changes recorded by a forked copy of this registry"""
+        for metric, metric_changes in zip(self._metrics, changes):
+            if metric_changes:
+                metric.merge(metric_changes)
+
+    def _reset(self):
+        for metric in self._metrics:
+            if hasattr(metric, 'reset'):
+                metric.reset()
+        self._path = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _own_path(self):
+        # pids are reused, so each process gets a file of its own
+        if self._path is None:
+            self._path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        return self._path
+
+    def flush(self):
+        """Write this process's counters and histograms to the shared directory"""
+        if not self.directory:
+            return
+        data = {metric.name: metric.dump() for metric in self._metrics if hasattr(metric, 'dump')}
+        path = self._own_path()
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Metrics flush failed: %s", str(e))
+
+    def ensure_flushing(self):
+        """Start writing this process's metrics to the shared directory, if there is one"""
+        if not self.directory or (self._thread is not None and self._pid == os.getpid()):
+            return
+
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self.flush()
+                atexit.register(self.flush)
+                self._thread = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                self._thread.start()
+
+    def _shared_values(self):
+        """Add the values written by other processes to this process's live values"""
+        values = {metric.name: metric.snapshot() for metric in self._metrics if hasattr(metric, 'snapshot')}
+        own_path = self._own_path()
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.json') or path == own_path:
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric in self._metrics:
+                if metric.name in data and metric.name in values:
+                    metric._add(values[metric.name], metric.load(data[metric.name]))
+        return values
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        shared = self._shared_values() if self.directory else {}
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            if isinstance(metric, CallbackMetric):
+                samples = metric.samples(('pid', str(os.getpid())) if self.directory else None)
+            else:
+                samples = metric.samples(shared.get(metric.name))
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
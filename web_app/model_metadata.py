@@ -0,0 +1,67 @@
+"""Metadata written next to a model file by train.py and compact_model.py
+
+The sidecar holds the feature names in the order the model expects them,
+the class labels and how the model was trained, so the app reads the
+feature list from the model it serves instead of keeping its own copy.
+"""
+import json
+import os
+
+METADATA_VERSION = 1
+
+# Feature order of models saved before metadata files existed, which were
+# all trained on these columns
+LEGACY_FEATURES = [
+    'min_q_2_a', 'min_q_17_b', 'min_2_b', 'min_q_7_a', 'min_q_7_b',
+    'min_2_a', 'min_q_12_b', 'mean_2_b', 'mean_d_7_b', 'min_q_12_a',
+    'min_q_5_b', 'covmat_104_b', 'min_q_17_a', 'min_q_10_b', 'min_q_2_b',
+    'mean_d_12_a', 'mean_d_12_b', 'mean_d_15_b', 'min_q_5_a', 'mean_d_5_a',
+    'mean_2_a', 'covmat_97_b', 'covmat_20_b', 'mean_d_18_a', 'mean_0_a',
+    'mean_3_a', 'min_q_15_b', 'mean_d_7_a', 'logm_9_a', 'mean_d_2_a2',
+    'covmat_104_a', 'covmat_96_b', 'stddev_2_a', 'stddev_2_b', 'min_q_15_a',
+    'mean_d_8_b', 'covmat_8_a', 'covmat_1_a', 'mean_0_b', 'covmat_20_a',
+    'mean_3_b', 'covmat_8_b', 'mean_d_2_b2', 'stddev_0_a', 'mean_d_17_a'
+]
+
+
+def metadata_path(model_path):
+    """Return the metadata file that belongs to a model file"""
+    return os.path.splitext(model_path)[0] + '.json'
+
+
+def variant_path(model_path, variant):
+    """Return the file of a named variant of a model, or the model itself for ''"""
+    if not variant:
+        return model_path
+    base, extension = os.path.splitext(model_path)
+    return f"{base}.{variant}{extension}"
+
+
+def write_model_metadata(model_path, metadata):
+    """Write a model's metadata atomically next to it
+
+    Write it before moving the model file into place: the app reloads when
+    the model file changes, so it never pairs a new model with old metadata.
+    """
+    path = metadata_path(model_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(metadata, metadata_version=METADATA_VERSION), f, indent=2)
+        f.write('\n')
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_model_metadata(model_path):
+    """Return the metadata of a model file
+
+    Raises FileNotFoundError when the model has no metadata and ValueError
+    when it is unreadable or has no feature list.
+    """
+    with open(metadata_path(model_path)) as f:
+        metadata = json.load(f)
+
+    features = metadata.get('features')
+    if not isinstance(features, list) or not features or not all(isinstance(name, str) for name in features):
+        raise ValueError(f"{metadata_path(model_path)} has no feature list")
+    return metadata
@@ -0,0 +1,173 @@
+"""Served model version with background reloads and atomic swaps
+
+A ModelVersion bundles an estimator with everything derived from it, such
+as the compiled forest, fingerprint and metadata. Requests read
+ModelRegistry.current once and keep that object, so replacing it with a
+newly loaded version never changes the model under a request in flight.
+"""
+import logging
+import os
+import threading
+import time
+
+from model_metadata import metadata_path
+from prediction_cache import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLoadError(Exception):
+    """Raised when a model file cannot be served"""
+
+
+class ModelVersion:
+    """A loaded model with its compiled forest, fingerprint and metadata"""
+
+    def __init__(self, estimator, compiled, path, fingerprint, metadata):
+        self.estimator = estimator
+        self.compiled = compiled
+        self.path = path
+        self.fingerprint = fingerprint
+        self.metadata = metadata
+        self.loaded_at = time.time()
+
+        # train.py records a version; older files are named by their modification time
+        self.version = metadata.get('version') or time.strftime(
+            '%Y%m%d-%H%M%S', time.gmtime(os.path.getmtime(path)))
+
+    @property
+    def classes_(self):
+        return self.estimator.classes_
+
+    def describe(self):
+        return {'version': self.version, 'fingerprint': self.fingerprint}
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class ModelRegistry:
+    """Hold the served model version and swap in reloaded ones
+
+    loader(path) returns a loaded, checked and warmed-up ModelVersion or
+    raises. reload() runs it and only replaces the current version once it
+    succeeded, so a bad file leaves the served model untouched. With a
+    poll_interval, a thread in each process watches the model file and its
+    metadata and reloads once they have stopped changing.
+    """
+
+    def __init__(self, loader, poll_interval=0, on_swap=None):
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self.on_swap = on_swap
+        self.path = None
+        self.current = None
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error = None
+        self.last_reload_at = None
+        self._watched_signature = None
+        self._reload_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _signature(self):
+        return _file_signature(self.path), _file_signature(metadata_path(self.path))
+
+    def load(self, path):
+        """Load the first version from path; errors propagate to the caller"""
+        with self._reload_lock:
+            self.path = path
+            self._watched_signature = self._signature()
+            self._swap(self.loader(path))
+        return self.current
+
+    def reload(self):
+        """Load the model file again and swap it in if it changed
+
+        Returns True when a new version is now served. A file that fails to
+        load or validate is logged and the current version stays.
+        """
+        with self._reload_lock:
+            self._watched_signature = self._signature()
+            try:
+                # The model file's content identifies a version
+                if self.current is not None and file_fingerprint(self.path) == self.current.fingerprint:
+                    self.last_error = None
+                    return False
+                version = self.loader(self.path)
+            except Exception as e:
+                self.failed_reloads += 1
+                self.last_error = f"{os.path.basename(self.path)}: {str(e)}"
+                logger.error("Model reload failed, still serving %s: %s",
+                             self.current.version if self.current else None, self.last_error)
+                return False
+
+            self.last_error = None
+            self._swap(version)
+            self.reloads += 1
+            self.last_reload_at = time.time()
+            return True
+
+    def _swap(self, version):
+        previous = self.current
+        # A single reference assignment, so readers see the old or the new version
+        self.current = version
+        logger.info("Serving model %s (fingerprint %s)", version.version, version.fingerprint)
+        if self.on_swap is not None and previous is not None:
+            self.on_swap(version, previous)
+
+    def ensure_watching(self):
+        """Start the file watcher in this process if it is not running"""
+        if not self.poll_interval or self.path is None:
+            return
+        # Threads do not survive fork, so each worker process watches on its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        pending = None
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                signature = self._signature()
+                if signature == self._watched_signature or signature[0] is None:
+                    pending = None
+                    continue
+
+                # Wait for one quiet interval so a file still being copied is not loaded
+                if signature != pending:
+                    pending = signature
+                    continue
+
+                pending = None
+                logger.info("Model file %s changed, reloading", self.path)
+                self.reload()
+            except Exception as e:
+                logger.warning("Model watcher failed: %s", str(e))
+
+    def stats(self):
+        current = self.current
+        return {
+            'path': self.path,
+            'version': current.version if current else None,
+            'fingerprint': current.fingerprint if current else None,
+            'loaded_at': current.loaded_at if current else None,
+            'reloads': self.reloads,
+            'failed_reloads': self.failed_reloads,
+            'last_error': self.last_error,
+            'last_reload_at': self.last_reload_at,
+            'poll_interval': self.poll_interval
+        }
@@ -0,0 +1,160 @@
+import io
+
+import numpy as np
+
+# Content types accepted by the bulk prediction API
+JSON_CONTENT_TYPE = 'application/json'
+RAW_CONTENT_TYPE = 'application/octet-stream'
+NPY_CONTENT_TYPE = 'application/x-npy'
+
+# Raw buffers are always little-endian
+RAW_DTYPES = {
+    'float32': np.dtype('<f4'),
+    'float64': np.dtype('<f8')
+}
+
+
+class PayloadError(ValueError):
+    """Raised when a bulk prediction payload cannot be decoded"""
+
+
+def _check_shape(features, n_features):
+    if features.ndim != 2 or features.shape[1] != n_features:
+        raise PayloadError(f"Expected an array of shape (n, {n_features}), got {features.shape}")
+    return features
+
+
+def parse_json_payload(payload, feature_names):
+    """Decode JSON rows or columns into a feature matrix
+
+    Accepts {"rows": [[...], ...]} in feature order, {"rows": [{name: value}, ...]}
+    or {"columns": {name: [...], ...}}. Missing names are filled with 0.0
+    and returned so callers can report them.
+    """
+    if not isinstance(payload, dict):
+        raise PayloadError("Request body must be a JSON object with 'rows' or 'columns'")
+
+    n_features = len(feature_names)
+
+    if 'columns' in payload:
+        columns = payload['columns']
+        if not isinstance(columns, dict):
+            raise PayloadError("'columns' must map feature names to value lists")
+
+        missing = [name for name in feature_names if name not in columns]
+        lengths = {len(values) for values in columns.values() if isinstance(values, list)}
+        if len(lengths) != 1:
+            raise PayloadError("All columns must be lists of the same length")
+        n_rows = lengths.pop()
+
+        features = np.zeros((n_rows, n_features), dtype=np.float64)
+        for j, name in enumerate(feature_names):
+            if name in columns:
+                features[:, j] = np.asarray(columns[name], dtype=np.float64)
+        return features, missing
+
+    if 'rows' in payload:
+        rows = payload['rows']
+        if not isinstance(rows, list):
+            raise PayloadError("'rows' must be a list")
+
+        if rows and all(isinstance(row, dict) for row in rows):
+            missing = [name for name in feature_names if any(name not in row for row in rows)]
+            features = np.array([[row.get(name, 0.0) for name in feature_names] for row in rows], dtype=np.float64)
+            return features, missing
+
+        features = np.array(rows, dtype=np.float64).reshape(len(rows), -1) if rows else np.zeros((0, n_features))
+        return _check_shape(features, n_features), []
+
+    raise PayloadError("Request body must contain 'rows' or 'columns'")
+
+
+def parse_raw_buffer(data, dtype_name, n_features):
+    """View a raw little-endian float buffer as an (n, n_features) matrix without copying"""
+    if dtype_name not in RAW_DTYPES:
+        raise PayloadError(f"Unsupported dtype '{dtype_name}', expected one of {', '.join(RAW_DTYPES)}")
+
+    dtype = RAW_DTYPES[dtype_name]
+    row_bytes = dtype.itemsize * n_features
+    if len(data) % row_bytes:
+        raise PayloadError(f"Buffer size {len(data)} is not a multiple of the row size {row_bytes}")
+
+    return np.frombuffer(data, dtype=dtype).reshape(-1, n_features)
+
+
+def read_npy(data):
+    """View an .npy payload as an array of any shape without copying the data"""
+    stream = io.BytesIO(data)
+    try:
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+        else:
+            raise ValueError(f"unsupported format version {version}")
+    except ValueError as e:
+        raise PayloadError(f"Invalid .npy payload: {str(e)}")
+
+    if dtype.kind != 'f' or dtype.itemsize not in (4, 8):
+        raise PayloadError(f"Unsupported .npy dtype {dtype}, expected float32 or float64")
+
+    count = int(np.prod(shape))
+    if len(data) - stream.tell() < count * dtype.itemsize:
+        raise PayloadError("Truncated .npy payload")
+
+    array = np.frombuffer(data, dtype=dtype, count=count, offset=stream.tell())
+    return array.reshape(shape, order='F' if fortran_order else 'C')
+
+
+def parse_npy(data, n_features):
+    """View an .npy payload as a feature matrix without copying the data"""
+    return _check_shape(read_npy(data), n_features)
+
+
+def _check_windows(windows):
+    if windows.ndim == 2:
+        windows = windows[np.newaxis]
+    if windows.ndim != 3:
+        raise PayloadError(f"Expected windows of shape (n_windows, n_samples, n_channels), got {windows.shape}")
+    return windows
+
+
+def parse_json_windows(payload):
+    """Decode {"windows": [[[channel values] per sample] per window]} into a 3-d array"""
+    if not isinstance(payload, dict) or 'windows' not in payload:
+        raise PayloadError("Request body must be a JSON object with a 'windows' field")
+    return _check_windows(np.array(payload['windows'], dtype=np.float64))
+
+
+def parse_raw_windows(data, dtype_name, n_samples, n_channels):
+    """View a raw little-endian float buffer as (n_windows, n_samples, n_channels) windows"""
+    if n_samples <= 0 or n_channels <= 0:
+        raise PayloadError("Raw windows need positive 'samples' and 'channels' parameters")
+
+    features = parse_raw_buffer(data, dtype_name, n_samples * n_channels)
+    return features.reshape(-1, n_samples, n_channels)
+
+
+def parse_npy_windows(data):
+    """View an .npy array of one window (n_samples, n_channels) or many as a 3-d array"""
+    return _check_windows(read_npy(data))
+
+
+def encode_results(labels, probabilities, dtype):
+    """Pack labels and probabilities into an (n, 1 + n_classes) matrix of dtype
+
+    Column 0 holds the predicted class, the remaining columns the class
+    probabilities in model.classes_ order.
+    """
+    result = np.empty((len(labels), 1 + probabilities.shape[1]), dtype=dtype)
+    result[:, 0] = labels
+    result[:, 1:] = probabilities
+    return result
+
+
+def encode_npy(array):
+    """Serialize an array in .npy format"""
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
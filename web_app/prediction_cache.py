@@ -0,0 +1,138 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Fixed odd multipliers for the row hash used by dedupe_rows
+_ROW_HASH_MULTIPLIERS = np.random.default_rng(0x5EED).integers(1, 2 ** 63, size=256, dtype=np.uint64) | np.uint64(1)
+
+
+def file_fingerprint(path):
+    """Return a short content hash identifying a model file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def dedupe_rows(features):
+    """Return (unique_rows, inverse) for a feature matrix, or None if all rows differ
+
+    Rows are grouped by a vectorized 64-bit hash of their float bits and the
+    grouping is then verified exactly, so a hash collision only disables
+    deduplication for that batch.
+    """
+    n_rows, n_features = features.shape
+    if n_rows < 2 or n_features > len(_ROW_HASH_MULTIPLIERS):
+        return None
+
+    # Adding 0.0 turns -0.0 into 0.0 so equal values hash equally
+    bits = np.ascontiguousarray(features + 0.0, dtype=np.float64).view(np.uint64)
+    row_hash = np.einsum('ij,j->i', bits, _ROW_HASH_MULTIPLIERS[:n_features])
+    inverse, uniques = pd.factorize(row_hash)
+    if len(uniques) == n_rows:
+        return None
+
+    first = np.empty(len(uniques), dtype=np.intp)
+    first[inverse[::-1]] = np.arange(n_rows)[::-1]
+    unique_rows = features[first]
+
+    if not np.array_equal(unique_rows[inverse], features):
+        return None
+
+    return unique_rows, inverse
+
+
+class PredictionCache:
+    """Bounded, thread-safe memo of class probabilities per feature vector
+
+    Keys combine the model fingerprint with a hash of the float64 vector,
+    so loading a different model file never returns stale predictions.
+    Entries expire after ttl_seconds; when full, the least recently used
+    entry is evicted ('lru') or the oldest inserted one ('fifo').
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=3600.0, policy='lru'):
+        if policy not in ('lru', 'fifo'):
+            raise ValueError(f"Unknown cache eviction policy '{policy}'")
+
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.policy = policy
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(fingerprint, feature_vector):
+        """Hash a validated feature vector together with the model fingerprint"""
+        vector = np.ascontiguousarray(np.asarray(feature_vector, dtype=np.float64) + 0.0)
+        return hashlib.blake2b(fingerprint.encode() + vector.tobytes(), digest_size=16).digest()
+
+    def get(self, key):
+        """Return cached probabilities for key, or None"""
+        if self.max_size <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if self.ttl_seconds and expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            if self.policy == 'lru':
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store probabilities for key, evicting entries beyond max_size"""
+        if self.max_size <= 0:
+            return
+
+        # Cached arrays are shared between requests
+        value = np.array(value, dtype=np.float64)
+        value.setflags(write=False)
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss/eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.max_size > 0,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'policy': self.policy,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
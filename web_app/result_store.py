@@ -0,0 +1,290 @@
+"""Content-addressed cache of scored CSV results shared between processes
+
+Keys are hashes of what determines a result: the upload, the model
+fingerprint and the output options for whole result files, and the header,
+record text, row offset and model for scored chunks. Each entry is a file
+named after its key in one directory, and the least recently used entries
+are evicted once the directory grows past its size limit. Chunks are
+stored as .npz files read with allow_pickle=False, so a file planted in
+the directory can at worst be a wrong cache entry, never code that runs.
+
+Stored result files are hardlinked to the result files handed out in the
+outputs directory where the filesystem allows it, so both names share one
+inode. _touch() therefore also refreshes the modification time seen through
+every linked result file, and OutputSweeper in outputs.py ages result files
+by that time: a result file whose entry keeps being hit outlives the TTL.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_SUFFIX = '.out'
+SUMMARY_SUFFIX = '.json'
+CHUNK_SUFFIX = '.chunk'
+
+# Member of a chunk file holding its errors and non-numeric columns as JSON
+CHUNK_META = '__meta__'
+
+
+def hash_stream(stream, block_size=1024 * 1024):
+    """Return the SHA-256 of a seekable binary stream and rewind it"""
+    start = stream.tell()
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(block_size), b''):
+        digest.update(block)
+    stream.seek(start)
+    return digest.hexdigest()
+
+
+def make_key(*parts):
+    """Hash strings, bytes and other values into a store key"""
+    digest = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode('utf-8')
+        # Length prefixes keep ('ab', 'c') and ('a', 'bc') apart
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def _json_value(value):
+    # Object columns hold numpy scalars next to str and None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def encode_chunk(results, errors):
+    """Serialize result columns and errors as .npz bytes that load without pickle"""
+    arrays = {}
+    meta = {'order': list(results), 'columns': {}, 'errors': list(errors)}
+    for name, values in results.items():
+        if isinstance(values, np.ndarray) and values.dtype != object:
+            arrays[name] = values
+        else:
+            meta['columns'][name] = {
+                'array': isinstance(values, np.ndarray),
+                'values': [_json_value(v) for v in values] if isinstance(values, np.ndarray) else _json_value(values)
+            }
+    arrays[CHUNK_META] = np.array(json.dumps(meta))
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode_chunk(f):
+    """Read (results, errors) written by encode_chunk from a file object"""
+    with np.load(f, allow_pickle=False) as data:
+        meta = json.loads(str(data[CHUNK_META]))
+        results = {}
+        for name in meta['order']:
+            column = meta['columns'].get(name)
+            if column is None:
+                results[name] = data[name]
+            elif column['array']:
+                results[name] = np.array(column['values'], dtype=object)
+            else:
+                results[name] = column['values']
+    return results, meta['errors']
+
+
+class ResultStore:
+    """Content-addressed, size-bounded store of scored CSV results
+
+    Finished result files are kept with their summary under a key built
+    from the upload hash, the model fingerprint and the output options, so
+    an identical upload is answered with the stored file. Scored chunks are
+    kept under a key of their record text and row offset, so an upload that
+    appends rows to an earlier one only scores the new rows.
+
+    Entries live in directory and are shared by every process using it.
+    When the total size exceeds max_bytes, the least recently used entries
+    are removed. A max_bytes of 0 disables the store.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stored_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.chunk_hits = 0
+        self.chunk_misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _touch(self, *paths):
+        # Access time for LRU eviction is kept in the modification time
+        now = time.time()
+        for path in paths:
+            os.utime(path, (now, now))
+
+    def _write_atomic(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _link(self, source, destination):
+        """Place a copy of source at destination, sharing the blocks where possible"""
+        tmp_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            with open(source, 'rb') as src, open(tmp_path, 'wb') as dst:
+                for block in iter(lambda: src.read(1024 * 1024), b''):
+                    dst.write(block)
+        os.replace(tmp_path, destination)
+
+    def get_output(self, key, output_path):
+        """Place the stored result file for key at output_path and return its summary, or None"""
+        if not self.enabled:
+            return None
+
+        stored_path = self._path(key, OUTPUT_SUFFIX)
+        summary_path = self._path(key, SUMMARY_SUFFIX)
+        try:
+            with open(summary_path) as f:
+                summary = json.load(f)
+            self._link(stored_path, output_path)
+            self._touch(stored_path, summary_path)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return summary
+
+    def put_output(self, key, output_path, summary):
+        """Store a finished result file and its summary"""
+        if not self.enabled:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        stored_path = self._path(key, OUTPUT_SUFFIX)
+        self._link(output_path, stored_path)
+        # The summary is written last, so readers never see a summary without its file
+        self._write_atomic(self._path(key, SUMMARY_SUFFIX), json.dumps(summary).encode('utf-8'))
+        self._added(os.path.getsize(stored_path))
+
+    def get_chunk(self, key):
+        """Return the stored (results, errors) of a scored chunk, or None"""
+        if not self.enabled:
+            return None
+
+        path = self._path(key, CHUNK_SUFFIX)
+        try:
+            with open(path, 'rb') as f:
+                value = decode_chunk(f)
+            self._touch(path)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # Missing, truncated or not written by encode_chunk
+            with self._lock:
+                self.chunk_misses += 1
+            return None
+
+        with self._lock:
+            self.chunk_hits += 1
+        return value
+
+    def put_chunk(self, key, results, errors):
+        """Store the result columns and errors of a scored chunk"""
+        if not self.enabled:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        data = encode_chunk(results, errors)
+        self._write_atomic(self._path(key, CHUNK_SUFFIX), data)
+        self._added(len(data))
+
+    def _added(self, size):
+        with self._lock:
+            if self._stored_bytes is None:
+                self._stored_bytes = self._scan_size()
+            else:
+                self._stored_bytes += size
+            over = self._stored_bytes > self.max_bytes
+
+        if over:
+            self.evict()
+
+    def _entries(self):
+        """Group the files of each entry as (mtime, size, paths), ignoring temporaries"""
+        entries = {}
+        if not os.path.isdir(self.directory):
+            return []
+
+        for entry in os.scandir(self.directory):
+            key, suffix = os.path.splitext(entry.name)
+            if suffix not in (OUTPUT_SUFFIX, SUMMARY_SUFFIX, CHUNK_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            group_key = (key, suffix == CHUNK_SUFFIX)
+            mtime, size, paths = entries.get(group_key, (0.0, 0, []))
+            entries[group_key] = (max(mtime, stat.st_mtime), size + stat.st_size, paths + [entry.path])
+        return list(entries.values())
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove least recently used entries until the store fits max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            while entries and total > self.max_bytes:
+                _, size, paths = entries.pop(0)
+                # Summary first, so the entry stops being a hit before its file goes
+                for path in sorted(paths, key=lambda path: not path.endswith(SUMMARY_SUFFIX)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                removed += 1
+
+            self._stored_bytes = total
+            self.evictions += removed
+
+        if removed:
+            logger.info("Evicted %d result store entries from %s", removed, self.directory)
+        return removed
+
+    def stats(self):
+        """Return store size and hit/miss counters"""
+        with self._lock:
+            if self._stored_bytes is None and self.enabled:
+                self._stored_bytes = self._scan_size()
+            return {
+                'enabled': self.enabled,
+                'directory': self.directory,
+                'max_bytes': self.max_bytes,
+                'stored_bytes': self._stored_bytes or 0,
+                'hits': self.hits,
+                'misses': self.misses,
+                'chunk_hits': self.chunk_hits,
+                'chunk_misses': self.chunk_misses,
+                'evictions': self.evictions
+            }
@@ -2,18 +2,8 @@
 
 'use strict';
 
-// ACTUAL FEATURE NAMES from your EEG dataset
-const EXPECTED_FEATURES = [
-    'min_q_2_a', 'min_q_17_b', 'min_2_b', 'min_q_7_a', 'min_q_7_b', 
-    'min_2_a', 'min_q_12_b', 'mean_2_b', 'mean_d_7_b', 'min_q_12_a', 
-    'min_q_5_b', 'covmat_104_b', 'min_q_17_a', 'min_q_10_b', 'min_q_2_b', 
-    'mean_d_12_a', 'mean_d_12_b', 'mean_d_15_b', 'min_q_5_a', 'mean_d_5_a', 
-    'mean_2_a', 'covmat_97_b', 'covmat_20_b', 'mean_d_18_a', 'mean_0_a', 
-    'mean_3_a', 'min_q_15_b', 'mean_d_7_a', 'logm_9_a', 'mean_d_2_a2', 
-    'covmat_104_a', 'covmat_96_b', 'stddev_2_a', 'stddev_2_b', 'min_q_15_a', 
-    'mean_d_8_b', 'covmat_8_a', 'covmat_1_a', 'mean_0_b', 'covmat_20_a', 
-    'mean_3_b', 'covmat_8_b', 'mean_d_2_b2', 'stddev_0_a', 'mean_d_17_a'
-];
+// Feature names from the model's metadata, set by index.html
+const EXPECTED_FEATURES = window.EXPECTED_FEATURES || [];
 
 // EEG Pattern configurations based on your test results
 const EEG_PATTERNS = {
@@ -0,0 +1,191 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+
+class StreamSession:
+    """Rolling prediction state of one subject/session stream
+
+    The last `window` frame probabilities and their smoothed averages are
+    kept in fixed-size float32 ring buffers, so a session costs the same
+    memory no matter how long it runs. Listeners wait on the session's
+    condition for new frames.
+    """
+
+    def __init__(self, session_id, subject_id, session, window, n_classes):
+        self.session_id = session_id
+        self.subject_id = subject_id
+        self.session = session
+        self.window = window
+        self.sequence = 0
+        self.created_at = time.time()
+        self.last_active = time.monotonic()
+        self.closed = False
+        self._probabilities = np.zeros((window, n_classes), dtype=np.float32)
+        self._smoothed = np.zeros((window, n_classes), dtype=np.float32)
+        self._condition = threading.Condition()
+
+    def _ordered(self, buffer):
+        """Return the rows of a ring buffer from oldest to newest"""
+        count = min(self.sequence, self.window)
+        slots = np.arange(self.sequence - count, self.sequence) % self.window
+        return buffer[slots]
+
+    def add(self, probabilities):
+        """Append scored frames and return (first_sequence, smoothed probabilities)"""
+        probabilities = np.asarray(probabilities, dtype=np.float32)
+
+        with self._condition:
+            first_sequence = self.sequence
+
+            # Rolling means over the previous frames plus the new ones
+            history = self._ordered(self._probabilities)
+            combined = np.concatenate([history, probabilities]).astype(np.float64)
+            totals = np.concatenate([np.zeros((1, combined.shape[1])), np.cumsum(combined, axis=0)])
+            ends = np.arange(len(history), len(combined)) + 1
+            starts = np.maximum(ends - self.window, 0)
+            smoothed = (totals[ends] - totals[starts]) / (ends - starts)[:, np.newaxis]
+
+            # Only the last `window` frames fit in the ring
+            keep = slice(max(len(probabilities) - self.window, 0), None)
+            slots = np.arange(first_sequence, first_sequence + len(probabilities))[keep] % self.window
+            self._probabilities[slots] = probabilities[keep]
+            self._smoothed[slots] = smoothed[keep]
+
+            self.sequence += len(probabilities)
+            self.last_active = time.monotonic()
+            self._condition.notify_all()
+
+        return first_sequence, smoothed
+
+    def smoothed(self):
+        """Return the current rolling average, or None before the first frame"""
+        with self._condition:
+            if self.sequence == 0:
+                return None
+            return self._smoothed[(self.sequence - 1) % self.window].astype(np.float64)
+
+    def frames_since(self, sequence):
+        """Return (sequence, probabilities, smoothed) for buffered frames after sequence"""
+        with self._condition:
+            first = max(sequence + 1, self.sequence - self.window, 0)
+            return [
+                (seq, self._probabilities[seq % self.window].copy(), self._smoothed[seq % self.window].copy())
+                for seq in range(first, self.sequence)
+            ]
+
+    def wait(self, sequence, timeout):
+        """Block until a frame after sequence arrives or the session closes"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.closed or self.sequence > sequence + 1, timeout)
+            self.last_active = time.monotonic()
+            return self.sequence
+
+    def close(self):
+        """Wake listeners and mark the session finished"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def summary(self):
+        """Return the session's identity and activity"""
+        return {
+            'session_id': self.session_id,
+            'subject_id': self.subject_id,
+            'session': self.session,
+            'frames': self.sequence,
+            'window': self.window,
+            'created_at': self.created_at,
+            'idle_seconds': round(time.monotonic() - self.last_active, 3)
+        }
+
+
+class SessionManager:
+    """Process-local registry of streaming sessions with idle eviction
+
+    One session exists per (subject_id, session) pair. Sessions idle for
+    longer than idle_timeout seconds are dropped on the next access, and
+    the least recently active session makes room when max_sessions is
+    reached.
+    """
+
+    def __init__(self, window=32, idle_timeout=300.0, max_sessions=1000):
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.evicted = 0
+
+    def _remove(self, session_id):
+        stream = self._sessions.pop(session_id)
+        self._keys.pop((stream.subject_id, stream.session), None)
+        stream.close()
+        return stream
+
+    def _evict_idle(self):
+        # Sessions are ordered by last activity, so stop at the first fresh one
+        now = time.monotonic()
+        while self._sessions:
+            session_id, stream = next(iter(self._sessions.items()))
+            if now - stream.last_active < self.idle_timeout:
+                break
+            self._remove(session_id)
+            self.evicted += 1
+
+    def open(self, subject_id, session, n_classes):
+        """Return (stream, created) for a subject/session pair, resuming an existing stream"""
+        key = (str(subject_id), str(session))
+        with self._lock:
+            self._evict_idle()
+
+            session_id = self._keys.get(key)
+            if session_id is not None:
+                self._sessions.move_to_end(session_id)
+                return self._sessions[session_id], False
+
+            while len(self._sessions) >= self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+                self.evicted += 1
+
+            stream = StreamSession(uuid.uuid4().hex, key[0], key[1], self.window, n_classes)
+            self._sessions[stream.session_id] = stream
+            self._keys[key] = stream.session_id
+            self.opened += 1
+            return stream, True
+
+    def get(self, session_id):
+        """Return an open stream and mark it active, or None"""
+        with self._lock:
+            self._evict_idle()
+            stream = self._sessions.get(session_id)
+            if stream is not None:
+                stream.last_active = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return stream
+
+    def close(self, session_id):
+        """Close a stream, returning False if it does not exist"""
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+
+    def stats(self):
+        """Return session counts and settings"""
+        with self._lock:
+            self._evict_idle()
+            return {
+                'active_sessions': len(self._sessions),
+                'opened': self.opened,
+                'evicted': self.evicted,
+                'window': self.window,
+                'idle_timeout': self.idle_timeout,
+                'max_sessions': self.max_sessions
+            }
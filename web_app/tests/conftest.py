@@ -0,0 +1,49 @@
+"""Shared setup: import the app from web_app with its files in a scratch directory
+
+Run from the web_app directory with: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+WEB_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WEB_APP_DIR)
+
+# app.py keeps results, jobs and the result store under the working directory
+os.chdir(tempfile.mkdtemp(prefix='emotion-tests-'))
+os.environ.setdefault('FLASK_BULK_PROCESSES', '0')
+os.environ.setdefault('FLASK_MODEL_RELOAD_INTERVAL', '0')
+
+SAMPLE_CSV = os.path.join(WEB_APP_DIR, 'temp', 'ornek.csv')
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def sample_csv():
+    with open(SAMPLE_CSV) as f:
+        return f.read()
+
+
+@pytest.fixture(scope='session')
+def synthetic_rows(app_module):
+    """Feature rows drawn around the model scaler's means, so predictions vary"""
+    n_features = len(app_module.EXPECTED_FEATURES)
+    means, scales = np.zeros(n_features), np.ones(n_features)
+    for step in getattr(app_module.model_registry.current.estimator, 'named_steps', {}).values():
+        if hasattr(step, 'mean_') and len(step.mean_) == n_features:
+            means, scales = step.mean_, step.scale_
+    rng = np.random.default_rng(0)
+    return np.round(rng.standard_normal((200, n_features)) * scales + means, 4)
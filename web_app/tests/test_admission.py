@@ -0,0 +1,34 @@
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from admission import AdmissionController, AdmissionPool
+
+
+def make_controller(max_concurrent=1):
+    pool = AdmissionPool('interactive', max_concurrent, max_queued=0)
+    return AdmissionController(Response('ok'), [pool], lambda environ: 'interactive'), pool
+
+
+def test_slot_is_held_until_the_response_is_closed():
+    controller, pool = make_controller()
+    client = Client(controller)
+
+    first = client.get('/')
+    assert first.status_code == 200
+    assert client.get('/').status_code == 503
+
+    first.close()
+    with client.get('/') as response:
+        assert response.status_code == 200
+    assert pool.idle()
+
+
+def test_sequential_requests_beyond_the_limit(app_module, client, synthetic_rows):
+    limit = app_module.app.config['INTERACTIVE_MAX_CONCURRENT']
+    form = dict(zip(app_module.EXPECTED_FEATURES, map(str, synthetic_rows[0])))
+
+    for _ in range(limit * 3):
+        with client.post('/', data=form) as response:
+            assert response.status_code == 200
+
+    assert app_module.admission_controller.pools['interactive'].idle()
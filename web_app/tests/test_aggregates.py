@@ -0,0 +1,127 @@
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregates import GroupAggregator, aggregate_path, parse_group_by
+from outputs import OutputSweeper
+
+EMOTIONS = ['Negative', 'Neutral', 'Positive']
+
+
+def chunk(emotions, confidence, errors=None):
+    n_rows = len(emotions)
+    errors = errors or [None] * n_rows
+    return {
+        'emotion': np.array(emotions, dtype=object),
+        'confidence': np.array(confidence, dtype=float),
+        'prob_negative': np.full(n_rows, 0.2),
+        'prob_neutral': np.full(n_rows, 0.3),
+        'prob_positive': np.full(n_rows, 0.5),
+        'processing_error': np.array(errors, dtype=object)
+    }
+
+
+def test_groups_file_keeps_the_result_name():
+    assert aggregate_path('temp/a.v1_predictions_20250101_000000_ab12cd34.csv') == \
+        'temp/a.v1_predictions_20250101_000000_ab12cd34_groups.csv'
+    assert aggregate_path('a_predictions_1_2.csv.gz') == 'a_predictions_1_2_groups.csv'
+    assert aggregate_path('a_predictions_1_2.parquet') == 'a_predictions_1_2_groups.csv'
+
+
+def test_dotted_uploads_get_their_own_groups_file(client, sample_csv):
+    filenames = []
+    for name in ('a.v1.csv', 'a.v2.csv'):
+        response = client.post('/upload_csv', data={
+            'csv_file': (io.BytesIO(sample_csv.encode('utf-8')), name),
+            'group_by': 'session'
+        })
+        summary = response.get_json()['summary']
+        response.close()
+        filenames.append(summary['groups']['filename'])
+        assert os.path.exists(os.path.join('temp', summary['groups']['filename']))
+
+    assert filenames[0] != filenames[1]
+    assert filenames[0].startswith('a.v1_predictions_')
+
+
+def test_groups_files_are_swept_with_the_results(client, sample_csv):
+    response = client.post('/upload_csv', data={
+        'csv_file': (io.BytesIO(sample_csv.encode('utf-8')), 'swept.csv'),
+        'group_by': 'session'
+    })
+    summary = response.get_json()['summary']
+    response.close()
+    paths = [os.path.join('temp', summary['output_filename']), os.path.join('temp', summary['groups']['filename'])]
+
+    old = time.time() - 3600
+    for path in paths:
+        os.utime(path, (old, old))
+    OutputSweeper('temp', ttl=60, pattern='*_predictions_*').sweep()
+    assert not any(os.path.exists(path) for path in paths)
+
+
+def test_chunks_add_up_per_group():
+    aggregator = GroupAggregator(['subject_id', 'session'], EMOTIONS)
+    aggregator.add([np.array(['s1', 's1', 's2']), np.array(['1', '1', '1'])],
+                   chunk(['Positive', 'Negative', 'Neutral'], [90, 60, 70]))
+    aggregator.add([np.array(['s1', 's3']), np.array(['1', '1'])],
+                   chunk(['Positive', None], [80, 0], [None, 'bad row']))
+
+    table = aggregator.table()
+    assert list(table['subject_id']) == ['s1', 's2', 's3']
+    s1, s2, s3 = aggregator.records(table)
+
+    assert (s1['rows'], s1['successful_predictions'], s1['errors']) == (3, 3, 0)
+    assert (s1['positive'], s1['negative'], s1['neutral']) == (2, 1, 0)
+    assert s1['positive_pct'] == 66.67 and s1['mean_confidence'] == 76.67
+    assert s1['mean_prob_positive'] == 0.5 and s1['dominant_emotion'] == 'Positive'
+    assert s2['dominant_emotion'] == 'Neutral'
+
+    # A group without a scored row has no statistics
+    assert (s3['rows'], s3['errors']) == (1, 1)
+    assert s3['positive_pct'] is None and s3['mean_confidence'] is None and s3['dominant_emotion'] is None
+
+
+def test_empty_aggregates_keep_their_columns():
+    table = GroupAggregator(['session'], EMOTIONS).table()
+    assert table.empty
+    assert list(table.columns[:4]) == ['session', 'rows', 'successful_predictions', 'errors']
+    assert 'dominant_emotion' in table.columns
+
+
+def test_group_by_lists_are_parsed():
+    assert parse_group_by('subject_id, session,') == ['subject_id', 'session']
+    assert parse_group_by(['session']) == ['session']
+    assert parse_group_by('') is None and parse_group_by(None) is None
+
+
+def test_groups_file_matches_the_scored_rows(client, sample_csv):
+    response = client.post('/upload_csv', data={
+        'csv_file': (io.BytesIO(sample_csv.encode('utf-8')), 'grouped.csv'),
+        'group_by': 'subject_id,session'
+    })
+    summary = response.get_json()['summary']
+    response.close()
+
+    output = pd.read_csv(os.path.join('temp', summary['output_filename']), dtype={'subject_id': str, 'session': str})
+    groups = pd.read_csv(os.path.join('temp', summary['groups']['filename']), dtype={'subject_id': str, 'session': str})
+    expected = output.groupby(['subject_id', 'session']).agg(
+        rows=('emotion', 'size'), mean_confidence=('confidence', 'mean')).reset_index()
+
+    assert summary['groups']['count'] == len(expected)
+    assert list(groups['rows']) == list(expected['rows'])
+    assert np.allclose(groups['mean_confidence'], expected['mean_confidence'].round(2))
+
+
+def test_unknown_group_columns_are_rejected(client, sample_csv):
+    response = client.post('/upload_csv', data={
+        'csv_file': (io.BytesIO(sample_csv.encode('utf-8')), 'ungrouped.csv'),
+        'group_by': 'patient'
+    })
+    payload = response.get_json()
+    response.close()
+    assert response.status_code == 400
+    assert 'patient' in payload['error']
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import PredictionBatcher
+
+
+class BlockingModel:
+    """Scores rows as their own values and holds the first call until released"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, features, context=None):
+        self.calls.append((len(features), context))
+        if len(self.calls) == 1:
+            self.release.wait(5)
+        if context == 'broken':
+            raise ValueError('broken model')
+        return features * 2
+
+
+def run_concurrently(batcher, requests):
+    results = [None] * len(requests)
+
+    def call(i, features, context):
+        try:
+            results[i] = batcher.predict_proba(features, timeout=5, context=context)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i, *request)) for i, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for_queue(batcher, size):
+    deadline = time.monotonic() + 5
+    while batcher._queue.qsize() < size and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_waiting_requests_share_one_call_and_get_their_own_rows():
+    model = BlockingModel()
+    batcher = PredictionBatcher(model, max_batch_size=32, max_wait_ms=1)
+
+    # The first call holds the worker while the others queue up
+    first, _ = run_concurrently(batcher, [(np.ones(3), None)])
+    while not model.calls:
+        time.sleep(0.01)
+    requests = [(np.full(3, i), None) for i in range(5)] + [(np.arange(6.0).reshape(2, 3), None)]
+    threads, results = run_concurrently(batcher, requests)
+    wait_for_queue(batcher, len(requests))
+    model.release.set()
+    for thread in first + threads:
+        thread.join()
+
+    assert [rows for rows, _ in model.calls] == [1, 7]
+    for (features, _), result in zip(requests, results):
+        assert result.shape == features.shape
+        assert np.array_equal(result, features * 2)
+
+    # Batches are recorded after their callers are woken
+    deadline = time.monotonic() + 5
+    while batcher.metrics()['batches'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    metrics = batcher.metrics()
+    assert metrics['batches'] == 2 and metrics['rows'] == 8
+    assert metrics['largest_batch_size'] == 7
+
+
+def test_requests_are_only_batched_within_their_context():
+    model = BlockingModel()
+    batcher = PredictionBatcher(model, max_batch_size=32, max_wait_ms=1)
+
+    first, _ = run_concurrently(batcher, [(np.ones(3), 'old')])
+    while not model.calls:
+        time.sleep(0.01)
+    requests = [(np.ones(3), 'old'), (np.ones(3), 'new'), (np.ones(3), 'old'), (np.ones(3), 'broken')]
+    threads, results = run_concurrently(batcher, requests)
+    wait_for_queue(batcher, len(requests))
+    model.release.set()
+    for thread in first + threads:
+        thread.join()
+
+    assert sorted(model.calls[1:]) == [(1, 'broken'), (1, 'new'), (2, 'old')]
+    assert all(np.array_equal(result, [2, 2, 2]) for result in results[:3])
+
+    # A failed call fails only the requests scored with it
+    assert isinstance(results[3], ValueError)
+
+
+def test_full_batches_do_not_wait():
+    batcher = PredictionBatcher(lambda features: features, max_batch_size=4, max_wait_ms=10000)
+    started = time.perf_counter()
+    assert np.array_equal(batcher.predict_proba(np.ones((4, 3)), timeout=5), np.ones((4, 3)))
+    assert time.perf_counter() - started < 5
+
+    with pytest.raises(TimeoutError):
+        batcher.predict_proba(np.ones(3), timeout=0.05)
@@ -0,0 +1,74 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from compiled_forest import (artifact_name, check_parity, compile_model, load_compiled_artifact, load_or_compile,
+                             save_compiled_artifact)
+
+from conftest import WEB_APP_DIR
+
+
+def fit_forest(random_state):
+    """A forest fitted now, with the settings train.py uses"""
+    rng = np.random.default_rng(random_state)
+    X = rng.normal(size=(2000, 45))
+    y = (X[:, 0] + X[:, 1] / 2 + rng.normal(size=len(X)) > 0).astype(int) + (X[:, 2] > 1)
+    forest = RandomForestClassifier(n_estimators=100, max_depth=20, min_samples_split=5, random_state=random_state)
+    return Pipeline([('scaler', StandardScaler()), ('classifier', forest)]).fit(X, y)
+
+
+@pytest.mark.parametrize('random_state', [1, 2])
+@pytest.mark.parametrize('threshold_dtype', ['float64', 'float32'])
+def test_parity_on_freshly_fitted_forest(random_state, threshold_dtype):
+    model = fit_forest(random_state)
+    assert check_parity(model, compile_model(model, threshold_dtype))
+
+
+def test_parity_on_shipped_model():
+    model = joblib.load(os.path.join(WEB_APP_DIR, 'brain_signals.pkl'))
+    assert check_parity(model, compile_model(model))
+
+
+def test_count_valued_trees_are_normalized():
+    model = fit_forest(0)
+    fractions = compile_model(model).leaf_proba.copy()
+
+    # Trees from scikit-learn before 1.4 store class counts per node
+    for tree in model.named_steps['classifier'].estimators_:
+        tree.tree_.value[:] *= tree.tree_.weighted_n_node_samples[:, np.newaxis, np.newaxis]
+
+    assert np.allclose(compile_model(model).leaf_proba, fractions)
+
+
+def test_artifact_in_place_is_never_replaced(tmp_path):
+    model = fit_forest(0)
+    compiled = compile_model(model)
+    save_compiled_artifact(compiled, str(tmp_path), 'aaaa')
+    mapped = load_compiled_artifact(str(tmp_path), 'aaaa')
+    inode = os.stat(tmp_path / artifact_name('aaaa', 'float64')).st_ino
+
+    # A second process finishing the same artifact leaves the published one alone
+    save_compiled_artifact(compiled, str(tmp_path), 'aaaa')
+    assert os.stat(tmp_path / artifact_name('aaaa', 'float64')).st_ino == inode
+    assert sorted(os.listdir(tmp_path)) == [artifact_name('aaaa', 'float64')]
+
+    # A newer model's artifact replaces it, and existing maps keep working
+    save_compiled_artifact(compiled, str(tmp_path), 'bbbb')
+    assert sorted(os.listdir(tmp_path)) == [artifact_name('bbbb', 'float64')]
+    X = np.random.default_rng(0).normal(size=(10, 45))
+    assert np.array_equal(mapped.predict_proba(X), model.predict_proba(X))
+
+
+def test_artifact_removed_while_loading_is_compiled_again(tmp_path):
+    model = fit_forest(0)
+    save_compiled_artifact(compile_model(model), str(tmp_path), 'aaaa')
+    os.remove(tmp_path / artifact_name('aaaa', 'float64') / 'leaf_proba.npy')
+    assert load_compiled_artifact(str(tmp_path), 'aaaa') is None
+
+    compiled = load_or_compile(model, str(tmp_path), 'aaaa')
+    assert compiled is not None and check_parity(model, compiled)
@@ -0,0 +1,53 @@
+import io
+
+import pandas as pd
+
+
+def test_process_csv_data_scores_every_row(app_module, sample_csv):
+    results, errors, feature_summary, groups = app_module.process_csv_data(sample_csv)
+    expected = pd.read_csv(io.StringIO(sample_csv), dtype=str, keep_default_na=False)
+
+    # Input columns come back as their original text, followed by the results
+    assert list(results.columns) == list(expected.columns) + list(app_module.RESULT_COLUMNS)
+    pd.testing.assert_frame_equal(results[expected.columns], expected)
+    assert feature_summary['available_features'] == len(app_module.EXPECTED_FEATURES)
+    assert groups is None
+    assert len(errors) == (results['processing_error'].notna()).sum()
+
+
+def test_process_csv_data_keeps_text_and_repeated_names(app_module):
+    names = app_module.EXPECTED_FEATURES
+    text = ','.join(['id', 'id'] + names) + '\n' + ','.join(['007', ''] + ['0.1'] * len(names)) + '\n'
+    results, _, _, _ = app_module.process_csv_data(text)
+
+    assert list(results.columns[:3]) == ['id', 'id.1', names[0]]
+    assert results.loc[0, 'id'] == '007' and results.loc[0, 'id.1'] == ''
+    assert results.loc[0, names[0]] == '0.1'
+
+
+def test_process_csv_data_groups(app_module, sample_csv):
+    results, _, _, groups = app_module.process_csv_data(sample_csv, group_by=['session'])
+    assert groups['rows'].sum() == len(results)
+    assert list(groups['session']) == sorted(pd.read_csv(io.StringIO(sample_csv), dtype=str)['session'].unique())
+
+
+def test_process_csv_data_errors_have_the_same_shape(app_module):
+    result = app_module.process_csv_data("a,b\n1,2\n")
+    assert len(result) == 4
+    assert result[0] is None and 'No required features' in result[1]
+
+    result = app_module.process_csv_data("min_q_2_a,b\n1,2\n", group_by=['missing'])
+    assert len(result) == 4
+    assert result[0] is None and 'missing' in result[1]
+
+
+def test_validate_features_uses_the_model_feature_count(app_module, monkeypatch):
+    n_features = len(app_module.EXPECTED_FEATURES)
+    valid, features = app_module.validate_features([0.1] * n_features)
+    assert valid and len(features) == n_features
+
+    monkeypatch.setattr(app_module, 'EXPECTED_FEATURES', app_module.EXPECTED_FEATURES[:10])
+    valid, features = app_module.validate_features([0.1] * 10)
+    assert valid and len(features) == 10
+    valid, message = app_module.validate_features([0.1] * n_features)
+    assert not valid and message == f"Expected 10 features, got {n_features}"
@@ -0,0 +1,126 @@
+import io
+import warnings
+
+import numpy as np
+import pytest
+from scipy.linalg import logm
+
+from eeg_features import QUARTER_PAIRS, FeatureExtractor, parse_feature_name
+
+# One window of two channels: half a is rows 0-7, half b rows 8-15
+HALF_A = [[1, 4], [2, 2], [3, 6], [4, 8], [5, 0], [6, 2], [7, 10], [8, 4]]
+# Uncorrelated, zero-mean channels with variances 8/7 and 32/7
+HALF_B = [[1, 2], [-1, 2], [1, -2], [-1, -2], [1, 2], [-1, 2], [1, -2], [-1, -2]]
+
+# Values worked out by hand from the generator's definitions, not from either implementation
+KNOWN_VALUES = {
+    'mean_0_a': 4.5,
+    'mean_1_b': 0.0,
+    'stddev_0_a': np.sqrt(6.0),
+    'stddev_1_b': np.sqrt(32 / 7),
+    'min_0_b': -1.0,
+    # Mean of the second half of the half-window minus the first
+    'mean_d_0_a': 4.0,
+    'mean_d_1_b': 0.0,
+    # Quarter mean block: q1..q4 of both channels, then q1-q2, q1-q3, ...
+    'mean_d_0_a2': 1.5,
+    'mean_d_1_a2': 3.0,
+    'mean_d_2_a': 3.5,
+    'mean_d_8_a': -2.0,
+    # Quarter minima of channel 1 are 2, 6, 0, 4
+    'min_q_3_a': 6.0,
+    'min_q_13_a': -2.0,
+    'min_q_19_a': -4.0,
+    # Upper triangle of the covariance matrix: c00, c01, c11
+    'covmat_0_a': 6.0,
+    'covmat_1_a': 10 / 7,
+    'covmat_2_a': 78 / 7,
+    'covmat_1_b': 0.0,
+    # The covariance of half b is diagonal, so its logarithm is too
+    'logm_0_b': abs(np.log(8 / 7)),
+    'logm_1_b': 0.0,
+    'logm_2_b': abs(np.log(32 / 7)),
+}
+
+
+def test_known_feature_values():
+    extractor = FeatureExtractor(list(KNOWN_VALUES))
+    assert extractor.n_channels == 2
+    features = extractor.transform(np.array(HALF_A + HALF_B, dtype=float))
+    assert np.allclose(features[0], list(KNOWN_VALUES.values()), rtol=1e-12, atol=1e-12)
+
+
+def reference_features(window, feature_names):
+    """Straightforward per-window implementation with np.cov and scipy's logm"""
+    def quarter_block(quarters, statistic):
+        values = [statistic(q) for q in quarters]
+        return np.hstack(values + [values[i] - values[j] for i, j in QUARTER_PAIRS])
+
+    halves = dict(zip('ab', np.split(window, [window.shape[0] // 2])))
+    vector = []
+    for name in feature_names:
+        family, index, half = parse_feature_name(name)
+        matrix = halves[half]
+        n_samples, n_channels = matrix.shape
+        h1, h2 = np.split(matrix, [int(n_samples / 2)])
+        quarters = np.split(matrix, [int(0.25 * n_samples), int(0.50 * n_samples), int(0.75 * n_samples)])
+
+        if family == 'mean':
+            value = np.mean(matrix, axis=0)[index]
+        elif family == 'stddev':
+            value = np.std(matrix, axis=0, ddof=1)[index]
+        elif family == 'min':
+            value = np.min(matrix, axis=0)[index]
+        elif family == 'mean_d' and index < n_channels:
+            value = (np.mean(h2, axis=0) - np.mean(h1, axis=0))[index]
+        elif family in ('mean_d', 'mean_q'):
+            value = quarter_block(quarters, lambda q: np.mean(q, axis=0))[index]
+        elif family == 'min_q':
+            value = quarter_block(quarters, lambda q: np.min(q, axis=0))[index]
+        else:
+            covariance = np.cov(matrix.T)
+            if family == 'logm':
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    covariance = np.abs(logm(covariance))
+            value = covariance[np.triu_indices(n_channels)][index]
+        vector.append(np.real(value))
+
+    return np.array(vector, dtype=np.float64)
+
+
+def test_vectorized_extraction_matches_per_window_reference(app_module):
+    extractor = FeatureExtractor(app_module.EXPECTED_FEATURES)
+    rng = np.random.default_rng(0)
+
+    # Correlated channels at EEG-like scales keep the covariance well conditioned
+    mixing = rng.normal(size=(extractor.n_channels, extractor.n_channels)) + 3 * np.eye(extractor.n_channels)
+    scales = rng.choice([1.0, 10.0, 100.0], size=(16, 1, 1))
+    windows = rng.normal(size=(16, 256, extractor.n_channels)) @ mixing * scales
+
+    expected = np.array([reference_features(window, extractor.feature_names) for window in windows])
+    assert np.allclose(extractor.transform(windows), expected, rtol=1e-7, atol=1e-9)
+
+
+@pytest.mark.parametrize('name', ['max_0_a', 'mean_1_c', 'min_q_1_a2'])
+def test_unknown_feature_names_are_rejected(name):
+    with pytest.raises(ValueError):
+        FeatureExtractor([name])
+
+
+def test_predict_windows_scores_the_extracted_features(app_module, client):
+    extractor = app_module.feature_extractor
+    windows = np.random.default_rng(1).normal(size=(3, 64, extractor.n_channels)) * 100
+    expected = app_module.model_registry.current.estimator.predict_proba(extractor.transform(windows))
+
+    with client.post('/api/v1/predict_windows', json={'windows': windows.tolist()}) as response:
+        payload = response.get_json()
+        assert response.status_code == 200, payload
+    assert payload['rows'] == 3
+    assert np.allclose(payload['probabilities'], expected, atol=1e-9)
+
+    buffer = io.BytesIO()
+    np.save(buffer, windows)
+    with client.post('/api/v1/predict_windows', data=buffer.getvalue(), content_type='application/x-npy') as response:
+        assert response.status_code == 200
+        assert response.headers['X-Rows'] == '3'
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import time
+
+from jobs import COMPLETED, QUEUED, JobManager, read_job_state, write_job_state
+
+
+def score_nothing(stream, output_path, progress=None):
+    open(output_path, 'w').close()
+    return {'total_rows': 0, 'successful_predictions': 0, 'errors': 0}, [], {}
+
+
+def write_unfinished_job(state_dir, output_dir, job_id, owner=None):
+    os.makedirs(state_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    open(os.path.join(state_dir, f"{job_id}.csv"), 'w').close()
+    state = {'job_id': job_id, 'status': QUEUED, 'output_dir': output_dir,
+             'output_filename': f"{job_id}.csv", 'output_options': {}}
+    if owner is not None:
+        state['owner'] = owner
+    write_job_state(state_dir, state)
+
+
+def make_manager(tmp_path):
+    return JobManager(score_nothing, str(tmp_path / 'jobs'), str(tmp_path / 'out'), max_workers=1)
+
+
+def wait_for(state_dir, job_id, status):
+    deadline = time.monotonic() + 30
+    while read_job_state(state_dir, job_id)['status'] != status:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def recover_in_child(tmp_path, results):
+    results.put(make_manager(tmp_path).ensure_recovered())
+
+
+def test_orphaned_job_is_recovered_once(tmp_path):
+    first = make_manager(tmp_path)
+    write_unfinished_job(first.state_dir, first.output_dir, 'orphan', owner='gone')
+    try:
+        assert first.ensure_recovered() == 1
+        assert first.ensure_recovered() == 0
+
+        # Another process finds the job owned by a live process
+        results = multiprocessing.get_context('spawn').Queue()
+        child = multiprocessing.get_context('spawn').Process(target=recover_in_child, args=(tmp_path, results))
+        child.start()
+        child.join(30)
+        assert results.get(timeout=5) == 0
+
+        wait_for(first.state_dir, 'orphan', COMPLETED)
+    finally:
+        first.shutdown()
+
+
+def test_jobs_of_a_live_process_are_left_alone(tmp_path):
+    owner = make_manager(tmp_path)
+    write_unfinished_job(owner.state_dir, owner.output_dir, 'mine', owner=owner._claim_owner())
+
+    results = multiprocessing.get_context('spawn').Queue()
+    child = multiprocessing.get_context('spawn').Process(target=recover_in_child, args=(tmp_path, results))
+    child.start()
+    child.join(30)
+    assert results.get(timeout=5) == 0
+    assert read_job_state(owner.state_dir, 'mine')['status'] == QUEUED
+
+
+def test_jobs_without_an_owner_are_recovered(tmp_path):
+    manager = make_manager(tmp_path)
+    write_unfinished_job(manager.state_dir, manager.output_dir, 'legacy')
+    try:
+        assert manager.recover() == 1
+        wait_for(manager.state_dir, 'legacy', COMPLETED)
+    finally:
+        manager.shutdown()
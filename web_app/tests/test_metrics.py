@@ -0,0 +1,66 @@
+import os
+
+from metrics import MetricsRegistry
+
+
+def make_registry(directory=None):
+    registry = MetricsRegistry(directory, flush_interval=60)
+    rows = registry.counter('rows_total', 'Rows', ['source'])
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    registry.callback('cache_entries', 'Cache entries', lambda: 7)
+    return registry, rows, latency
+
+
+def parse(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def test_process_local_render():
+    registry, rows, latency = make_registry()
+    rows.inc(3, source='csv')
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    values = parse(registry.render())
+    assert values['rows_total{source="csv"}'] == '3.0'
+    assert values['latency_seconds_bucket{le="0.1"}'] == '1.0'
+    assert values['latency_seconds_bucket{le="+Inf"}'] == '2.0'
+    assert values['latency_seconds_count'] == '2.0'
+    assert values['cache_entries'] == '7.0'
+
+
+def test_processes_sharing_a_directory_are_summed(tmp_path):
+    first, first_rows, first_latency = make_registry(str(tmp_path))
+    second, second_rows, _ = make_registry(str(tmp_path))
+    first_rows.inc(2, source='csv')
+    first_latency.observe(0.5)
+    second_rows.inc(5, source='csv')
+    second_rows.inc(1, source='json')
+    first.flush()
+
+    # Each process adds the others' files to its own live values
+    values = parse(second.render())
+    assert values['rows_total{source="csv"}'] == '7.0'
+    assert values['rows_total{source="json"}'] == '1.0'
+    assert values['latency_seconds_count'] == '1.0'
+    assert values[f'cache_entries{{pid="{os.getpid()}"}}'] == '7.0'
+
+    second.flush()
+    assert parse(first.render())['rows_total{source="csv"}'] == '7.0'
+
+
+def test_forked_process_reports_only_its_own_work(tmp_path):
+    registry, rows, _ = make_registry(str(tmp_path))
+    rows.inc(4, source='csv')
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            rows.inc(10, source='csv')
+            registry.flush()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    # The child's file stays counted after it exits
+    assert parse(registry.render())['rows_total{source="csv"}'] == '14.0'
@@ -0,0 +1,24 @@
+import json
+import os
+import shutil
+
+from model_metadata import LEGACY_FEATURES, metadata_path
+
+from conftest import WEB_APP_DIR
+
+MODEL_PATH = os.path.join(WEB_APP_DIR, 'brain_signals.pkl')
+
+
+def test_legacy_features_match_the_shipped_model():
+    with open(metadata_path(MODEL_PATH)) as f:
+        assert json.load(f)['features'] == LEGACY_FEATURES
+
+
+def test_model_without_metadata_is_served_with_the_legacy_features(app_module, tmp_path):
+    model_path = str(tmp_path / 'old_model.pkl')
+    shutil.copy(MODEL_PATH, model_path)
+
+    assert app_module.load_model_metadata(model_path) == {}
+    version = app_module.load_model_version(model_path)
+    assert version.estimator.n_features_in_ == len(LEGACY_FEATURES)
+    assert app_module.summarize_feature_coverage(LEGACY_FEATURES[:9])['feature_coverage'] == 20.0
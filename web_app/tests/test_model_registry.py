@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import shutil
+import time
+
+import joblib
+import numpy as np
+from sklearn.dummy import DummyClassifier
+
+import compiled_forest
+from model_metadata import metadata_path
+from model_registry import ModelLoadError, ModelRegistry, ModelVersion
+from prediction_cache import file_fingerprint
+
+from conftest import WEB_APP_DIR
+
+MODEL_PATH = os.path.join(WEB_APP_DIR, 'brain_signals.pkl')
+
+
+def compile_in_child(directory, marker_dir):
+    original = compiled_forest.load_compiled_model
+
+    def counting_compile(*args, **kwargs):
+        open(os.path.join(marker_dir, str(os.getpid())), 'w').close()
+        # Keep the compile running long enough for the other processes to queue up
+        time.sleep(0.5)
+        return original(*args, **kwargs)
+
+    compiled_forest.load_compiled_model = counting_compile
+    compiled = compiled_forest.load_or_compile(joblib.load(MODEL_PATH), directory, 'shared')
+    assert compiled is not None
+
+
+def test_processes_reloading_together_compile_once(tmp_path):
+    markers = tmp_path / 'compiled_by'
+    markers.mkdir()
+    context = multiprocessing.get_context('spawn')
+    children = [context.Process(target=compile_in_child, args=(str(tmp_path / 'artifact'), str(markers)))
+                for _ in range(3)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join(120)
+
+    assert [child.exitcode for child in children] == [0, 0, 0]
+    assert len(os.listdir(markers)) == 1
+    assert sorted(os.listdir(tmp_path / 'artifact')) == sorted(
+        [compiled_forest.artifact_name('shared', 'float64'), compiled_forest.COMPILE_LOCK])
+
+
+class FakeLoader:
+    """Loads a model file's text as its version, failing on 'broken'"""
+
+    def __call__(self, path):
+        with open(path) as f:
+            content = f.read()
+        if content == 'broken':
+            raise ModelLoadError('broken model file')
+        return ModelVersion(content, None, path, file_fingerprint(path), {'version': content})
+
+
+def write_model(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_reload_swaps_only_changed_and_loadable_files(tmp_path):
+    path = str(tmp_path / 'model.pkl')
+    write_model(path, 'v1')
+    swaps = []
+    registry = ModelRegistry(FakeLoader(), on_swap=lambda new, old: swaps.append((new.version, old.version)))
+    registry.load(path)
+    first = registry.current
+
+    assert registry.reload() is False
+    assert registry.current is first
+
+    write_model(path, 'broken')
+    assert registry.reload() is False
+    assert registry.current is first
+    assert 'broken model file' in registry.last_error and registry.failed_reloads == 1
+
+    write_model(path, 'v2')
+    assert registry.reload() is True
+    assert registry.current.version == 'v2' and registry.last_error is None
+    assert swaps == [('v2', 'v1')]
+    assert registry.stats()['reloads'] == 1
+
+
+def test_watcher_reloads_a_file_once_it_settles(tmp_path):
+    path = str(tmp_path / 'model.pkl')
+    write_model(path, 'v1')
+    registry = ModelRegistry(FakeLoader(), poll_interval=0.05)
+    registry.load(path)
+    registry.ensure_watching()
+
+    write_model(path, 'v2')
+    deadline = time.monotonic() + 5
+    while registry.current.version != 'v2' and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert registry.current.version == 'v2' and registry.reloads == 1
+
+
+def test_app_keeps_serving_when_a_reloaded_file_is_rejected(app_module, tmp_path):
+    path = str(tmp_path / 'brain_signals.pkl')
+    shutil.copy(MODEL_PATH, path)
+    shutil.copy(metadata_path(MODEL_PATH), metadata_path(path))
+    registry = ModelRegistry(app_module.load_model_version)
+    served = registry.load(path)
+
+    # Same model, different file content, so a new version
+    estimator = joblib.load(path)
+    joblib.dump(estimator, path, protocol=4)
+    assert registry.reload() is True
+    assert registry.current.fingerprint != served.fingerprint
+    served = registry.current
+
+    joblib.dump(DummyClassifier().fit(np.zeros((3, 2)), [0, 1, 2]), path)
+    assert registry.reload() is False
+    assert registry.current is served
+    assert 'takes 2 features' in registry.last_error
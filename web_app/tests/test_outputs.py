@@ -0,0 +1,72 @@
+import os
+import time
+
+from outputs import OutputSweeper
+
+
+def write(directory, name, size, age):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_sweeper_expires_matching_files_by_age(tmp_path):
+    directory = str(tmp_path)
+    write(directory, 'old_predictions_1.csv', 10, age=120)
+    write(directory, 'new_predictions_2.csv', 10, age=10)
+    write(directory, 'running_predictions_3.csv.part', 10, age=120)
+    write(directory, 'ornek.csv', 10, age=120)
+
+    sweeper = OutputSweeper(directory, ttl=60, pattern='*_predictions_*')
+    assert sweeper.sweep() == 2
+    assert sorted(os.listdir(directory)) == ['new_predictions_2.csv', 'ornek.csv']
+    assert sweeper.stats()['removed_bytes'] == 20
+
+
+def test_sweeper_removes_the_oldest_files_over_the_quota(tmp_path):
+    directory = str(tmp_path)
+    for age in (30, 20, 10):
+        write(directory, f'r{age}_predictions.csv', 100, age=age)
+    write(directory, 'r40_predictions.csv.part', 100, age=40)
+
+    # Unfinished files count toward neither the quota nor its evictions
+    sweeper = OutputSweeper(directory, ttl=0, max_bytes=250, pattern='*_predictions*')
+    assert sweeper.sweep() == 1
+    assert sorted(os.listdir(directory)) == ['r10_predictions.csv', 'r20_predictions.csv', 'r40_predictions.csv.part']
+    assert sweeper.stats()['stored_bytes'] == 200
+
+    assert sweeper.sweep() == 0
+
+
+def test_downloads_answer_range_requests(client):
+    os.makedirs('temp', exist_ok=True)
+    with open(os.path.join('temp', 'range_predictions.csv'), 'wb') as f:
+        f.write(b'0123456789' * 10)
+
+    response = client.get('/download/range_predictions.csv', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.data == b'0123456789'
+    assert response.headers['Content-Range'] == 'bytes 10-19/100'
+    response.close()
+
+    response = client.get('/download/range_predictions.csv')
+    assert response.status_code == 200 and len(response.data) == 100
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    etag = response.headers['ETag']
+    response.close()
+
+    response = client.get('/download/range_predictions.csv', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    response.close()
+
+    response = client.get('/download/range_predictions.csv', headers={'Range': 'bytes=200-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */100'
+    response.close()
+
+    response = client.get('/download/missing_predictions.csv')
+    assert response.status_code == 404
+    response.close()
@@ -0,0 +1,108 @@
+import io
+
+import numpy as np
+import pytest
+
+from payloads import (PayloadError, encode_npy, parse_json_payload, parse_json_windows, parse_npy,
+                      parse_npy_windows, parse_raw_buffer, parse_raw_windows, read_npy)
+
+NAMES = ['a', 'b', 'c']
+
+
+def test_json_rows_and_columns_give_the_same_matrix():
+    expected = np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+    for payload in ({'rows': [[1, 2, 3], [4, 5, 6]]},
+                    {'rows': [{'a': 1, 'b': 2, 'c': 3}, {'c': 6, 'b': 5, 'a': 4}]},
+                    {'columns': {'c': [3, 6], 'a': [1, 4], 'b': [2, 5]}}):
+        features, missing = parse_json_payload(payload, NAMES)
+        assert np.array_equal(features, expected) and missing == []
+
+
+def test_missing_json_names_are_zero_and_reported():
+    features, missing = parse_json_payload({'rows': [{'a': 1, 'b': 2}, {'a': 3, 'c': 4}]}, NAMES)
+    assert np.array_equal(features, [[1, 2, 0], [3, 0, 4]])
+    assert missing == ['b', 'c']
+
+    features, missing = parse_json_payload({'columns': {'b': [7]}}, NAMES)
+    assert np.array_equal(features, [[0, 7, 0]]) and missing == ['a', 'c']
+
+
+@pytest.mark.parametrize('payload', [
+    [[1, 2, 3]],
+    {'values': [[1, 2, 3]]},
+    {'rows': {'a': 1}},
+    {'rows': [[1, 2]]},
+    {'columns': [1, 2, 3]},
+    {'columns': {'a': [1, 2], 'b': [1]}},
+])
+def test_malformed_json_is_rejected(payload):
+    with pytest.raises(PayloadError):
+        parse_json_payload(payload, NAMES)
+
+
+def test_raw_buffers_are_viewed_without_copying():
+    data = np.arange(6, dtype='<f4').tobytes()
+    features = parse_raw_buffer(data, 'float32', 3)
+    assert features.shape == (2, 3) and features.dtype == np.float32
+    assert np.array_equal(features, [[0, 1, 2], [3, 4, 5]])
+    assert not features.flags.owndata
+
+    with pytest.raises(PayloadError):
+        parse_raw_buffer(data, 'int32', 3)
+    with pytest.raises(PayloadError):
+        parse_raw_buffer(data[:-4], 'float32', 3)
+
+
+def test_npy_payloads_keep_their_layout():
+    array = np.asfortranarray(np.arange(6, dtype=np.float64).reshape(2, 3))
+    assert np.array_equal(parse_npy(encode_npy(array), 3), array)
+    assert np.array_equal(read_npy(encode_npy(array.astype(np.float32))), array)
+
+    with pytest.raises(PayloadError):
+        parse_npy(encode_npy(array), 4)
+    with pytest.raises(PayloadError):
+        read_npy(encode_npy(array.astype(np.int64)))
+    with pytest.raises(PayloadError):
+        read_npy(encode_npy(array)[:-8])
+    with pytest.raises(PayloadError):
+        read_npy(b'not an npy file')
+
+
+def test_object_arrays_are_never_unpickled():
+    buffer = io.BytesIO()
+    np.save(buffer, np.array([{'a': 1}], dtype=object), allow_pickle=True)
+    with pytest.raises(PayloadError):
+        read_npy(buffer.getvalue())
+
+
+def test_window_parsers_return_three_dimensional_arrays():
+    window = np.arange(8.0).reshape(4, 2)
+    assert parse_json_windows({'windows': window.tolist()}).shape == (1, 4, 2)
+    assert parse_npy_windows(encode_npy(np.stack([window, window]))).shape == (2, 4, 2)
+    assert np.array_equal(parse_raw_windows(np.stack([window] * 3).tobytes(), 'float64', 4, 2)[2], window)
+
+    with pytest.raises(PayloadError):
+        parse_json_windows({'rows': []})
+    with pytest.raises(PayloadError):
+        parse_raw_windows(window.tobytes(), 'float64', 0, 2)
+
+
+def test_bulk_formats_agree(client, synthetic_rows):
+    features = synthetic_rows[:5]
+    response = client.post('/api/v1/predict', json={'rows': features.tolist()})
+    expected = response.get_json()
+    response.close()
+    assert response.status_code == 200, expected
+
+    for content_type, body, query in (('application/octet-stream', features.astype('<f4').tobytes(), '?dtype=float32'),
+                                      ('application/x-npy', encode_npy(features), '')):
+        response = client.post('/api/v1/predict' + query, data=body, content_type=content_type)
+        assert response.status_code == 200
+        assert response.headers['X-Rows'] == '5'
+        if content_type == 'application/x-npy':
+            results = read_npy(response.data)
+        else:
+            results = np.frombuffer(response.data, dtype='<f4').reshape(5, -1)
+        response.close()
+        assert results[:, 0].tolist() == expected['predictions']
+        assert np.allclose(results[:, 1:], expected['probabilities'], atol=1e-4)
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pytest
+
+import prediction_cache
+from prediction_cache import PredictionCache, dedupe_rows
+
+
+def filled(policy, max_size=2):
+    cache = PredictionCache(max_size=max_size, ttl_seconds=60, policy=policy)
+    cache.put('a', [1.0])
+    cache.put('b', [2.0])
+    cache.get('a')
+    cache.put('c', [3.0])
+    return cache
+
+
+def test_lru_evicts_the_least_recently_read_entry():
+    cache = filled('lru')
+    assert cache.get('b') is None
+    assert cache.get('a')[0] == 1.0 and cache.get('c')[0] == 3.0
+    assert cache.stats()['evictions'] == 1
+
+
+def test_fifo_evicts_the_oldest_entry_even_when_read():
+    cache = filled('fifo')
+    assert cache.get('a') is None
+    assert cache.get('b')[0] == 2.0 and cache.get('c')[0] == 3.0
+
+
+def test_entries_expire_after_the_ttl():
+    cache = PredictionCache(max_size=10, ttl_seconds=0.2)
+    cache.put('key', [0.2, 0.8])
+    assert cache.get('key') is not None
+
+    time.sleep(0.25)
+    assert cache.get('key') is None
+    assert cache.stats()['expirations'] == 1 and cache.stats()['size'] == 0
+
+
+def test_keys_separate_models_but_not_signed_zeros():
+    vector = np.array([0.0, 1.5, -2.0])
+    key = PredictionCache.make_key('model-a', vector)
+    assert key == PredictionCache.make_key('model-a', np.array([-0.0, 1.5, -2.0]))
+    assert key == PredictionCache.make_key('model-a', [0, 1.5, -2])
+    assert key != PredictionCache.make_key('model-b', vector)
+
+
+def test_cached_values_are_read_only_copies():
+    cache = PredictionCache(max_size=10)
+    value = np.array([0.1, 0.9])
+    cache.put('key', value)
+    value[0] = 1.0
+
+    cached = cache.get('key')
+    assert cached[0] == 0.1
+    with pytest.raises(ValueError):
+        cached[0] = 0.5
+
+
+def test_zero_size_disables_the_cache():
+    cache = PredictionCache(max_size=0)
+    cache.put('key', [1.0])
+    assert cache.get('key') is None
+    assert cache.stats()['enabled'] is False and cache.stats()['misses'] == 0
+
+    with pytest.raises(ValueError):
+        PredictionCache(policy='random')
+
+
+def test_dedupe_rows_maps_every_row_to_its_unique_row():
+    features = np.array([[1.0, 2.0], [3.0, 4.0], [1.0, 2.0], [-0.0, 5.0], [0.0, 5.0]])
+    unique_rows, inverse = dedupe_rows(features)
+    assert np.array_equal(unique_rows, [[1.0, 2.0], [3.0, 4.0], [0.0, 5.0]])
+    assert list(inverse) == [0, 1, 0, 2, 2]
+    assert np.array_equal(unique_rows[inverse], features)
+
+    assert dedupe_rows(np.arange(6.0).reshape(3, 2)) is None
+    assert dedupe_rows(np.ones((1, 2))) is None
+
+
+def test_dedupe_rows_gives_up_on_hash_collisions(monkeypatch):
+    # With every multiplier zero all rows hash alike, so only the exact check separates them
+    monkeypatch.setattr(prediction_cache, '_ROW_HASH_MULTIPLIERS', np.zeros(256, dtype=np.uint64))
+    assert dedupe_rows(np.array([[1.0, 2.0], [3.0, 4.0], [1.0, 2.0]])) is None
@@ -0,0 +1,27 @@
+import io
+
+import pytest
+
+
+@pytest.fixture
+def small_limits(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_MAX_CONTENT_LENGTH', 1024 * 1024)
+
+
+@pytest.mark.parametrize('path', ['/predict', '/api/v1/predict'])
+def test_in_memory_bodies_keep_the_small_limit(client, small_limits, path):
+    body = b'{"features": [' + b'0.1, ' * 1000 + b'0.1]}'
+    with client.post(path, data=body, content_type='application/json') as response:
+        assert response.status_code == 413
+
+
+def test_uploads_get_the_upload_limit(client, small_limits, sample_csv):
+    assert len(sample_csv) > 1024
+    data = {'csv_file': (io.BytesIO(sample_csv.encode('utf-8')), 'limits.csv')}
+    with client.post('/upload_csv', data=data) as response:
+        assert response.status_code == 200
+
+    data = {'csv_file': (io.BytesIO(b'x' * 2 * 1024 * 1024), 'limits.csv')}
+    with client.post('/upload_csv', data=data) as response:
+        assert response.status_code == 413
@@ -0,0 +1,84 @@
+import io
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from result_store import CHUNK_SUFFIX, ResultStore
+
+
+def upload(client, text, filename='rows.csv'):
+    response = client.post('/upload_csv', data={'csv_file': (io.BytesIO(text.encode('utf-8')), filename)})
+    payload = response.get_json()
+    response.close()
+    assert response.status_code == 200, payload
+    return payload['summary']
+
+
+def expected_emotions(app_module, text):
+    frame = pd.read_csv(io.StringIO(text))
+    model = app_module.model_registry.current.estimator
+    best = model.predict_proba(frame[app_module.EXPECTED_FEATURES].to_numpy(dtype=float)).argmax(axis=1)
+    return [app_module.map_prediction_to_emotion(model.classes_[i]) for i in best]
+
+
+def to_csv(names, rows):
+    return ','.join(names) + '\n' + '\n'.join(','.join(map(str, row)) for row in rows.tolist()) + '\n'
+
+
+def test_reordered_header_does_not_reuse_chunks(app_module, client, synthetic_rows):
+    # The same data lines under two headers give every value a different feature
+    names = list(app_module.EXPECTED_FEATURES)
+    original = to_csv(names, synthetic_rows)
+    reordered = to_csv(names[::-1], synthetic_rows)
+    assert expected_emotions(app_module, original) != expected_emotions(app_module, reordered)
+
+    first = upload(client, original)
+    second = upload(client, reordered)
+    assert second['cache_status'] == 'miss'
+
+    for summary, text in ((first, original), (second, reordered)):
+        output = pd.read_csv(os.path.join('temp', summary['output_filename']))
+        assert list(output['emotion']) == expected_emotions(app_module, text)
+
+
+def test_repeated_upload_is_answered_from_the_store(client, sample_csv):
+    first = upload(client, sample_csv, 'again.csv')
+    second = upload(client, sample_csv, 'again.csv')
+    assert second['cache_status'] == 'hit'
+    assert second['successful_predictions'] == first['successful_predictions']
+    assert np.isclose(second['success_rate'], first['success_rate'])
+
+
+def test_chunks_round_trip_without_pickle(app_module, synthetic_rows, tmp_path):
+    features = synthetic_rows[:20].copy()
+    features[3, 0] = np.nan
+    results, errors = app_module.score_feature_matrix(features, np.zeros(len(features), dtype=int))
+    results['processed_at'] = '2025-01-01 00:00:00'
+
+    store = ResultStore(str(tmp_path))
+    store.put_chunk('key', results, errors)
+    stored, stored_errors = store.get_chunk('key')
+
+    assert stored_errors == errors and list(stored) == list(results)
+    assert stored['processed_at'] == results['processed_at']
+    for name, values in results.items():
+        if name != 'processed_at':
+            assert stored[name].dtype == values.dtype
+            assert list(stored[name]) == list(values)
+
+
+def test_planted_pickle_is_never_loaded(tmp_path):
+    marker = tmp_path / 'ran'
+
+    class Exploit:
+        def __reduce__(self):
+            return (open, (str(marker), 'w'))
+
+    store = ResultStore(str(tmp_path))
+    with open(store._path('key', CHUNK_SUFFIX), 'wb') as f:
+        pickle.dump(Exploit(), f)
+
+    assert store.get_chunk('key') is None
+    assert not marker.exists()
@@ -0,0 +1,98 @@
+import time
+
+import numpy as np
+
+from streaming import SessionManager, StreamSession
+
+
+def test_rolling_average_covers_the_last_window_frames():
+    stream = StreamSession('id', 'subject', 'session', window=3, n_classes=2)
+    frames = np.array([[1, 0], [0, 1], [1, 0], [0, 1], [0, 1]], dtype=float)
+
+    # Pushed one at a time and all at once, the averages must agree
+    first, smoothed = stream.add(frames[:2])
+    assert first == 0
+    _, rest = stream.add(frames[2:])
+    expected = [[1, 0], [0.5, 0.5], [2 / 3, 1 / 3], [1 / 3, 2 / 3], [1 / 3, 2 / 3]]
+    assert np.allclose(np.concatenate([smoothed, rest]), expected)
+    assert np.allclose(stream.smoothed(), expected[-1])
+
+    # Only the last `window` frames are kept for listeners
+    buffered = stream.frames_since(-1)
+    assert [sequence for sequence, _, _ in buffered] == [2, 3, 4]
+    assert np.allclose([probabilities for _, probabilities, _ in buffered], frames[2:])
+    assert stream.frames_since(3)[0][0] == 4
+
+
+def test_sessions_resume_per_subject_and_session():
+    manager = SessionManager(window=4)
+    stream, created = manager.open('s1', 'a', n_classes=3)
+    again, created_again = manager.open('s1', 'a', n_classes=3)
+    other, _ = manager.open('s1', 'b', n_classes=3)
+
+    assert created and not created_again
+    assert again is stream and other is not stream
+    assert manager.get(stream.session_id) is stream
+
+    assert manager.close(stream.session_id)
+    assert stream.closed
+    assert manager.get(stream.session_id) is None
+    assert not manager.close(stream.session_id)
+
+
+def test_idle_and_surplus_sessions_are_evicted():
+    manager = SessionManager(window=4, idle_timeout=60, max_sessions=2)
+    first, _ = manager.open('s1', '', n_classes=3)
+    second, _ = manager.open('s2', '', n_classes=3)
+    manager.get(first.session_id)
+
+    # The least recently active session makes room
+    third, _ = manager.open('s3', '', n_classes=3)
+    assert manager.get(second.session_id) is None and second.closed
+    assert manager.get(first.session_id) is first
+
+    for stream in (first, third):
+        stream.last_active = time.monotonic() - 61
+    assert manager.get(third.session_id) is None and third.closed
+    assert manager.stats()['active_sessions'] == 0
+    assert manager.stats()['evicted'] == 3
+
+
+def call(client, method, path, **kwargs):
+    # Close each response so the admission slot it holds is released
+    response = client.open(path, method=method, **kwargs)
+    payload = response.get_json()
+    response.close()
+    return response.status_code, payload
+
+
+def test_session_endpoints(client, synthetic_rows):
+    status, opened = call(client, 'POST', '/stream/sessions', json={'subject_id': 'endpoint', 'session': '1'})
+    assert status == 201
+    session_id = opened['session_id']
+    assert call(client, 'POST', '/stream/sessions', json={'subject_id': 'endpoint', 'session': '1'})[0] == 200
+
+    frames_path = f'/stream/sessions/{session_id}/frames'
+    status, first = call(client, 'POST', frames_path, json={'rows': synthetic_rows[:1].tolist()})
+    assert status == 200, first
+    assert first['first_sequence'] == 0
+    assert np.allclose(first['smoothed_probabilities'], first['probabilities'], atol=1e-5)
+
+    status, second = call(client, 'POST', frames_path, json={'rows': synthetic_rows[1:3].tolist()})
+    assert second['first_sequence'] == 1 and second['frames'] == 3
+    probabilities = np.array(first['probabilities'] + second['probabilities'])
+    assert np.allclose(second['smoothed_probabilities'][-1], probabilities.mean(axis=0), atol=1e-5)
+
+    assert call(client, 'GET', f'/stream/sessions/{session_id}')[1]['frames'] == 3
+    assert call(client, 'DELETE', f'/stream/sessions/{session_id}')[0] == 200
+    assert call(client, 'GET', f'/stream/sessions/{session_id}')[0] == 404
+    assert call(client, 'POST', frames_path, json={'rows': synthetic_rows[:1].tolist()})[0] == 404
+
+
+def test_streaming_is_refused_with_several_workers(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAMING_ENABLED', False)
+    status, payload = call(client, 'POST', '/stream/sessions', json={'subject_id': 'many-workers'})
+    assert status == 503
+    assert 'single server worker' in payload['error']
+    assert call(client, 'GET', '/stream/sessions/unknown/events')[0] == 503
+    assert call(client, 'GET', '/health')[1]['streaming']['enabled'] is False
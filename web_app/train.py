@@ -0,0 +1,375 @@
+"""Train the emotion model and its feature list from a labelled feature export
+
+Runs the steps of main.ipynb as a graph of cached stages:
+
+    dataset -> f_scores, mutual_info, rf_importance -> ranking -> cv_sweep
+    dataset, ranking -> model
+    dataset -> correlated_pairs
+
+Each stage's output is saved under --cache-dir with a key built from the
+dataset hash, the stage's parameters and the keys of the stages it reads,
+so a rerun on the same data only computes the stages whose inputs changed.
+The CV sweep scores each feature count in its own process, and highly
+correlated feature pairs are found block by block without building the
+full correlation matrix.
+
+The model is written with its metadata (feature order, classes, CV and
+test scores) next to it; the app reads its feature list from there.
+
+    python train.py --data ../emotions.csv
+    python train.py --data ../emotions.csv --features auto --output /tmp/brain_signals.pkl
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_selection import f_classif, mutual_info_classif
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+from sklearn.model_selection import cross_val_score, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import LabelEncoder, MinMaxScaler, StandardScaler
+
+from csv_ingest import DEFAULT_ENGINE
+from model_metadata import write_model_metadata
+from result_store import hash_stream, make_key
+
+logger = logging.getLogger(__name__)
+
+WEB_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Feature counts compared by cross-validation, as in main.ipynb
+SWEEP_FEATURE_COUNTS = [10, 20, 30, 36, 45, 60]
+
+# Settings of the served model, as in main.ipynb
+MODEL_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 20,
+    'min_samples_split': 5
+}
+
+# Columns per block of the correlation scan; memory is rows x 2 blocks
+CORRELATION_BLOCK_SIZE = 256
+
+
+class StageGraph:
+    """Run named stages in dependency order, caching each output on disk
+
+    A stage's key covers the dataset hash, its params and the keys of its
+    inputs, so changing a parameter recomputes that stage and everything
+    downstream of it. options are passed to the stage without being part
+    of the key, for settings like worker counts that do not change results.
+    """
+
+    def __init__(self, cache_dir, dataset_hash, refresh=()):
+        self.cache_dir = os.path.join(cache_dir, dataset_hash)
+        self.dataset_hash = dataset_hash
+        self.refresh = set(refresh)
+        self.stages = {}
+        self.timings = {}
+        self._keys = {}
+        self._values = {}
+
+    def add(self, name, func, inputs=(), params=None, options=None):
+        self.stages[name] = (func, list(inputs), params or {}, options or {})
+
+    def key(self, name):
+        if name not in self._keys:
+            _, inputs, params, _ = self.stages[name]
+            self._keys[name] = make_key(
+                self.dataset_hash, name, json.dumps(params, sort_keys=True), *[self.key(dep) for dep in inputs]
+            )
+        return self._keys[name]
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, f"{name}-{self.key(name)[:16]}.joblib")
+
+    def get(self, name):
+        """Return a stage's output, loading it from the cache or computing it"""
+        if name in self._values:
+            return self._values[name]
+
+        func, inputs, params, options = self.stages[name]
+        path = self.path(name)
+        if name not in self.refresh and os.path.exists(path):
+            start = time.perf_counter()
+            value = joblib.load(path)
+            self.timings[name] = {'seconds': round(time.perf_counter() - start, 3), 'cached': True}
+            logger.info("%s: loaded from cache", name)
+        else:
+            values = [self.get(dep) for dep in inputs]
+            start = time.perf_counter()
+            value = func(*values, **params, **options)
+            self.timings[name] = {'seconds': round(time.perf_counter() - start, 3), 'cached': False}
+            logger.info("%s: computed in %.1fs", name, self.timings[name]['seconds'])
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            joblib.dump(value, tmp_path)
+            os.replace(tmp_path, path)
+
+        self._values[name] = value
+        return value
+
+
+def load_dataset(data_path, label_column):
+    """Read the export into a feature matrix and encoded labels"""
+    frame = pd.read_csv(data_path, engine=DEFAULT_ENGINE)
+    if label_column not in frame.columns:
+        raise ValueError(f"Label column '{label_column}' not found in {data_path}")
+
+    encoder = LabelEncoder()
+    labels = encoder.fit_transform(frame[label_column])
+    features = frame.drop(columns=[label_column])
+    return {
+        'X': features.to_numpy(dtype=np.float64),
+        'y': labels,
+        'feature_names': [str(name) for name in features.columns],
+        'classes': [str(label) for label in encoder.classes_]
+    }
+
+
+def compute_f_scores(dataset):
+    return f_classif(dataset['X'], dataset['y'])[0]
+
+
+def compute_mutual_info(dataset, random_state, jobs=None):
+    return mutual_info_classif(dataset['X'], dataset['y'], random_state=random_state, n_jobs=jobs)
+
+
+def compute_rf_importance(dataset, n_estimators, random_state, jobs=None):
+    forest = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state, n_jobs=jobs)
+    forest.fit(dataset['X'], dataset['y'])
+    return forest.feature_importances_
+
+
+def find_correlated_pairs(dataset, threshold, block_size=CORRELATION_BLOCK_SIZE):
+    """Return (feature, other_feature, |r|) for pairs correlated above threshold
+
+    Columns are standardized one block at a time and only the upper
+    triangle of blocks is multiplied, so the full feature x feature matrix
+    never exists. Constant columns correlate with nothing, as in pandas.
+    Pairs come in the order main.ipynb printed them.
+    """
+    X = dataset['X']
+    n_rows, n_columns = X.shape
+    means = X.mean(axis=0)
+    stds = X.std(axis=0)
+    stds[stds == 0] = np.inf
+
+    def standardized(start):
+        return (X[:, start:start + block_size] - means[start:start + block_size]) / stds[start:start + block_size]
+
+    pairs = []
+    for i_start in range(0, n_columns, block_size):
+        block_i = standardized(i_start)
+        for j_start in range(i_start, n_columns, block_size):
+            block_j = block_i if j_start == i_start else standardized(j_start)
+            correlations = np.abs(block_i.T @ block_j) / n_rows
+            rows, cols = np.nonzero(correlations > threshold)
+            for i, j in zip(rows + i_start, cols + j_start):
+                if i < j:
+                    pairs.append((int(j), int(i), float(correlations[i - i_start, j - j_start])))
+
+    names = dataset['feature_names']
+    return [(names[j], names[i], value) for j, i, value in sorted(pairs)]
+
+
+def rank_features(dataset, f_scores, mi_scores, rf_importance):
+    """Order features by the mean of their min-max normalized scores"""
+    normalized = [
+        MinMaxScaler().fit_transform(np.asarray(scores, dtype=np.float64).reshape(-1, 1)).ravel()
+        for scores in (f_scores, mi_scores, rf_importance)
+    ]
+    combined = sum(normalized) / len(normalized)
+
+    # Highest first, ties keep column order; features without a score go last
+    order = np.argsort(-np.nan_to_num(combined, nan=-np.inf), kind='stable')
+    return {
+        'features': [dataset['feature_names'][i] for i in order],
+        'scores': [float(combined[i]) for i in order]
+    }
+
+
+_worker_data = {}
+
+
+def _init_sweep_worker(X, y):
+    _worker_data['X'] = X
+    _worker_data['y'] = y
+
+
+def _score_feature_count(positions, folds, random_state):
+    X = _worker_data['X'][:, positions]
+    forest = RandomForestClassifier(random_state=random_state)
+    return cross_val_score(forest, X, _worker_data['y'], cv=folds)
+
+
+def run_cv_sweep(dataset, ranking, feature_counts, folds, random_state, jobs=None):
+    """Cross-validate a forest on the top k ranked features for each k, one process per k"""
+    column_positions = {name: i for i, name in enumerate(dataset['feature_names'])}
+    feature_counts = [k for k in feature_counts if k <= len(ranking['features'])]
+    results = {}
+
+    # The data is sent to each worker once, not with every task
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_sweep_worker,
+                             initargs=(dataset['X'], dataset['y'])) as executor:
+        futures = {
+            k: executor.submit(
+                _score_feature_count, [column_positions[name] for name in ranking['features'][:k]],
+                folds, random_state
+            )
+            for k in feature_counts
+        }
+        for k, future in futures.items():
+            scores = future.result()
+            results[k] = {'mean': float(scores.mean()), 'std': float(scores.std()), 'folds': scores.tolist()}
+            logger.info("%d features: %.4f +/- %.4f", k, scores.mean(), scores.std())
+    return results
+
+
+def fit_model(dataset, ranking, n_features, test_size, random_state, model_params, jobs=None):
+    """Fit the served pipeline on the top features and score it on a held-out split"""
+    features = ranking['features'][:n_features]
+    column_positions = {name: i for i, name in enumerate(dataset['feature_names'])}
+    X = dataset['X'][:, [column_positions[name] for name in features]]
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, dataset['y'], test_size=test_size, random_state=random_state, stratify=dataset['y']
+    )
+
+    pipeline = Pipeline(steps=[
+        ('scaler', StandardScaler()),
+        ('classifier', RandomForestClassifier(random_state=random_state, n_jobs=-1, **model_params))
+    ])
+    pipeline.fit(X_train, y_train)
+
+    predictions = pipeline.predict(X_test)
+    probabilities = pipeline.predict_proba(X_test)
+    evaluation = {
+        'accuracy': accuracy_score(y_test, predictions),
+        'precision_macro': precision_score(y_test, predictions, average='macro'),
+        'recall_macro': recall_score(y_test, predictions, average='macro'),
+        'f1_macro': f1_score(y_test, predictions, average='macro'),
+        'train_rows': len(y_train),
+        'test_rows': len(y_test)
+    }
+    if len(pipeline.classes_) > 2:
+        evaluation['roc_auc_ovr'] = roc_auc_score(y_test, probabilities, multi_class='ovr')
+    return {
+        'model': pipeline,
+        'features': features,
+        'evaluation': {name: float(value) if isinstance(value, float) else value for name, value in evaluation.items()}
+    }
+
+
+def build_graph(args, dataset_hash):
+    graph = StageGraph(args.cache_dir, dataset_hash, refresh=args.refresh)
+    graph.add('dataset', load_dataset, params={'label_column': args.label},
+              options={'data_path': args.data})
+    graph.add('f_scores', compute_f_scores, ['dataset'])
+    graph.add('mutual_info', compute_mutual_info, ['dataset'],
+              params={'random_state': args.seed}, options={'jobs': args.jobs})
+    graph.add('rf_importance', compute_rf_importance, ['dataset'],
+              params={'n_estimators': MODEL_PARAMS['n_estimators'], 'random_state': args.seed},
+              options={'jobs': args.jobs})
+    graph.add('correlated_pairs', find_correlated_pairs, ['dataset'],
+              params={'threshold': args.correlation_threshold})
+    graph.add('ranking', rank_features, ['dataset', 'f_scores', 'mutual_info', 'rf_importance'])
+    graph.add('cv_sweep', run_cv_sweep, ['dataset', 'ranking'],
+              params={'feature_counts': args.sweep, 'folds': args.folds, 'random_state': args.seed},
+              options={'jobs': args.jobs})
+    return graph
+
+
+def choose_feature_count(requested, sweep):
+    """Return the requested feature count, or the best cross-validated one for 'auto'"""
+    if requested != 'auto':
+        return int(requested)
+    if not sweep:
+        raise ValueError("--features auto needs at least one swept feature count")
+    return max(sweep, key=lambda k: (sweep[k]['mean'], -k))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', required=True, help='labelled feature export (emotions.csv)')
+    parser.add_argument('--label', default='label', help='name of the label column')
+    parser.add_argument('--output', default=os.path.join(WEB_APP_DIR, 'brain_signals.pkl'),
+                        help='model file to write; metadata goes next to it as .json')
+    parser.add_argument('--features', default='45', help="number of ranked features to keep, or 'auto'")
+    parser.add_argument('--sweep', type=int, nargs='*', default=SWEEP_FEATURE_COUNTS,
+                        help='feature counts compared by cross-validation')
+    parser.add_argument('--folds', type=int, default=5, help='cross-validation folds')
+    parser.add_argument('--test-size', type=float, default=0.2, help='held-out fraction for the final scores')
+    parser.add_argument('--seed', type=int, default=42, help='random state for every stage')
+    parser.add_argument('--correlation-threshold', type=float, default=0.95, help='|r| above which pairs are reported')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes and threads')
+    parser.add_argument('--cache-dir', default=os.path.join(os.getcwd(), 'temp', 'train_cache'),
+                        help='where stage outputs are cached')
+    parser.add_argument('--refresh', nargs='*', default=[], help='stages to recompute even when cached')
+    args = parser.parse_args()
+    if args.features != 'auto' and not args.features.isdigit():
+        parser.error("--features must be a number or 'auto'")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    start = time.perf_counter()
+
+    with open(args.data, 'rb') as f:
+        dataset_hash = hash_stream(f)
+    logger.info("Dataset %s: sha256 %s", args.data, dataset_hash)
+
+    graph = build_graph(args, dataset_hash)
+    sweep = graph.get('cv_sweep')
+    n_features = choose_feature_count(args.features, sweep)
+    graph.add('model', fit_model, ['dataset', 'ranking'],
+              params={'n_features': n_features, 'test_size': args.test_size,
+                      'random_state': args.seed, 'model_params': MODEL_PARAMS})
+    fitted = graph.get('model')
+    correlated_pairs = graph.get('correlated_pairs')
+    dataset = graph.get('dataset')
+
+    # The app reports the version with every prediction
+    trained_at = datetime.now()
+    metadata = {
+        'features': fitted['features'],
+        'classes': dataset['classes'],
+        'model_file': os.path.basename(args.output),
+        'version': trained_at.strftime('%Y%m%d-%H%M%S'),
+        'trained_at': trained_at.isoformat(),
+        'dataset': {
+            'path': os.path.abspath(args.data),
+            'sha256': dataset_hash,
+            'rows': int(dataset['X'].shape[0]),
+            'columns': int(dataset['X'].shape[1])
+        },
+        'params': dict(MODEL_PARAMS, n_features=n_features, folds=args.folds,
+                       test_size=args.test_size, random_state=args.seed),
+        'cv_sweep': {str(k): {'mean': round(v['mean'], 6), 'std': round(v['std'], 6)} for k, v in sweep.items()},
+        'evaluation': fitted['evaluation'],
+        'correlated_pairs': len(correlated_pairs),
+        'stages': graph.timings
+    }
+
+    # Written next to the target first, so a running app never loads half a file,
+    # and moved into place after the metadata, so it never loads it with old metadata
+    tmp_path = f"{args.output}.{os.getpid()}.tmp"
+    joblib.dump(fitted['model'], tmp_path)
+    metadata_file = write_model_metadata(args.output, metadata)
+    os.replace(tmp_path, args.output)
+
+    logger.info("Wrote %s and %s (%d features, test accuracy %.4f) in %.1fs",
+                args.output, metadata_file, n_features, fitted['evaluation']['accuracy'],
+                time.perf_counter() - start)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())